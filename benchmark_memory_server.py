@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+"""
+Benchmark the V2 memory server against a seeded Qdrant
+Synthetic memories + deterministic fake embedder: no OpenAI calls, reproducible runs
+"""
+
+import argparse
+import asyncio
+import functools
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import resource
+import shutil
+import sys
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+os.environ.setdefault("SLOW_CALL_MS", "inf")  # Don't log span trees for every call under load
+os.environ.setdefault("MEMORY_WARMUP", "false")
+
+import httpx
+import numpy as np
+
+import memory_engine
+from memory_engine import EMBEDDING_DIMENSION, METRICS, QDRANT_TIMEOUT, models
+from qdrant_memory_mcp_server_v2 import ROLE_COLLECTIONS, MemoryServer
+
+logger = logging.getLogger(__name__)
+
+# Vocabulary per role; titles, queries and tags are drawn from these so that
+# fake embeddings of related texts end up close to each other
+ROLE_TOPICS = {
+    "universal": ["debugging", "logging", "testing", "refactoring", "documentation", "naming", "review", "estimation"],
+    "backend": ["database", "cache", "queue", "api", "transaction", "index", "migration", "connection-pool"],
+    "frontend": ["rendering", "state", "css", "bundle", "hydration", "accessibility", "forms", "routing"],
+    "quant": ["backtest", "slippage", "volatility", "portfolio", "signal", "execution", "risk", "factor"],
+    "devops": ["deployment", "kubernetes", "terraform", "monitoring", "alerting", "rollback", "secrets", "scaling"],
+    "ml": ["training", "embedding", "overfitting", "dataset", "inference", "tokenizer", "evaluation", "gradient"],
+    "security": ["authentication", "injection", "encryption", "permissions", "audit", "tokens", "csrf", "sandbox"],
+    "mobile": ["offline", "battery", "push", "navigation", "startup", "permissions", "images", "crash"],
+}
+ASPECTS = ["timeout", "retry", "memory-leak", "race-condition", "latency", "configuration", "upgrade",
+           "failure", "bottleneck", "regression", "edge-case", "limit"]
+OUTCOMES = ["success", "failure", "workaround", "lesson"]
+MEMORY_TYPES = ["episodic", "procedural", "semantic"]
+FILLER = [
+    "The first attempt looked correct locally but broke under production load.",
+    "Reproducing it required a minimal script and a fixed random seed.",
+    "Adding structured logs around the boundary made the cause obvious.",
+    "The fix was small once the invariant was written down explicitly.",
+    "A regression test now covers the exact sequence that failed.",
+    "Measuring before and after showed the change was worth it.",
+    "Documenting the decision saved time when the issue came back later.",
+    "Rolling the change out behind a flag kept the blast radius small.",
+]
+
+
+@functools.lru_cache(maxsize=None)
+def _token_vector(token: str, dimension: int) -> np.ndarray:
+    seed = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+    return np.random.default_rng(seed).standard_normal(dimension).astype(np.float32)
+
+
+def fake_embedding(text: str, dimension: int = EMBEDDING_DIMENSION) -> List[float]:
+    """Deterministic bag-of-words embedding: texts sharing words get similar vectors"""
+    vector = np.zeros(dimension, dtype=np.float32)
+    for token in re.findall(r"[a-z0-9]+", text.lower()):
+        vector += _token_vector(token, dimension)
+    norm = float(np.linalg.norm(vector))
+    return (vector / norm if norm else vector).tolist()
+
+
+def fake_embeddings_transport() -> httpx.MockTransport:
+    """Stands in for the OpenAI embeddings endpoint"""
+    def handle(request: httpx.Request) -> httpx.Response:
+        texts = json.loads(request.content)["input"]
+        if isinstance(texts, str):
+            texts = [texts]
+        return httpx.Response(200, json={"data": [
+            {"index": index, "embedding": fake_embedding(text)} for index, text in enumerate(texts)
+        ]})
+    return httpx.MockTransport(handle)
+
+
+def synthetic_memory(index: int, seed: int = 0) -> Dict[str, Any]:
+    """The index-th synthetic memory: v3.2 document format plus store_memory-style payload"""
+    rng = random.Random(f"{seed}:{index}")
+    roles = list(ROLE_TOPICS)
+    role = roles[index % len(roles)]
+    topic = rng.choice(ROLE_TOPICS[role])
+    aspect = rng.choice(ASPECTS)
+    outcome = rng.choice(OUTCOMES)
+    title = f"{topic.replace('-', ' ').title()} {aspect.replace('-', ' ')} ({outcome}) #{index}"
+    description = f"How a {aspect.replace('-', ' ')} in {topic.replace('-', ' ')} was handled in a {role} codebase."
+    content = " ".join(rng.sample(FILLER, 4))
+    tags = [role, topic, aspect, outcome]
+    document = (
+        f"**Title:** {title}\n"
+        f"**Description:** {description}\n\n"
+        f"**Content:** {content}\n\n"
+        f"**Tags:** {' '.join('#' + tag for tag in tags)}"
+    )
+    return {
+        "doc_id": str(uuid.uuid5(uuid.NAMESPACE_URL, f"benchmark/{seed}/{index}")),
+        "collection": ROLE_COLLECTIONS["global"][role],
+        "document": document,
+        "metadata": {
+            "memory_type": rng.choice(MEMORY_TYPES),
+            "role": role,
+            "tags": tags,
+            "title": title,
+            "created_at": datetime(2025, 1, 1).isoformat(),
+            "confidence": "high",
+            "frequency": 1
+        },
+        "topic": topic,
+        "aspect": aspect
+    }
+
+
+def synthetic_query(rng: random.Random) -> Dict[str, str]:
+    """A recall query in the style of the recall skill (role + topic + symptom)"""
+    role = rng.choice(list(ROLE_TOPICS))
+    topic = rng.choice(ROLE_TOPICS[role])
+    aspect = rng.choice(ASPECTS)
+    return {
+        "role": role,
+        "query": f"{topic.replace('-', ' ')} {aspect.replace('-', ' ')} in a {role} project, what worked before?"
+    }
+
+
+def make_server(location: str, path: Optional[str] = None) -> MemoryServer:
+    """MemoryServer on the given Qdrant location with the fake embedder wired in"""
+    import qdrant_client
+
+    memory_server = MemoryServer()
+    if path:
+        memory_server._client = qdrant_client.AsyncQdrantClient(path=path)
+    elif location == ":memory:":
+        memory_server._client = qdrant_client.AsyncQdrantClient(location=":memory:")
+    else:
+        memory_server._client = qdrant_client.AsyncQdrantClient(url=location, timeout=int(QDRANT_TIMEOUT))
+    memory_server._http = httpx.AsyncClient(transport=fake_embeddings_transport())
+    return memory_server
+
+
+async def seed(memory_server: MemoryServer, count: int, seed_value: int = 0, batch_size: int = 512) -> float:
+    """Upsert `count` synthetic memories in batches; returns elapsed seconds"""
+    start = time.perf_counter()
+    await memory_server._ensure_ready()
+    for offset in range(0, count, batch_size):
+        by_collection: Dict[str, list] = {}
+        for index in range(offset, min(offset + batch_size, count)):
+            memory = synthetic_memory(index, seed_value)
+            vector = fake_embedding(memory["document"])
+            if await memory_server.vector_layout(memory["collection"]) == "named":
+                vector = {"preview": vector, "content": [vector]}
+            by_collection.setdefault(memory["collection"], []).append(models.PointStruct(
+                id=memory["doc_id"],
+                vector=vector,
+                payload=memory_server.payload_schema.build(memory["document"], memory["metadata"])
+            ))
+        await asyncio.gather(*[
+            memory_server._qdrant(memory_server.client.upsert, collection_name=name, points=points, wait=True)
+            for name, points in by_collection.items()
+        ])
+    return time.perf_counter() - start
+
+
+def current_rss_mb() -> float:
+    """Resident set size now (Linux), else the peak reported by getrusage"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+def percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(q * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Recorder:
+    """Client-side latency samples and RSS per tool"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+        self.rss: Dict[str, float] = {}
+        self.errors: Dict[str, int] = {}
+
+    async def call(self, tool: str, coro) -> Any:
+        start = time.perf_counter()
+        result = await coro
+        self.samples.setdefault(tool, []).append((time.perf_counter() - start) * 1000)
+        if isinstance(result, str) and result.startswith('{"error"'):
+            self.errors[tool] = self.errors.get(tool, 0) + 1
+        self.rss[tool] = max(self.rss.get(tool, 0.0), current_rss_mb())
+        return result
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        tools = {}
+        for tool, samples in sorted(self.samples.items()):
+            ordered = sorted(samples)
+            tools[tool] = {
+                "calls": len(ordered),
+                "errors": self.errors.get(tool, 0),
+                "throughput_per_s": round(len(ordered) / elapsed, 1),
+                "latency_ms": {
+                    "mean": round(sum(ordered) / len(ordered), 3),
+                    "p50": round(percentile(ordered, 0.50), 3),
+                    "p95": round(percentile(ordered, 0.95), 3),
+                    "p99": round(percentile(ordered, 0.99), 3),
+                    "max": round(ordered[-1], 3)
+                },
+                "rss_mb": round(self.rss[tool], 1)
+            }
+        return tools
+
+
+async def recall(memory_server: MemoryServer, recorder: Recorder, rng: random.Random, limit: int):
+    """Recall skill flow: search role + universal concurrently, then one batched fetch of the top hits"""
+    query = synthetic_query(rng)
+    roles = [query["role"]] if query["role"] == "universal" else [query["role"], "universal"]
+    responses = await asyncio.gather(*[
+        recorder.call("search_memory", memory_server.search_memory(
+            query=query["query"], memory_level="global", limit=limit, role=role
+        ))
+        for role in roles
+    ])
+    items = []
+    for role, response in zip(roles, responses):
+        for preview in json.loads(response).get("results", [])[:3]:
+            items.append({"doc_id": preview["doc_id"], "role": role})
+    if items:
+        await recorder.call("batch_get_memories_multi", memory_server.batch_get_memories_multi(items=items))
+
+
+async def store(memory_server: MemoryServer, recorder: Recorder, rng: random.Random, index: int):
+    memory = synthetic_memory(index, seed=rng.randrange(1 << 30))
+    await recorder.call("store_memory", memory_server.store_memory(
+        document=memory["document"], metadata=memory["metadata"], memory_level="global"
+    ))
+
+
+async def run_workload(memory_server: MemoryServer, operations: int, concurrency: int,
+                       store_ratio: float, limit: int, seed_value: int) -> Dict[str, Any]:
+    """Run `operations` recall/store operations from `concurrency` concurrent agents"""
+    recorder = Recorder()
+    counter = iter(range(operations))
+
+    async def agent(agent_id: int):
+        rng = random.Random(f"{seed_value}:agent:{agent_id}")
+        for index in counter:
+            if rng.random() < store_ratio:
+                await store(memory_server, recorder, rng, index)
+            else:
+                await recorder.call("recall_flow", recall(memory_server, recorder, rng, limit))
+
+    start = time.perf_counter()
+    await asyncio.gather(*[agent(i) for i in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "operations_per_s": round(operations / elapsed, 1),
+        "tools": recorder.report(elapsed)
+    }
+
+
+async def benchmark_scale(args: argparse.Namespace, scale: int) -> Dict[str, Any]:
+    """Seed a fresh store with `scale` memories and run the workload against it"""
+    METRICS.reset()  # Server-side stage breakdown for this scale only
+    path = None
+    if args.qdrant_path:
+        path = os.path.join(args.qdrant_path, f"scale-{scale}")
+        shutil.rmtree(path, ignore_errors=True)
+    memory_server = make_server(args.qdrant_url or ":memory:", path)
+
+    try:
+        if args.qdrant_url:
+            for name in ROLE_COLLECTIONS["global"].values():
+                await memory_server.delete_collection(name)
+
+        rss_before = current_rss_mb()
+        seed_s = await seed(memory_server, scale, args.seed)
+        logger.info(f"Seeded {scale} memories in {seed_s:.1f}s")
+        workload = await run_workload(memory_server, args.operations, args.concurrency,
+                                      args.store_ratio, args.limit, args.seed)
+        server_side = METRICS.snapshot()["tools"]
+        return {
+            "scale": scale,
+            "seed_s": round(seed_s, 2),
+            "seed_points_per_s": round(scale / seed_s, 1) if seed_s else None,
+            "rss_mb": {
+                "before_seed": round(rss_before, 1),
+                "after": round(current_rss_mb(), 1),
+                "peak": round(peak_rss_mb(), 1)
+            },
+            **workload,
+            "server_stage_ms": {tool: stats["mean_stage_ms"] for tool, stats in server_side.items()}
+        }
+    finally:
+        await memory_server.close()
+        if path and not args.keep_data:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """p95 regressions beyond `tolerance` (fraction) versus a previous run"""
+    regressions = []
+    previous = {run["scale"]: run for run in baseline.get("runs", [])}
+    for run in results["runs"]:
+        old_run = previous.get(run["scale"])
+        if not old_run:
+            continue
+        for tool, stats in run["tools"].items():
+            old = old_run["tools"].get(tool)
+            if not old:
+                continue
+            new_p95, old_p95 = stats["latency_ms"]["p95"], old["latency_ms"]["p95"]
+            if old_p95 and new_p95 > old_p95 * (1 + tolerance):
+                regressions.append(f"scale={run['scale']} {tool}: p95 {old_p95}ms -> {new_p95}ms")
+    return regressions
+
+
+def print_summary(results: Dict[str, Any]):
+    print(f"{'scale':>8} {'tool':<26} {'calls':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'ops/s':>8} {'rss MB':>8}")
+    for run in results["runs"]:
+        for tool, stats in run["tools"].items():
+            lat = stats["latency_ms"]
+            print(f"{run['scale']:>8} {tool:<26} {stats['calls']:>6} {lat['p50']:>8.2f} {lat['p95']:>8.2f} "
+                  f"{lat['p99']:>8.2f} {stats['throughput_per_s']:>8.1f} {stats['rss_mb']:>8.1f}")
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    runs = []
+    for scale in args.scales:
+        runs.append(await benchmark_scale(args, scale))
+    return {
+        "created_at": datetime.now().isoformat(),
+        "config": {
+            "qdrant": args.qdrant_url or args.qdrant_path or ":memory:",
+            "operations": args.operations,
+            "concurrency": args.concurrency,
+            "store_ratio": args.store_ratio,
+            "limit": args.limit,
+            "seed": args.seed,
+            "dimension": EMBEDDING_DIMENSION,
+            "python": sys.version.split()[0]
+        },
+        "runs": runs
+    }
+
+
+def main():
+    """Main CLI entry point"""
+    parser = argparse.ArgumentParser(description="Benchmark the memory server with synthetic memories")
+    parser.add_argument("--scales", type=lambda s: [int(x) for x in s.split(",")], default=[1000, 10000],
+                        help="Comma-separated memory counts to seed (default: 1000,10000)")
+    parser.add_argument("--operations", type=int, default=500, help="Recall/store operations per scale")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent simulated agents")
+    parser.add_argument("--store-ratio", type=float, default=0.1, help="Fraction of operations that store")
+    parser.add_argument("--limit", type=int, default=10, help="search_memory limit")
+    parser.add_argument("--seed", type=int, default=0, help="Corpus and workload seed")
+    location = parser.add_mutually_exclusive_group()
+    location.add_argument("--qdrant-path", help="Use embedded Qdrant storage under this directory")
+    location.add_argument("--qdrant-url", help="Use a Qdrant server (DROPS the role collections; needs --recreate)")
+    parser.add_argument("--recreate", action="store_true", help="Allow dropping role collections on --qdrant-url")
+    parser.add_argument("--keep-data", action="store_true", help="Keep --qdrant-path data after the run")
+    parser.add_argument("--output", "-o", help="Write JSON results here")
+    parser.add_argument("--baseline", help="Previous JSON results to compare p95 latencies against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed p95 slowdown vs baseline")
+    args = parser.parse_args()
+
+    if args.qdrant_url and not args.recreate:
+        parser.error("--qdrant-url drops and reseeds the role collections; pass --recreate to confirm")
+    if not args.qdrant_path and not args.qdrant_url and max(args.scales) >= 100000:
+        logger.info("Seeding 100k+ memories in :memory: mode needs ~2.5GB RAM")
+
+    for name in (MemoryServer.__module__, memory_engine.__name__):
+        logging.getLogger(name).setLevel(logging.WARNING)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    results = asyncio.run(run(args))
+    print_summary(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as out:
+            json.dump(results, out, indent=2)
+        logger.info(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
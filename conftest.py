@@ -0,0 +1,57 @@
+"""
+Shared pytest fixtures: a stub embeddings endpoint and engines wired to it
+"""
+
+import asyncio
+import json
+from typing import List, Optional
+
+import httpx
+import pytest
+
+from benchmark_memory_server import fake_embedding
+from memory_engine import MemoryEngine
+
+# Simulator script against a live server, run directly (its name is not importable)
+collect_ignore = ["test_v3.2_system.py"]
+
+
+class StubEmbedder:
+    """
+    Stands in for the embeddings endpoint: records the inputs of every request and
+    answers with deterministic vectors, or with `status` when it is not 200.
+    While `hold` is set, requests wait on it (an upstream that never answers).
+    """
+
+    def __init__(self):
+        self.requests: List[List[str]] = []
+        self.status = 200
+        self.hold: Optional[asyncio.Event] = None
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        texts = json.loads(request.content)["input"]
+        self.requests.append(texts)
+        if self.hold is not None:
+            await self.hold.wait()
+        if self.status != 200:
+            return httpx.Response(self.status, json={"error": {"message": "stub failure"}})
+        return httpx.Response(200, json={"data": [
+            {"index": index, "embedding": fake_embedding(text)} for index, text in enumerate(texts)
+        ]})
+
+
+@pytest.fixture
+def stub_embedder() -> StubEmbedder:
+    return StubEmbedder()
+
+
+@pytest.fixture
+def make_engine(stub_embedder):
+    """Factory for engines whose embedding calls go to the stub (call it inside the event loop)"""
+
+    def make(**kwargs) -> MemoryEngine:
+        engine = MemoryEngine(**kwargs)
+        engine._http = httpx.AsyncClient(transport=httpx.MockTransport(stub_embedder.handle))
+        return engine
+
+    return make
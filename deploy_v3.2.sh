@@ -107,8 +107,8 @@ echo "🚀 Installing MCP server v2..."
 # Create scripts directory
 mkdir -p ~/scripts
 
-# Copy new server
-cp qdrant_memory_mcp_server_v2.py ~/scripts/
+# Copy new server (and the engine it imports)
+cp qdrant_memory_mcp_server_v2.py memory_engine.py ~/scripts/
 chmod +x ~/scripts/qdrant_memory_mcp_server_v2.py
 
 echo -e "${GREEN}✅ MCP server v2 installed${NC}"
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Evaluate retrieval quality and token efficiency of the V2 memory server
+recall@k / MRR / nDCG over labeled queries, and bytes/tokens of two-stage vs full retrieval
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+from datetime import datetime
+from typing import Any, Dict, List
+
+os.environ.setdefault("SLOW_CALL_MS", "inf")
+os.environ.setdefault("MEMORY_WARMUP", "false")
+
+import memory_engine
+import qdrant_memory_mcp_server_v2 as v2
+from benchmark_memory_server import make_server, seed, synthetic_memory
+
+logger = logging.getLogger(__name__)
+
+# Response formats search_memory can return previews in
+PREVIEW_STRATEGIES = ("rows", "columnar")
+
+def fixture_labels(scale: int, seed_value: int = 0, count: int = 50) -> List[Dict[str, Any]]:
+    """Labeled queries for the synthetic fixture: relevant = same role, topic and aspect"""
+    groups: Dict[tuple, List[str]] = {}
+    for index in range(scale):
+        memory = synthetic_memory(index, seed_value)
+        key = (memory["metadata"]["role"], memory["topic"], memory["aspect"])
+        groups.setdefault(key, []).append(memory["doc_id"])
+
+    rng = random.Random(seed_value)
+    keys = sorted(groups)
+    labels = []
+    for role, topic, aspect in rng.sample(keys, min(count, len(keys))):
+        labels.append({
+            "query": f"{aspect.replace('-', ' ')} with {topic.replace('-', ' ')}, {role} lessons learned",
+            "memory_level": "global",
+            "role": role,
+            "relevant": groups[(role, topic, aspect)]
+        })
+    return labels
+
+
+def load_labels(path: str) -> List[Dict[str, Any]]:
+    """JSONL of {query, relevant: [doc_id, ...], memory_level?, role?}"""
+    labels = []
+    with open(os.path.expanduser(path), encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            label = json.loads(line)
+            if "query" not in label or "relevant" not in label:
+                raise SystemExit(f"{path}:{line_no}: expected 'query' and 'relevant'")
+            labels.append(label)
+    return labels
+
+
+def recall_at_k(ranked: List[str], relevant: set, k: int) -> float:
+    return len(set(ranked[:k]) & relevant) / len(relevant) if relevant else 0.0
+
+
+def reciprocal_rank(ranked: List[str], relevant: set) -> float:
+    for rank, doc_id in enumerate(ranked, 1):
+        if doc_id in relevant:
+            return 1.0 / rank
+    return 0.0
+
+
+def ndcg_at_k(ranked: List[str], relevant: set, k: int) -> float:
+    """Binary-relevance nDCG"""
+    dcg = sum(1.0 / math.log2(rank + 1) for rank, doc_id in enumerate(ranked[:k], 1) if doc_id in relevant)
+    ideal = sum(1.0 / math.log2(rank + 1) for rank in range(1, min(len(relevant), k) + 1))
+    return dcg / ideal if ideal else 0.0
+
+
+def _mean(values: List[float]) -> float:
+    return round(sum(values) / len(values), 4) if values else 0.0
+
+
+async def evaluate_quality(memory_server, labels: List[Dict[str, Any]], ks: List[int]) -> Dict[str, Any]:
+    """Search every labeled query once at max(k) and score the ranking"""
+    per_k: Dict[int, Dict[str, List[float]]] = {k: {"recall": [], "ndcg": []} for k in ks}
+    rrs = []
+    for label in labels:
+        response = json.loads(await memory_server.search_memory(
+            query=label["query"], memory_level=label.get("memory_level", "global"),
+            limit=max(ks), role=label.get("role")
+        ))
+        if "error" in response:
+            logger.warning(f"Search failed for '{label['query']}': {response['error']}")
+        ranked = [hit["doc_id"] for hit in response.get("results", [])]
+        relevant = set(label["relevant"])
+        rrs.append(reciprocal_rank(ranked, relevant))
+        for k in ks:
+            per_k[k]["recall"].append(recall_at_k(ranked, relevant, k))
+            per_k[k]["ndcg"].append(ndcg_at_k(ranked, relevant, k))
+
+    return {
+        "queries": len(labels),
+        f"mrr@{max(ks)}": _mean(rrs),
+        **{f"recall@{k}": _mean(per_k[k]["recall"]) for k in ks},
+        **{f"ndcg@{k}": _mean(per_k[k]["ndcg"]) for k in ks}
+    }
+
+
+async def evaluate_tokens(memory_server, labels: List[Dict[str, Any]], limits: List[int],
+                          fetch: int) -> List[Dict[str, Any]]:
+    """
+    Per limit and preview strategy: bytes/tokens of search previews + fetching
+    the top `fetch` documents (two-stage), versus fetching all `limit` hits in full.
+    """
+    rows = []
+    for limit in limits:
+        for strategy in PREVIEW_STRATEGIES:
+            totals = {"search": [0, 0], "fetch": [0, 0], "full": [0, 0]}
+            for label in labels:
+                memory_level, role = label.get("memory_level", "global"), label.get("role")
+                search_text = await memory_server.search_memory(
+                    query=label["query"], memory_level=memory_level, limit=limit, role=role,
+                    response_format=strategy
+                )
+                # Rank order is the same for every strategy; read ids from the rows layout
+                if strategy != "rows":
+                    search_rows = await memory_server.search_memory(
+                        query=label["query"], memory_level=memory_level, limit=limit, role=role
+                    )
+                else:
+                    search_rows = search_text
+                doc_ids = [hit["doc_id"] for hit in json.loads(search_rows).get("results", [])]
+                fetch_text = await memory_server.batch_get_memories(
+                    doc_ids=doc_ids[:fetch], memory_level=memory_level, role=role
+                )
+                full_text = await memory_server.batch_get_memories(
+                    doc_ids=doc_ids, memory_level=memory_level, role=role
+                )
+                for key, text in (("search", search_text), ("fetch", fetch_text), ("full", full_text)):
+                    totals[key][0] += len(text.encode("utf-8"))
+                    totals[key][1] += memory_engine.count_tokens(text)
+
+            queries = len(labels) or 1
+            two_stage_tokens = totals["search"][1] + totals["fetch"][1]
+            rows.append({
+                "limit": limit,
+                "preview_strategy": strategy,
+                "fetch": fetch,
+                "search_bytes": round(totals["search"][0] / queries),
+                "search_tokens": round(totals["search"][1] / queries),
+                "two_stage_tokens": round(two_stage_tokens / queries),
+                "full_tokens": round(totals["full"][1] / queries),
+                "token_savings": round(1 - two_stage_tokens / totals["full"][1], 3) if totals["full"][1] else None
+            })
+    return rows
+
+
+def print_summary(report: Dict[str, Any]):
+    quality = report["quality"]
+    print("Quality: " + ", ".join(f"{key}={value}" for key, value in quality.items()))
+    print(f"{'limit':>5} {'strategy':<9} {'search tok':>10} {'2-stage tok':>11} {'full tok':>9} {'savings':>8}")
+    for row in report["tokens"]:
+        savings = f"{row['token_savings']:.1%}" if row["token_savings"] is not None else "-"
+        print(f"{row['limit']:>5} {row['preview_strategy']:<9} {row['search_tokens']:>10} "
+              f"{row['two_stage_tokens']:>11} {row['full_tokens']:>9} {savings:>8}")
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    if args.live:
+        memory_server = v2.memory_server
+        labels = load_labels(args.labels)
+    else:
+        memory_server = make_server(":memory:")
+        await seed(memory_server, args.scale, args.seed)
+        labels = load_labels(args.labels) if args.labels else fixture_labels(args.scale, args.seed, args.queries)
+
+    try:
+        quality = await evaluate_quality(memory_server, labels, args.k)
+        tokens = await evaluate_tokens(memory_server, labels, args.limits, args.fetch)
+    finally:
+        await memory_server.close()
+
+    return {
+        "created_at": datetime.now().isoformat(),
+        "config": {
+            "fixture": None if args.live else {"scale": args.scale, "seed": args.seed},
+            "labels": args.labels or "generated",
+            "k": args.k,
+            "limits": args.limits,
+            "fetch": args.fetch,
+            "tokenizer": memory_engine.tokenizer_name()
+        },
+        "quality": quality,
+        "tokens": tokens,
+        "labels_used": labels if args.write_labels else None
+    }
+
+
+def main():
+    """Main CLI entry point"""
+    int_list = lambda s: [int(x) for x in s.split(",")]
+    parser = argparse.ArgumentParser(description="Evaluate memory retrieval quality and token efficiency")
+    parser.add_argument("--labels", help="Labeled queries JSONL: {query, relevant: [doc_id...], memory_level, role}")
+    parser.add_argument("--live", action="store_true",
+                        help="Evaluate the configured Qdrant/OpenAI instead of the synthetic fixture (needs --labels)")
+    parser.add_argument("--scale", type=int, default=2000, help="Fixture size (default: 2000)")
+    parser.add_argument("--seed", type=int, default=0, help="Fixture seed")
+    parser.add_argument("--queries", type=int, default=50, help="Generated fixture queries")
+    parser.add_argument("--k", type=int_list, default=[1, 3, 5, 10], help="Cutoffs for recall/nDCG")
+    parser.add_argument("--limits", type=int_list, default=[3, 5, 10, 20], help="search_memory limits to measure")
+    parser.add_argument("--fetch", type=int, default=3, help="Documents fetched after search in two-stage mode")
+    parser.add_argument("--output", "-o", help="Write the JSON report here")
+    parser.add_argument("--write-labels", help="Save the labeled queries used (JSONL) for reuse")
+    args = parser.parse_args()
+
+    if args.live and not args.labels:
+        parser.error("--live needs --labels")
+
+    for name in (v2.__name__, memory_engine.__name__):
+        logging.getLogger(name).setLevel(logging.WARNING)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    report = asyncio.run(run(args))
+    labels = report.pop("labels_used")
+    if args.write_labels:
+        with open(args.write_labels, "w", encoding="utf-8") as out:
+            for label in labels:
+                out.write(json.dumps(label) + "\n")
+
+    print_summary(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as out:
+            json.dump(report, out, indent=2)
+        logger.info(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
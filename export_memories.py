@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Page through or export memory collections
+Streams JSONL with constant memory for audits and offline analysis
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+from typing import Any, Dict, List, Optional
+
+from qdrant_memory_mcp_server_v2 import memory_server
+
+logger = logging.getLogger(__name__)
+
+
+def parse_filters(pairs: List[str]) -> Optional[Dict[str, Any]]:
+    """Parse repeated key=value arguments; repeating a key matches any of its values"""
+    filters: Dict[str, Any] = {}
+    for pair in pairs or []:
+        key, sep, raw = pair.partition("=")
+        if not sep:
+            raise SystemExit(f"Invalid filter '{pair}', expected key=value")
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            value = raw
+        if key in filters:
+            existing = filters[key]
+            filters[key] = (existing if isinstance(existing, list) else [existing]) + [value]
+        else:
+            filters[key] = value
+    return filters or None
+
+
+def parse_include(value: Optional[str]) -> Optional[List[str]]:
+    """Parse a comma-separated payload include-list"""
+    if not value:
+        return None
+    return [field.strip() for field in value.split(",") if field.strip()]
+
+
+def main():
+    """Main CLI entry point"""
+    parser = argparse.ArgumentParser(description="Scroll or export memory collections")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add_common(sub):
+        sub.add_argument("memory_level", help="'global' or project name (e.g. proj-myproject)")
+        sub.add_argument("--role", help="Role for global memories (default: universal)")
+        sub.add_argument("--include", help="Comma-separated payload fields to return")
+        sub.add_argument("--filter", action="append", default=[], metavar="KEY=VALUE",
+                         help="Exact-match payload filter (repeatable)")
+
+    scroll = subparsers.add_parser("scroll", help="Print one page of memories")
+    add_common(scroll)
+    scroll.add_argument("--cursor", help="Cursor returned by the previous page")
+    scroll.add_argument("--limit", type=int, default=50, help="Page size (default: 50)")
+
+    export = subparsers.add_parser("export", help="Stream a whole collection to JSONL")
+    add_common(export)
+    export.add_argument("--output", "-o", default="-", help="Output .jsonl path, '-' for stdout")
+    export.add_argument("--with-vectors", action="store_true", help="Include embedding vectors")
+    export.add_argument("--batch-size", type=int, default=256, help="Points per scroll request")
+
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+async def run(args: argparse.Namespace):
+    """Execute the parsed command against the memory server"""
+    filters = parse_filters(args.filter)
+    include = parse_include(args.include)
+
+    try:
+        if args.command == "scroll":
+            print(await memory_server.scroll_memories(
+                memory_level=args.memory_level,
+                role=args.role,
+                cursor=args.cursor,
+                limit=args.limit,
+                include=include,
+                filters=filters
+            ))
+            return
+
+        collection_name = memory_server._get_collection_name(args.memory_level, args.role)
+        if args.output == "-":
+            exported = await memory_server._export_to_jsonl(
+                collection_name, sys.stdout, include, filters, args.with_vectors, args.batch_size
+            )
+        else:
+            with open(os.path.expanduser(args.output), "w", encoding="utf-8") as out:
+                exported = await memory_server._export_to_jsonl(
+                    collection_name, out, include, filters, args.with_vectors, args.batch_size
+                )
+        logger.info(f"Exported {exported} memories from '{collection_name}'")
+    finally:
+        await memory_server.close()
+
+
+if __name__ == "__main__":
+    main()
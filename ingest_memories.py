@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Ingest file-based memories from skill roots into Qdrant
+Markdown files are parsed in a process pool and streamed into batched embed/upsert
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import re
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from memory_engine import MemoryEngine
+
+logger = logging.getLogger(__name__)
+
+CODER_SKILL_ROOT = Path.home() / ".claude/skills/coder-memory-store"
+PROJECT_SKILL_ROOT = Path(".claude/skills/project-memory-store")  # Relative to a project directory
+CODER_COLLECTION = "coder-memory"
+MEMORY_TYPES = ("episodic", "procedural", "semantic")
+
+# Point ids are uuid5(namespace, collection:file:title), so re-ingesting a memory
+# overwrites its point instead of adding a duplicate
+MEMORY_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "deploy-memory-tools/memories")
+
+CHUNK_SEPARATOR = re.compile(r"\n---\n")
+
+# Every field of a memory chunk in one pass, in file order; only Title is required
+MEMORY_FIELDS = re.compile(
+    r"\*\*Title:\*\*\s*(?P<title>[^\n]+?)\s*\n"
+    r"(?:.*?\*\*Description:\*\*\s*(?P<description>[^\n]*?)\s*\n)?"
+    r"(?:.*?\*\*Content:\*\*\s*(?P<content>.+?)(?=\n\*\*Tags:|\Z))?"
+    r"(?:.*?\*\*Tags:\*\*[ \t]*(?P<tags>[^\n]*)\Z)?",
+    re.DOTALL
+)
+
+
+def sanitize_project_name(name: str) -> str:
+    """Lowercase alphanumerics and hyphens, as the V1 server names project collections"""
+    return re.sub(r'[^a-z0-9]+', '-', name.lower()).strip('-')
+
+
+def describe_root(root: Path, collection: Optional[str] = None) -> Dict[str, str]:
+    """Collection and memory level for a skill root (project roots live in <project>/.claude/skills)"""
+    root = root.expanduser().resolve()
+    if root.name.startswith("project-memory"):
+        project = sanitize_project_name(root.parents[2].name)
+        info = {"memory_level": "project", "collection": f"proj-{project}", "project": project}
+    else:
+        info = {"memory_level": "coder", "collection": CODER_COLLECTION}
+    if collection:
+        info["collection"] = collection
+    return {"root": str(root), "skill_root": root.name, **info}
+
+
+def find_project_roots(projects_dirs: List[str]) -> List[Path]:
+    """Project skill roots of every project directly under the given directories"""
+    roots = []
+    for projects_dir in projects_dirs:
+        for project in sorted(Path(projects_dir).expanduser().iterdir()):
+            if (project / PROJECT_SKILL_ROOT).is_dir():
+                roots.append(project / PROJECT_SKILL_ROOT)
+    return roots
+
+
+def memory_files(root: Dict[str, str]) -> List[str]:
+    """Markdown memory files under a skill root's memory type directories"""
+    files = []
+    for memory_type in MEMORY_TYPES:
+        type_dir = Path(root["root"]) / memory_type
+        if type_dir.is_dir():
+            files.extend(str(path) for path in sorted(type_dir.rglob("*.md")) if "README" not in path.name)
+    return files
+
+
+def parse_chunk(chunk: str) -> Optional[Dict[str, Any]]:
+    """Title, description, content and tags of one memory chunk, or None if it has no title"""
+    match = MEMORY_FIELDS.search(chunk)
+    if not match:
+        return None
+    tags = [tag.lstrip('#') for tag in (match.group("tags") or "").split() if tag.startswith('#')]
+    return {
+        "title": match.group("title"),
+        "description": match.group("description") or "",
+        "content": (match.group("content") or "").strip(),
+        "tags": tags
+    }
+
+
+def parse_file(path: str, root: Dict[str, str], synced_at: str) -> List[Dict[str, Any]]:
+    """Memories of one markdown file, with the collection and point id each belongs to"""
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+
+    rel_path = os.path.relpath(path, root["root"])
+    memory_type = rel_path.split(os.sep, 1)[0]
+    memories = []
+    for chunk in CHUNK_SEPARATOR.split(text):
+        chunk = chunk.strip()
+        # Skip empty chunks and file headers
+        if not chunk or chunk.startswith('#'):
+            continue
+        fields = parse_chunk(chunk)
+        if fields is None:
+            continue
+
+        document = (
+            f"**Title:** {fields['title']}\n"
+            f"**Description:** {fields['description']}\n\n"
+            f"**Content:** {fields['content']}\n\n"
+            f"**Tags:** {' '.join('#' + tag for tag in fields['tags'])}"
+        )
+        metadata = {
+            "memory_level": root["memory_level"],
+            "memory_type": memory_type,
+            "file_path": rel_path,
+            "skill_root": root["skill_root"],
+            "tags": fields["tags"],
+            "title": fields["title"],
+            "created_at": synced_at,
+            "last_synced": synced_at
+        }
+        if "project" in root:
+            metadata["project"] = root["project"]
+        doc_id = str(uuid.uuid5(MEMORY_ID_NAMESPACE, f"{root['collection']}:{rel_path}:{fields['title']}"))
+        memories.append({"collection": root["collection"], "doc_id": doc_id, "document": document,
+                         "metadata": metadata})
+    return memories
+
+
+def parse_files(paths: List[str], root: Dict[str, str], synced_at: str) -> List[Dict[str, Any]]:
+    """Process pool task: parse a group of files (one task per file costs more in IPC than parsing)"""
+    memories = []
+    for path in paths:
+        try:
+            memories.extend(parse_file(path, root, synced_at))
+        except (OSError, UnicodeDecodeError) as e:
+            logger.warning(f"Skipping '{path}': {str(e)}")
+    return memories
+
+
+async def ingest(engine: Optional[MemoryEngine], roots: List[Dict[str, str]], workers: Optional[int] = None,
+                 batch_size: int = 64, concurrency: int = 4, files_per_task: int = 32) -> Dict[str, Any]:
+    """
+    Parse every root's memory files in a process pool and upsert them as they arrive,
+    `batch_size` memories per embedding request and upsert, at most `concurrency`
+    batches in flight. With no engine, only parses (dry run).
+    """
+    start = time.perf_counter()
+    synced_at = datetime.now().isoformat()
+    stats: Dict[str, Any] = {"files": 0, "memories": 0, "written": 0, "collections": {}}
+    if engine is not None:
+        for collection_name in sorted({root["collection"] for root in roots}):
+            await engine.ensure_collection(collection_name)
+
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(concurrency)
+    batches: Dict[str, List[Dict[str, Any]]] = {}
+    writes = []
+
+    async def write(collection_name: str, batch: List[Dict[str, Any]]):
+        try:
+            written = await engine.upsert_memories(
+                collection_name, [(m["doc_id"], m["document"], m["metadata"]) for m in batch]
+            )
+            stats["written"] += written
+        finally:
+            slots.release()
+
+    async def flush(collection_name: str):
+        batch = batches.pop(collection_name, [])
+        if batch and engine is not None:
+            await slots.acquire()  # Backpressure: stop consuming parse results while embedding is saturated
+            writes.append(asyncio.create_task(write(collection_name, batch)))
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        tasks = []
+        for root in roots:
+            files = memory_files(root)
+            stats["files"] += len(files)
+            for offset in range(0, len(files), files_per_task):
+                tasks.append(loop.run_in_executor(
+                    pool, parse_files, files[offset:offset + files_per_task], root, synced_at
+                ))
+
+        # Stream results in completion order into per-collection batches
+        for done in asyncio.as_completed(tasks):
+            for memory in await done:
+                collection_name = memory["collection"]
+                stats["memories"] += 1
+                stats["collections"][collection_name] = stats["collections"].get(collection_name, 0) + 1
+                batch = batches.setdefault(collection_name, [])
+                batch.append(memory)
+                if len(batch) >= batch_size:
+                    await flush(collection_name)
+
+    for collection_name in list(batches):
+        await flush(collection_name)
+    await asyncio.gather(*writes)
+
+    stats["elapsed_s"] = round(time.perf_counter() - start, 3)
+    return stats
+
+
+def resolve_roots(args: argparse.Namespace) -> List[Dict[str, str]]:
+    """Skill roots from the command line: explicit roots and --projects, else the defaults"""
+    roots = [describe_root(Path(root)) for root in args.roots]
+    roots += [describe_root(root) for root in find_project_roots(args.projects)]
+    if not roots:
+        roots.append(describe_root(CODER_SKILL_ROOT, args.coder_collection))
+        if PROJECT_SKILL_ROOT.is_dir():
+            roots.append(describe_root(PROJECT_SKILL_ROOT))
+    return roots
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    roots = resolve_roots(args)
+    for root in roots:
+        logger.info(f"{root['root']} -> '{root['collection']}'")
+
+    engine = None if args.dry_run else MemoryEngine()
+    try:
+        return await ingest(engine, roots, args.workers, args.batch_size, args.concurrency)
+    finally:
+        if engine is not None:
+            await engine.close()
+
+
+def main():
+    """Main CLI entry point"""
+    parser = argparse.ArgumentParser(description="Ingest file-based memories from skill roots into Qdrant")
+    parser.add_argument("roots", nargs="*",
+                        help="Skill roots to ingest (default: coder-memory-store and ./.claude project skills)")
+    parser.add_argument("--projects", action="append", default=[], metavar="DIR",
+                        help="Also ingest the project skills of every project under DIR (repeatable)")
+    parser.add_argument("--coder-collection", default=CODER_COLLECTION,
+                        help=f"Collection for the default coder root (default: {CODER_COLLECTION})")
+    parser.add_argument("--workers", type=int, help="Parser processes (default: CPU count)")
+    parser.add_argument("--batch-size", type=int, default=64, help="Memories per embedding request / upsert")
+    parser.add_argument("--concurrency", type=int, default=4, help="Batches embedded and upserted at once")
+    parser.add_argument("--dry-run", action="store_true", help="Parse and count without embedding or writing")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    stats = asyncio.run(run(args))
+    for collection_name, count in sorted(stats["collections"].items()):
+        logger.info(f"'{collection_name}': {count} memories")
+    logger.info(f"Parsed {stats['memories']} memories from {stats['files']} files, "
+                f"wrote {stats['written']} in {stats['elapsed_s']}s")
+
+
+if __name__ == "__main__":
+    main()
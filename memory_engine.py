@@ -0,0 +1,1930 @@
+#!/usr/bin/env python3
+"""
+Memory engine shared by the V1 and V2 MCP servers
+Qdrant client, embeddings, metrics, tracing and payload layouts live here once
+"""
+
+import asyncio
+import contextlib
+import functools
+import hashlib
+import importlib
+import json
+import logging
+import math
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Set, Tuple
+from uuid import uuid4
+
+import httpx
+from dotenv import load_dotenv
+
+try:
+    import orjson
+except ImportError:  # Optional: falls back to compact stdlib json
+    orjson = None
+
+
+class _LazyModule:
+    """Module proxy that imports on first attribute access"""
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr: str) -> Any:
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+# qdrant_client takes ~1s to import, so defer it until the first Qdrant call
+qdrant_client = _LazyModule("qdrant_client")
+models = _LazyModule("qdrant_client.http.models")
+numpy = _LazyModule("numpy")  # Only diversity reranking needs it
+
+# Load environment variables (.env next to the servers)
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
+QDRANT_PATH = os.getenv("QDRANT_PATH")  # Embedded storage directory or ":memory:" instead of a server
+QDRANT_PREFER_GRPC = os.getenv("QDRANT_PREFER_GRPC", "false").lower() in ("1", "true", "yes")
+QDRANT_GRPC_PORT = int(os.getenv("QDRANT_GRPC_PORT", "6334"))
+QDRANT_MAX_CONCURRENCY = int(os.getenv("QDRANT_MAX_CONCURRENCY", "16"))  # In-flight Qdrant calls
+QDRANT_TIMEOUT = float(os.getenv("QDRANT_TIMEOUT", "10"))                # Seconds per Qdrant call
+EMBEDDING_URL = os.getenv("EMBEDDING_URL", "https://api.openai.com/v1/embeddings")  # Or a compatible/stub server
+EMBEDDING_TIMEOUT = float(os.getenv("EMBEDDING_TIMEOUT", "10"))      # Seconds per embedding request attempt
+EMBEDDING_RETRIES = int(os.getenv("EMBEDDING_RETRIES", "2"))         # Retries of timeouts / 5xx / connection errors
+EMBEDDING_HEDGE = os.getenv("EMBEDDING_HEDGE", "false").lower() in ("1", "true", "yes")  # Hedge slow requests
+EMBEDDING_BREAKER_FAILURES = int(os.getenv("EMBEDDING_BREAKER_FAILURES", "3"))   # Failed calls that open it
+EMBEDDING_BREAKER_COOLDOWN = float(os.getenv("EMBEDDING_BREAKER_COOLDOWN", "30"))  # Seconds before a trial call
+KEYWORD_INDEX_TTL = float(os.getenv("KEYWORD_INDEX_TTL", "300"))     # Seconds a fallback keyword index is reused
+EMBEDDING_BATCH_WINDOW_MS = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "5"))  # Coalescing window
+EMBEDDING_BATCH_MAX = int(os.getenv("EMBEDDING_BATCH_MAX", "256"))              # Inputs per API call
+EMBEDDING_RPM = int(os.getenv("EMBEDDING_RPM", "0"))                 # Requests per minute budget (0 = none)
+EMBEDDING_TPM = int(os.getenv("EMBEDDING_TPM", "0"))                 # Tokens per minute budget (0 = none)
+EMBEDDING_RATE_LIMIT_RETRIES = int(os.getenv("EMBEDDING_RATE_LIMIT_RETRIES", "5"))  # Retries after a 429
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_DIMENSION = 1536
+SLOW_CALL_MS = float(os.getenv("SLOW_CALL_MS", "1000"))  # Log the span tree of slower requests
+
+# Write-behind: store_memory appends to a durable local log and returns at once;
+# a background worker embeds and upserts in batches, retrying failures
+WRITE_BEHIND = os.getenv("MEMORY_WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+WRITE_BEHIND_PATH = os.path.expanduser(os.getenv("MEMORY_WRITE_BEHIND_PATH", "~/.cache/qdrant-memory/write-behind.db"))
+WRITE_BEHIND_BATCH = int(os.getenv("MEMORY_WRITE_BEHIND_BATCH", "32"))        # Memories per embed/upsert
+WRITE_BEHIND_MAX_BACKOFF = float(os.getenv("MEMORY_WRITE_BEHIND_MAX_BACKOFF", "300"))  # Seconds
+
+# Layout new points are written in ("flat" or the legacy V1 "nested")
+PAYLOAD_SCHEMA = os.getenv("MEMORY_PAYLOAD_SCHEMA", "flat")
+
+# Vector layout of new collections: "single" (one vector of the whole document) or
+# "named" ("preview" = title + description, "content" = the document in chunks of
+# ~MEMORY_CONTENT_CHUNK_TOKENS, one MAX_SIM multivector)
+VECTOR_LAYOUT = os.getenv("MEMORY_VECTOR_LAYOUT", "single")
+CONTENT_CHUNK_TOKENS = int(os.getenv("MEMORY_CONTENT_CHUNK_TOKENS", "512"))
+NAMED_VECTORS = ("preview", "content")
+VECTOR_DIGEST_FIELDS = ("preview_digest", "content_digest")  # Text each named vector was embedded from
+
+# Project memories: "collection" keeps a proj-{name} collection per project; "shared" stores
+# every project in MEMORY_PROJECT_COLLECTION, partitioned by a tenant-indexed `project` field.
+# Either way callers address a project as proj-{name}
+PROJECT_TENANCY = os.getenv("MEMORY_PROJECT_TENANCY", "collection")
+PROJECT_COLLECTION = os.getenv("MEMORY_PROJECT_COLLECTION", "project-memories")
+PROJECT_PREFIX = "proj-"
+
+# Payload fields indexed in every memory collection (field -> Qdrant schema type),
+# so filters on them stay fast whatever the collection size
+PAYLOAD_INDEXES = {
+    "memory_type": "keyword",
+    "memory_level": "keyword",
+    "role": "keyword",
+    "tags": "keyword",
+    "skill_root": "keyword",
+}
+
+# Response encoding: compact JSON unless MEMORY_RESPONSE_INDENT is set (debugging)
+RESPONSE_INDENT = int(os.getenv("MEMORY_RESPONSE_INDENT", "0")) or None
+
+# Startup phases in milliseconds (imports, time to serve, warm-up)
+STARTUP_TIMINGS: Dict[str, float] = {}
+
+# Latency histogram bucket upper bounds (ms) and the stages each call is split into
+LATENCY_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, float("inf"))
+STAGES = ("embedding", "qdrant", "serialization")
+
+
+class ToolMetrics:
+    """Counters, latency histogram and per-stage time for one tool"""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.buckets = [0] * len(LATENCY_BUCKETS_MS)
+        self.latency_sum_ms = 0.0
+        self.latency_max_ms = 0.0
+        self.stage_ms = dict.fromkeys(STAGES, 0.0)
+        self.response_bytes = 0
+        self.response_max_bytes = 0
+
+    def observe(self, latency_ms: float, stage_ms: Dict[str, float], error: bool):
+        self.calls += 1
+        self.errors += int(error)
+        self.latency_sum_ms += latency_ms
+        self.latency_max_ms = max(self.latency_max_ms, latency_ms)
+        for i, bound in enumerate(LATENCY_BUCKETS_MS):
+            if latency_ms <= bound:
+                self.buckets[i] += 1
+                break
+        for stage, ms in stage_ms.items():
+            self.stage_ms[stage] = self.stage_ms.get(stage, 0.0) + ms
+
+    def record_response(self, size: int):
+        self.response_bytes += size
+        self.response_max_bytes = max(self.response_max_bytes, size)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Histogram estimate: upper bound of the bucket holding the q-th call, capped at the max seen"""
+        if not self.calls:
+            return None
+        rank = q * self.calls
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS_MS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.latency_max_ms)
+        return self.latency_max_ms
+
+    def snapshot(self) -> Dict[str, Any]:
+        calls = self.calls or 1
+        stages = {stage: round(ms / calls, 2) for stage, ms in self.stage_ms.items()}
+        mean_ms = self.latency_sum_ms / calls
+        stages["other"] = round(max(0.0, mean_ms - sum(stages.values())), 2)
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "latency_ms": {
+                "mean": round(mean_ms, 2),
+                "p50": self.quantile(0.50),
+                "p95": self.quantile(0.95),
+                "p99": self.quantile(0.99),
+                "max": round(self.latency_max_ms, 2)
+            },
+            "mean_stage_ms": stages,
+            "response_bytes": {
+                "total": self.response_bytes,
+                "mean": round(self.response_bytes / calls),
+                "max": self.response_max_bytes
+            }
+        }
+
+
+class ServerMetrics:
+    """Process-wide tool and cache metrics, shared by every session"""
+
+    def __init__(self):
+        self.started = time.time()
+        self.tools: Dict[str, ToolMetrics] = {}
+        self.caches: Dict[str, Dict[str, int]] = {}
+        self.gauges: Dict[str, Any] = {}  # Name -> zero-argument callable read at snapshot time
+
+    def tool(self, name: str) -> ToolMetrics:
+        metrics = self.tools.get(name)
+        if metrics is None:
+            metrics = self.tools[name] = ToolMetrics()
+        return metrics
+
+    def reset(self):
+        """Start counting from zero (benchmarks, between runs)"""
+        self.started = time.time()
+        self.tools.clear()
+        self.caches.clear()
+
+    def cache_lookup(self, cache: str, hit: bool):
+        counts = self.caches.setdefault(cache, {"hits": 0, "misses": 0})
+        counts["hits" if hit else "misses"] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        caches = {}
+        for name, counts in self.caches.items():
+            total = counts["hits"] + counts["misses"]
+            caches[name] = {**counts, "hit_rate": round(counts["hits"] / total, 3) if total else None}
+        return {
+            "uptime_seconds": round(time.time() - self.started, 1),
+            "tools": {name: metrics.snapshot() for name, metrics in sorted(self.tools.items())},
+            "caches": caches,
+            "gauges": {name: read() for name, read in sorted(self.gauges.items())},
+            "startup_ms": STARTUP_TIMINGS
+        }
+
+    def render_prometheus(self) -> str:
+        """Prometheus text exposition format"""
+        lines = [
+            "# HELP memory_tool_calls_total Tool calls handled",
+            "# TYPE memory_tool_calls_total counter",
+        ]
+        for name, m in sorted(self.tools.items()):
+            lines.append(f'memory_tool_calls_total{{tool="{name}"}} {m.calls}')
+        lines += ["# HELP memory_tool_errors_total Tool calls that returned an error",
+                  "# TYPE memory_tool_errors_total counter"]
+        for name, m in sorted(self.tools.items()):
+            lines.append(f'memory_tool_errors_total{{tool="{name}"}} {m.errors}')
+        lines += ["# HELP memory_tool_latency_seconds Tool call latency",
+                  "# TYPE memory_tool_latency_seconds histogram"]
+        for name, m in sorted(self.tools.items()):
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS_MS, m.buckets):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound / 1000:g}"
+                lines.append(f'memory_tool_latency_seconds_bucket{{tool="{name}",le="{le}"}} {cumulative}')
+            lines.append(f'memory_tool_latency_seconds_sum{{tool="{name}"}} {m.latency_sum_ms / 1000:.6f}')
+            lines.append(f'memory_tool_latency_seconds_count{{tool="{name}"}} {m.calls}')
+        lines += ["# HELP memory_tool_stage_seconds_total Time spent per stage",
+                  "# TYPE memory_tool_stage_seconds_total counter"]
+        for name, m in sorted(self.tools.items()):
+            for stage, ms in m.stage_ms.items():
+                lines.append(f'memory_tool_stage_seconds_total{{tool="{name}",stage="{stage}"}} {ms / 1000:.6f}')
+        lines += ["# HELP memory_tool_response_bytes_total Serialized response bytes",
+                  "# TYPE memory_tool_response_bytes_total counter"]
+        for name, m in sorted(self.tools.items()):
+            lines.append(f'memory_tool_response_bytes_total{{tool="{name}"}} {m.response_bytes}')
+        lines += ["# HELP memory_cache_lookups_total Cache lookups by result",
+                  "# TYPE memory_cache_lookups_total counter"]
+        for cache, counts in sorted(self.caches.items()):
+            lines.append(f'memory_cache_lookups_total{{cache="{cache}",result="hit"}} {counts["hits"]}')
+            lines.append(f'memory_cache_lookups_total{{cache="{cache}",result="miss"}} {counts["misses"]}')
+        for name, read in sorted(self.gauges.items()):
+            lines += [f"# TYPE memory_{name} gauge", f"memory_{name} {read()}"]
+        return "\n".join(lines) + "\n"
+
+
+METRICS = ServerMetrics()
+
+# Stage timings and error flag of the tool call running in the current task
+_current_call: ContextVar[Optional[Dict[str, Any]]] = ContextVar("current_call", default=None)
+
+
+def record_stage(stage: str, start: float, end: float):
+    """Attribute a perf_counter interval to a stage (embedding/qdrant/serialization) of the current tool call"""
+    call = _current_call.get()
+    if call is not None:
+        call["stages"].setdefault(stage, []).append((start, end))
+
+
+def wall_clock_ms(intervals: List[Tuple[float, float]]) -> float:
+    """Milliseconds covered by (start, end) intervals; concurrent sub-calls overlap and count once"""
+    total = 0.0
+    covered_until = float("-inf")
+    for start, end in sorted(intervals):
+        if end > covered_until:
+            total += end - max(start, covered_until)
+            covered_until = end
+    return total * 1000
+
+
+class Span:
+    """One timed step of a request (tool call, embedding, Qdrant call, encoding)"""
+
+    __slots__ = ("name", "request_id", "attrs", "root", "children", "error", "failed", "start", "end", "start_ns")
+
+    def __init__(self, name: str, request_id: str, attrs: Dict[str, Any], root: Optional["Span"] = None):
+        self.name = name
+        self.request_id = request_id
+        self.attrs = attrs
+        self.root = root or self
+        self.children: List["Span"] = []
+        self.error: Optional[str] = None
+        self.failed = False  # Set on the root when the request returned an error
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.start_ns = time.time_ns()  # Wall clock, for exporters
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end or time.perf_counter()) - self.start) * 1000
+
+    def render(self, depth: int = 0) -> List[str]:
+        """Indented one-line-per-span tree"""
+        attrs = " ".join(f"{k}={v}" for k, v in self.attrs.items() if v is not None)
+        line = f"{'  ' * depth}{self.name} {self.duration_ms:.1f}ms {attrs}".rstrip()
+        if self.error:
+            line += f" error={self.error!r}"
+        lines = [line]
+        for child in self.children:
+            lines.extend(child.render(depth + 1))
+        return lines
+
+
+# Innermost open span of the request running in the current task
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+@contextlib.contextmanager
+def span(name: str, stage: Optional[str] = None, request_id: Optional[str] = None,
+         trace: bool = False, **attrs):
+    """
+    Time a block as a child of the current span. Without a current span, a
+    `trace=True` span (tool calls) starts a new trace; other spans, such as
+    Qdrant calls during warm-up, are only timed. `stage` also attributes the
+    time to that stage of the current tool call's metrics.
+    """
+    parent = _current_span.get()
+    if request_id is None:
+        request_id = parent.request_id if parent is not None else uuid4().hex[:12]
+    current = Span(name, request_id, attrs, parent.root if parent is not None else None)
+    if parent is not None:
+        parent.children.append(current)
+    traced = parent is not None or trace
+    token = _current_span.set(current) if traced else None
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.end = time.perf_counter()
+        if token is not None:
+            _current_span.reset(token)
+        if stage:
+            record_stage(stage, current.start, current.end)
+        if parent is None and traced:
+            _finish_trace(current)
+
+
+def annotate(**attrs):
+    """Attach attributes (collection, limit, result count, ...) to the current span"""
+    current = _current_span.get()
+    if current is not None:
+        current.attrs.update(attrs)
+
+
+def _finish_trace(root: Span):
+    """Log slow or failed requests with their span tree and hand the trace to OpenTelemetry"""
+    slow = root.duration_ms >= SLOW_CALL_MS
+    if slow or root.failed or root.error:
+        kind = "Slow call" if slow else "Failed call"
+        logger.warning(f"{kind} [{root.request_id}]:\n" + "\n".join(root.render(1)))
+    tracer = _otel_tracer()
+    if tracer is not None:
+        try:
+            _export_otel(tracer, root)
+        except Exception as e:
+            logger.debug(f"OpenTelemetry export failed: {str(e)}")
+
+
+_otel_state: Dict[str, Any] = {}
+
+
+def _otel_tracer():
+    """OTLP/HTTP tracer when OTEL_EXPORTER_OTLP_ENDPOINT is set and the SDK is installed"""
+    if "tracer" not in _otel_state:
+        _otel_state["tracer"] = None
+        if os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"):
+            try:
+                from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+                from opentelemetry.sdk.resources import Resource
+                from opentelemetry.sdk.trace import TracerProvider
+                from opentelemetry.sdk.trace.export import BatchSpanProcessor
+            except ImportError:
+                logger.warning("OTEL_EXPORTER_OTLP_ENDPOINT is set but opentelemetry-sdk / "
+                               "opentelemetry-exporter-otlp-proto-http are not installed")
+            else:
+                provider = TracerProvider(resource=Resource.create({"service.name": "qdrant-memory-v2"}))
+                provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+                _otel_state["provider"] = provider
+                _otel_state["tracer"] = provider.get_tracer("qdrant-memory-v2")
+    return _otel_state["tracer"]
+
+
+def _export_otel(tracer, root: Span, context=None):
+    """Replay a finished span tree into OpenTelemetry with its original timestamps"""
+    from opentelemetry import trace
+    from opentelemetry.trace import Status, StatusCode
+
+    attributes = {"request_id": root.request_id}
+    for key, value in root.attrs.items():
+        if value is not None:
+            attributes[key] = value if isinstance(value, (str, bool, int, float)) else str(value)
+    otel_span = tracer.start_span(root.name, context=context, start_time=root.start_ns, attributes=attributes)
+    if root.error:
+        otel_span.set_status(Status(StatusCode.ERROR, root.error))
+    child_context = trace.set_span_in_context(otel_span)
+    for child in root.children:
+        _export_otel(tracer, child, child_context)
+    otel_span.end(end_time=root.start_ns + int(root.duration_ms * 1_000_000))
+
+
+def flush_traces():
+    """Send any buffered OpenTelemetry spans"""
+    provider = _otel_state.get("provider")
+    if provider is not None:
+        provider.force_flush()
+
+
+class RequestIdFilter(logging.Filter):
+    """Prefix log lines emitted while serving a request with its request id"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        current = _current_span.get()
+        if current is not None:
+            record.msg = f"[{current.request_id}] {record.msg}"
+        return True
+
+
+logger.addFilter(RequestIdFilter())
+
+
+def instrumented(method):
+    """Record calls, errors, latency and stage breakdown for an async MCP tool"""
+    tool = method.__name__
+
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        parent = _current_call.get()
+        call = {"stages": {}, "error": False}
+        token = _current_call.set(call)
+        start = time.perf_counter()
+        try:
+            with span(tool, trace=True):
+                return await method(*args, **kwargs)
+        except Exception:
+            call["error"] = True
+            raise
+        finally:
+            _current_call.reset(token)
+            stage_ms = {stage: wall_clock_ms(intervals) for stage, intervals in call["stages"].items()}
+            METRICS.tool(tool).observe((time.perf_counter() - start) * 1000, stage_ms, call["error"])
+            if parent is not None:
+                for stage, intervals in call["stages"].items():
+                    parent["stages"].setdefault(stage, []).extend(intervals)
+
+    return wrapper
+
+
+def dumps_compact(data: Any) -> str:
+    """Compact JSON (orjson when available), no stats bookkeeping"""
+    if orjson is not None:
+        return orjson.dumps(data, default=str).decode("utf-8")
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def encode_response(data: Any, tool: str = "unknown", error: bool = False) -> str:
+    """
+    Serialize a tool result as compact JSON and record its size and encode time.
+    Plain-text results (V1 tools) are passed through and only recorded; pass
+    `error=True` for plain-text error messages so the call counts as failed.
+    """
+    if error or (isinstance(data, dict) and "error" in data):
+        call = _current_call.get()
+        if call is not None:
+            call["error"] = True
+        current = _current_span.get()
+        if current is not None:
+            current.error = str(data["error"]) if isinstance(data, dict) and "error" in data else str(data)
+            current.root.failed = True
+
+    with span("format", stage="serialization") as encode_span:
+        if isinstance(data, str):
+            text = data
+        elif RESPONSE_INDENT:
+            text = json.dumps(data, indent=RESPONSE_INDENT, ensure_ascii=False, default=str)
+        else:
+            text = dumps_compact(data)
+        size = len(text.encode("utf-8"))
+        encode_span.attrs["bytes"] = size
+
+    METRICS.tool(tool).record_response(size)
+    return text
+
+
+def to_columnar(rows: List[Dict[str, Any]]) -> Dict[str, List[Any]]:
+    """Convert a list of uniform dicts into parallel arrays keyed by field name"""
+    columns: Dict[str, List[Any]] = {}
+    for key in (rows[0] if rows else {}):
+        columns[key] = [row.get(key) for row in rows]
+    return columns
+
+
+class FlatPayload:
+    """V2 layout: metadata fields at the top level next to the document"""
+
+    name = "flat"
+
+    def build(self, document: str, metadata: Dict[str, Any]) -> Dict[str, Any]:
+        return {"document": document, **metadata}
+
+
+class NestedPayload:
+    """V1 layout: metadata under a "metadata" key"""
+
+    name = "nested"
+
+    def build(self, document: str, metadata: Dict[str, Any]) -> Dict[str, Any]:
+        return {"document": document, "metadata": metadata}
+
+
+PAYLOAD_SCHEMAS = {schema.name: schema for schema in (FlatPayload(), NestedPayload())}
+
+
+def split_payload(payload: Optional[Dict[str, Any]]) -> Tuple[str, Dict[str, Any]]:
+    """Document and metadata of a point written in either layout (top-level fields win)"""
+    payload = payload or {}
+    metadata = {k: v for k, v in payload.items() if k not in ("document", "metadata", *VECTOR_DIGEST_FIELDS)}
+    nested = payload.get("metadata")
+    if isinstance(nested, dict):
+        metadata = {**nested, **metadata}
+    elif nested is not None:
+        metadata["metadata"] = nested
+    return payload.get("document", ""), metadata
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for rate budgeting (~4 characters per token)"""
+    return max(1, math.ceil(len(text) / 4))
+
+
+_token_encoding = None  # tiktoken encoding once loaded, False if tiktoken is unavailable
+
+
+def tokenizer_name() -> str:
+    """Tokenizer behind count_tokens (tiktoken is loaded on first use, not at import)"""
+    global _token_encoding
+    if _token_encoding is None:
+        try:
+            import tiktoken
+            _token_encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:  # Optional: falls back to ~4 bytes per token
+            _token_encoding = False
+    return "cl100k_base" if _token_encoding else "bytes/4"
+
+
+def count_tokens(text: str) -> int:
+    """Local token count of text as an LLM context would see it"""
+    tokenizer_name()
+    if _token_encoding:
+        return len(_token_encoding.encode(text))
+    return math.ceil(len(text.encode("utf-8")) / 4)
+
+
+class RateBudget:
+    """
+    Sliding one-minute budget of requests and tokens. acquire() waits until a
+    request of the given size fits; pause() holds every caller back (after a 429).
+    """
+
+    def __init__(self, rpm: int = 0, tpm: int = 0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._sent: deque = deque()  # (monotonic time, tokens) of requests in the last minute
+        self._tokens = 0
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self, tokens: int):
+        async with self._lock:  # First come, first served
+            while True:
+                now = time.monotonic()
+                while self._sent and now - self._sent[0][0] >= 60:
+                    self._tokens -= self._sent.popleft()[1]
+                wait = self._paused_until - now
+                if wait <= 0:
+                    over_rpm = self.rpm and len(self._sent) >= self.rpm
+                    # A request bigger than the whole budget goes alone once the window is empty
+                    over_tpm = self.tpm and self._sent and self._tokens + tokens > self.tpm
+                    if not over_rpm and not over_tpm:
+                        self._sent.append((now, tokens))
+                        self._tokens += tokens
+                        return
+                    wait = 60 - (now - self._sent[0][0])
+                await asyncio.sleep(wait)
+
+
+class EmbeddingUnavailable(Exception):
+    """The embedding endpoint keeps failing (or the circuit breaker is open)"""
+
+
+class CircuitBreaker:
+    """
+    Opens after `failures` consecutive failed calls so callers fail fast instead of
+    waiting on a broken upstream. After `cooldown` seconds one trial call is let
+    through (half-open): success closes the breaker, failure re-opens it.
+    """
+
+    def __init__(self, failures: int = EMBEDDING_BREAKER_FAILURES, cooldown: float = EMBEDDING_BREAKER_COOLDOWN):
+        self.failures = failures
+        self.cooldown = cooldown
+        self._consecutive = 0
+        self._opened_at: Optional[float] = None
+        self._trial = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self._opened_at >= self.cooldown else "open"
+
+    def allow(self) -> bool:
+        """Whether a call may go out now (claims the trial call when half-open)"""
+        state = self.state
+        if state == "half_open" and not self._trial:
+            self._trial = True
+            return True
+        return state == "closed"
+
+    def record_success(self):
+        if self._opened_at is not None:
+            logger.info("Embedding circuit breaker closed")
+        self._consecutive = 0
+        self._opened_at = None
+        self._trial = False
+
+    def record_failure(self):
+        self._consecutive += 1
+        if self._trial or self._consecutive >= self.failures:
+            if self._opened_at is None:
+                logger.warning(f"Embedding circuit breaker open for {self.cooldown:.0f}s "
+                               f"after {self._consecutive} failed calls")
+            self._opened_at = time.monotonic()
+        self._trial = False
+
+    def abandon(self):
+        """A call was cancelled before it had an outcome: free the trial slot"""
+        self._trial = False
+
+
+KEYWORD_TOKEN = re.compile(r"[a-z0-9]+")
+TITLE_FIELD = re.compile(r"\*\*Title:\*\*\s*([^\n]*)")
+DESCRIPTION_FIELD = re.compile(r"\*\*Description:\*\*\s*([^\n]*)")
+
+
+def keyword_terms(text: str) -> List[str]:
+    return KEYWORD_TOKEN.findall(text.lower())
+
+
+def keyword_text(payload: Optional[Dict[str, Any]]) -> str:
+    """Title, description and tags of a point: what the keyword fallback searches"""
+    document, metadata = split_payload(payload)
+    description = DESCRIPTION_FIELD.search(document)
+    title = metadata.get("title") or document.split("\n", 1)[0]
+    return " ".join([str(title), description.group(1) if description else "", " ".join(metadata.get("tags") or [])])
+
+
+def memory_preview(document: str, metadata: Dict[str, Any]) -> str:
+    """Title and description of a memory: the text behind its "preview" vector"""
+    title = TITLE_FIELD.search(document)
+    description = DESCRIPTION_FIELD.search(document)
+    preview = "\n".join([
+        str(metadata.get("title") or (title.group(1) if title else "")),
+        description.group(1) if description else ""
+    ]).strip()
+    return preview or document[:200]
+
+
+def content_chunks(document: str, max_tokens: int = CONTENT_CHUNK_TOKENS) -> List[str]:
+    """The document in paragraph-aligned chunks of at most ~max_tokens (one chunk if it fits)"""
+    max_chars = max_tokens * 4
+    if len(document) <= max_chars:
+        return [document]
+    chunks = []
+    current = ""
+    for paragraph in document.split("\n\n"):
+        for offset in range(0, max(len(paragraph), 1), max_chars):
+            piece = paragraph[offset:offset + max_chars]
+            if current and len(current) + 2 + len(piece) > max_chars:
+                chunks.append(current)
+                current = piece
+            else:
+                current = f"{current}\n\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def vector_digests(document: str, preview: str) -> Dict[str, str]:
+    """Digests stored next to named vectors, so unchanged texts are not re-embedded"""
+    return {
+        "preview_digest": hashlib.sha1(preview.encode("utf-8")).hexdigest(),
+        # Chunking settings are part of what the content vectors were built from
+        "content_digest": hashlib.sha1(f"{CONTENT_CHUNK_TOKENS}:{document}".encode("utf-8")).hexdigest()
+    }
+
+
+def mmr_select(vectors: List[List[float]], relevance: List[float], k: int, diversity: float) -> List[int]:
+    """
+    Maximal marginal relevance: indices of `k` candidates, each picked to maximize
+    (1 - diversity) * relevance - diversity * (max cosine similarity to those already picked)
+    """
+    matrix = numpy.asarray(vectors, dtype=numpy.float32)
+    matrix /= numpy.linalg.norm(matrix, axis=1, keepdims=True) + 1e-12
+    similarity = matrix @ matrix.T
+    relevance = numpy.asarray(relevance, dtype=numpy.float32)
+    redundancy = numpy.zeros(len(matrix), dtype=numpy.float32)
+    available = numpy.ones(len(matrix), dtype=bool)
+    selected = []
+    for _ in range(min(k, len(matrix))):
+        scores = (1 - diversity) * relevance - diversity * redundancy
+        scores[~available] = -numpy.inf
+        index = int(numpy.argmax(scores))
+        selected.append(index)
+        available[index] = False
+        redundancy = numpy.maximum(redundancy, similarity[index])
+    return selected
+
+
+def _point_vector(point: Any, vector: Optional[str]) -> List[float]:
+    """A point's vector for similarity between results (mean of the chunks for "content")"""
+    stored = point.vector
+    if not isinstance(stored, dict):
+        return stored
+    if vector == "content":
+        return numpy.asarray(stored["content"], dtype=numpy.float32).mean(axis=0)
+    return stored["preview"]
+
+
+class KeywordIndex:
+    """
+    In-memory BM25 index over the title, description and tags of every point in a
+    collection. It is the search used while embeddings are unavailable.
+    """
+
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[str, int]] = {}  # Term -> {point id: term frequency}
+        self.lengths: Dict[str, int] = {}              # Point id -> number of terms
+        self.built_at = time.monotonic()
+
+    def add(self, point_id: str, payload: Optional[Dict[str, Any]]):
+        self.remove(point_id)
+        terms = keyword_terms(keyword_text(payload))
+        self.lengths[point_id] = len(terms)
+        for term in terms:
+            frequencies = self.postings.setdefault(term, {})
+            frequencies[point_id] = frequencies.get(point_id, 0) + 1
+
+    def remove(self, point_id: str):
+        if self.lengths.pop(point_id, None) is None:
+            return
+        for term in [term for term, frequencies in self.postings.items() if point_id in frequencies]:
+            del self.postings[term][point_id]
+            if not self.postings[term]:
+                del self.postings[term]
+
+    def search(self, query: str, limit: int) -> List[Tuple[str, float]]:
+        """Top `limit` (point id, BM25 score) pairs for the query terms"""
+        count = len(self.lengths)
+        if not count:
+            return []
+        average_length = sum(self.lengths.values()) / count or 1
+        scores: Dict[str, float] = {}
+        for term in set(keyword_terms(query)):
+            frequencies = self.postings.get(term)
+            if not frequencies:
+                continue
+            idf = math.log(1 + (count - len(frequencies) + 0.5) / (len(frequencies) + 0.5))
+            for point_id, frequency in frequencies.items():
+                norm = self.K1 * (1 - self.B + self.B * self.lengths[point_id] / average_length)
+                scores[point_id] = scores.get(point_id, 0.0) + idf * frequency * (self.K1 + 1) / (frequency + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+
+class KeywordResults(list):
+    """Search results that came from the keyword fallback (scores are BM25, not cosine)"""
+
+
+class EmbeddingBatcher:
+    """
+    Coalesces embedding requests. Texts asked for within `window_ms` of each other
+    go out as one API call (up to `max_batch` inputs), a text already queued or in
+    flight is not requested again (single-flight), and calls are paced by a
+    RateBudget, backing off when the API answers 429.
+    """
+
+    def __init__(self, send, window_ms: float = EMBEDDING_BATCH_WINDOW_MS, max_batch: int = EMBEDDING_BATCH_MAX,
+                 budget: Optional[RateBudget] = None, rate_limit_retries: int = EMBEDDING_RATE_LIMIT_RETRIES):
+        self._send = send  # async (texts) -> vectors in input order
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.budget = budget or RateBudget(EMBEDDING_RPM, EMBEDDING_TPM)
+        self.rate_limit_retries = rate_limit_retries
+        self._futures: Dict[str, asyncio.Future] = {}  # Queued or in-flight text -> its vector
+        self._queue: List[str] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._dispatches = set()
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        """Vectors for `texts` in order; shared with concurrent callers asking for the same text"""
+        futures = [self._future_for(text) for text in texts]
+        # shield: one caller giving up must not cancel a vector other callers wait for
+        return list(await asyncio.gather(*(asyncio.shield(future) for future in futures)))
+
+    def _future_for(self, text: str) -> asyncio.Future:
+        future = self._futures.get(text)
+        if future is not None:
+            METRICS.cache_lookup("embedding_inflight", True)
+            return future
+        METRICS.cache_lookup("embedding_inflight", False)
+        loop = asyncio.get_running_loop()
+        future = self._futures[text] = loop.create_future()
+        self._queue.append(text)
+        if len(self._queue) >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self._flush)
+        return future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._queue = self._queue, []
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._dispatch(batch))
+            self._dispatches.add(task)
+            task.add_done_callback(self._dispatches.discard)
+
+    async def _dispatch(self, batch: List[str]):
+        # Runs for every caller in the batch: keep it out of the flushing call's trace and metrics
+        _current_span.set(None)
+        _current_call.set(None)
+        try:
+            vectors = await self._send_paced(batch)
+        except BaseException as e:
+            for text in batch:
+                future = self._futures.pop(text)
+                if not future.done():
+                    future.set_exception(e if isinstance(e, Exception) else RuntimeError("Embedding cancelled"))
+            if not isinstance(e, Exception):
+                raise
+        else:
+            for text, vector in zip(batch, vectors):
+                self._futures.pop(text).set_result(vector)
+
+    async def _send_paced(self, batch: List[str]) -> List[List[float]]:
+        tokens = sum(estimate_tokens(text) for text in batch)
+        for attempt in range(self.rate_limit_retries + 1):
+            await self.budget.acquire(tokens)
+            try:
+                return await self._send(batch)
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code != 429 or attempt == self.rate_limit_retries:
+                    raise
+                retry_after = e.response.headers.get("retry-after")
+                try:
+                    delay = float(retry_after)
+                except (TypeError, ValueError):
+                    delay = min(60.0, 2 ** attempt) * random.uniform(0.5, 1.0)
+                logger.warning(f"Embedding rate limited (429), backing off {delay:.1f}s")
+                self.budget.pause(delay)
+
+
+class WriteAheadLog:
+    """
+    Memories accepted by store_memory but not yet in Qdrant, in SQLite (WAL journal,
+    synchronous=FULL): an append has reached disk when it returns, so nothing queued
+    is lost if the process dies. Entries are removed only once their upsert succeeded.
+    """
+
+    def __init__(self, path: str):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=FULL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS pending ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT, doc_id TEXT NOT NULL, collection TEXT NOT NULL,"
+            " document TEXT NOT NULL, metadata TEXT NOT NULL, enqueued_at REAL NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0, next_attempt_at REAL NOT NULL DEFAULT 0, last_error TEXT,"
+            " generation INTEGER NOT NULL DEFAULT 0)"
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(pending)")}
+        if "generation" not in columns:  # Log written by an older version
+            self._db.execute("ALTER TABLE pending ADD COLUMN generation INTEGER NOT NULL DEFAULT 0")
+        self.depth = self._db.execute("SELECT COUNT(*) FROM pending").fetchone()[0]
+
+    def append(self, doc_id: str, collection_name: str, document: str, metadata: Dict[str, Any]):
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO pending (doc_id, collection, document, metadata, enqueued_at) VALUES (?, ?, ?, ?, ?)",
+                (doc_id, collection_name, document, json.dumps(metadata, default=str), time.time())
+            )
+            self.depth += 1
+
+    def due(self, limit: int) -> List[Tuple[int, str, str, str, Dict[str, Any], int, int]]:
+        """
+        Oldest entries whose retry time has come:
+        (seq, doc_id, collection, document, metadata, attempts, generation)
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT seq, doc_id, collection, document, metadata, attempts, generation FROM pending"
+                " WHERE next_attempt_at <= ? ORDER BY seq LIMIT ?",
+                (time.time(), limit)
+            ).fetchall()
+        return [(seq, doc_id, collection, document, json.loads(metadata), attempts, generation)
+                for seq, doc_id, collection, document, metadata, attempts, generation in rows]
+
+    def unchanged(self, entries: List[Tuple[int, int]]) -> List[int]:
+        """Seqs of the (seq, generation) entries still queued and not replaced since they were read"""
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT seq, generation FROM pending WHERE seq IN ({','.join('?' * len(entries))})",
+                [seq for seq, _ in entries]
+            ).fetchall()
+        current = set(rows)
+        return [seq for seq, generation in entries if (seq, generation) in current]
+
+    def next_retry_in(self) -> Optional[float]:
+        """Seconds until the earliest deferred entry is due (None when nothing is queued)"""
+        with self._lock:
+            (next_at,) = self._db.execute("SELECT MIN(next_attempt_at) FROM pending").fetchone()
+        return None if next_at is None else max(0.0, next_at - time.time())
+
+    def remove(self, entries: List[Tuple[int, int]]):
+        """Drop written (seq, generation) entries; one replaced in the meantime stays queued"""
+        with self._lock:
+            deleted = 0
+            for seq, generation in entries:
+                deleted += self._db.execute(
+                    "DELETE FROM pending WHERE seq = ? AND generation = ?", (seq, generation)
+                ).rowcount
+            self.depth -= deleted
+
+    def discard(self, collection_name: str, doc_ids: List[str]) -> int:
+        """Drop queued writes of these points; returns how many were dropped"""
+        with self._lock:
+            deleted = self._db.execute(
+                f"DELETE FROM pending WHERE collection = ? AND doc_id IN ({','.join('?' * len(doc_ids))})",
+                [collection_name] + [str(doc_id) for doc_id in doc_ids]
+            ).rowcount
+            self.depth -= deleted
+        return deleted
+
+    def replace(self, collection_name: str, doc_id: str, document: str, metadata: Dict[str, Any]) -> bool:
+        """Swap the text of a queued write; False if the point is not queued"""
+        with self._lock:
+            return self._db.execute(
+                "UPDATE pending SET document = ?, metadata = ?, generation = generation + 1"
+                " WHERE collection = ? AND doc_id = ?",
+                (document, json.dumps(metadata, default=str), collection_name, doc_id)
+            ).rowcount > 0
+
+    def defer(self, seqs: List[int], error: str, delay: float):
+        with self._lock:
+            self._db.execute(
+                f"UPDATE pending SET attempts = attempts + 1, next_attempt_at = ?, last_error = ?"
+                f" WHERE seq IN ({','.join('?' * len(seqs))})",
+                [time.time() + delay, error] + list(seqs)
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            oldest, retrying = self._db.execute(
+                "SELECT MIN(enqueued_at), SUM(attempts > 0) FROM pending"
+            ).fetchone()
+        return {
+            "depth": self.depth,
+            "retrying": retrying or 0,
+            "oldest_age_s": round(time.time() - oldest, 1) if oldest else None
+        }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def make_client(asynchronous: bool = True):
+    """Qdrant client for QDRANT_PATH (embedded) or QDRANT_URL; the sync one is for scripts"""
+    client_class = qdrant_client.AsyncQdrantClient if asynchronous else qdrant_client.QdrantClient
+    if QDRANT_PATH == ":memory:":
+        return client_class(location=":memory:")
+    if QDRANT_PATH:
+        return client_class(path=os.path.expanduser(QDRANT_PATH))
+    return client_class(
+        url=QDRANT_URL,
+        prefer_grpc=QDRANT_PREFER_GRPC,
+        grpc_port=QDRANT_GRPC_PORT,
+        timeout=int(QDRANT_TIMEOUT)
+    )
+
+
+def is_embedded(client) -> bool:
+    """Whether a (sync or async) client runs Qdrant in-process, where payload indexes do nothing"""
+    return type(getattr(client, "_client", client)).__name__ in ("QdrantLocal", "AsyncQdrantLocal")
+
+
+def project_collection_hnsw():
+    """HNSW config of the shared project collection"""
+    # Searches are always scoped to one project: build per-tenant graphs only
+    return models.HnswConfigDiff(payload_m=16, m=0)
+
+
+def tenant_index_schema():
+    """Schema of the shared project collection's `project` index"""
+    return models.KeywordIndexParams(type=models.KeywordIndexType.KEYWORD, is_tenant=True)
+
+
+class MemoryEngine:
+    """
+    Qdrant + embedding core behind both MCP servers: one pooled client, bounded
+    concurrent Qdrant calls with timeouts, cached embeddings, and the payload
+    layout (`payload_schema`) new points are written in. Points in either
+    layout are read back the same way.
+    """
+
+    def __init__(self, payload_schema: Optional[str] = None):
+        # Nothing here touches the network: the Qdrant client and collections
+        # are set up on first use (or by warm_up())
+        self.payload_schema = PAYLOAD_SCHEMAS[payload_schema or PAYLOAD_SCHEMA]
+        self._client = None
+        self._ready = False
+        self._ready_lock = asyncio.Lock()
+        self._http = httpx.AsyncClient(timeout=EMBEDDING_TIMEOUT)
+        self._qdrant_slots = asyncio.Semaphore(QDRANT_MAX_CONCURRENCY)
+        self._embedding_cache = {}
+        self._embedder = EmbeddingBatcher(self._request_embeddings)
+        self._breaker = CircuitBreaker()
+        self._embed_latencies: deque = deque(maxlen=200)  # Seconds per successful request, for hedging
+        self._keyword_indexes: Dict[str, KeywordIndex] = {}
+        self._keyword_lock = asyncio.Lock()
+        self._vector_layouts: Dict[str, str] = {}  # Collection -> "single" / "named"
+        self._known_tenants: Set[str] = set()  # Projects seen with points in the shared collection
+        self._token_counts: Dict[Tuple[str, str, str], Tuple[int, int]] = {}  # (collection, id, form) -> (hash, tokens)
+        METRICS.gauges["embedding_circuit_open"] = lambda: int(self._breaker.state != "closed")
+        self._wal: Optional[WriteAheadLog] = None
+        self._wal_worker: Optional[asyncio.Task] = None
+        self._wal_wakeup = asyncio.Event()
+        self._wal_lock = asyncio.Lock()  # Orders log reads/writes of the worker against deletes
+        self._wal_in_flight: Set[Tuple[str, str]] = set()   # (collection, id) being upserted by the worker
+        self._wal_tombstones: Set[Tuple[str, str]] = set()  # ... of those, deleted meanwhile
+        if WRITE_BEHIND:
+            self.enable_write_behind(WRITE_BEHIND_PATH)
+
+    @property
+    def client(self):
+        """Qdrant client, created (and qdrant_client imported) on first access"""
+        if self._client is None:
+            self._client = make_client()
+        return self._client
+
+    async def _ensure_ready(self):
+        """Run _init_collections once; retried on the next call if Qdrant was down"""
+        if self._ready:
+            return
+        async with self._ready_lock:
+            if not self._ready:
+                await self._init_collections()
+                self._ready = True
+        self.start_write_behind()  # Drain what a previous run left queued
+
+    async def _init_collections(self):
+        """Collections every call relies on; nothing by default"""
+
+    async def warm_up(self):
+        """Background startup task: import qdrant_client off the event loop, then connect"""
+        start = time.perf_counter()
+        self.start_write_behind()
+        try:
+            await asyncio.to_thread(importlib.import_module, "qdrant_client")
+            await self._ensure_ready()
+            STARTUP_TIMINGS["warmup_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            logger.info(f"Warm-up complete in {STARTUP_TIMINGS['warmup_ms']}ms")
+        except Exception as e:
+            logger.warning(f"Warm-up failed, will retry on first use: {str(e)}")
+
+    async def _qdrant_call(self, operation, *args, **kwargs):
+        """Run one Qdrant client call under the concurrency limit and per-call timeout"""
+        collection_name = kwargs.get("collection_name", args[0] if args else None)
+        async with self._qdrant_slots:
+            with span(f"qdrant.{operation.__name__}", stage="qdrant", collection=collection_name):
+                return await asyncio.wait_for(operation(*args, **kwargs), timeout=QDRANT_TIMEOUT)
+
+    async def _qdrant(self, operation, *args, **kwargs):
+        """Like _qdrant_call, but makes sure _init_collections has run first"""
+        await self._ensure_ready()
+        return await self._qdrant_call(operation, *args, **kwargs)
+
+    async def close(self):
+        """Stop the write-behind worker (queued memories stay on disk) and release the connection pools"""
+        if self._wal_worker is not None:
+            self._wal_worker.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._wal_worker
+            self._wal_worker = None
+        if self._wal is not None:
+            self._wal.close()
+        if self._client is not None:
+            await self._client.close()
+        await self._http.aclose()
+
+    @property
+    def embeddings_degraded(self) -> bool:
+        """True while the circuit breaker keeps embedding calls from going out"""
+        return self._breaker.state != "closed"
+
+    async def _request_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeddings for `texts` (in input order) through the circuit breaker: timeouts,
+        5xx and connection errors are retried with jittered backoff, and a call that
+        still fails raises EmbeddingUnavailable. Other HTTP errors (429 included) pass through.
+        """
+        if not self._breaker.allow():
+            raise EmbeddingUnavailable("Embedding circuit breaker is open")
+        try:
+            for attempt in range(EMBEDDING_RETRIES + 1):
+                if attempt:
+                    await asyncio.sleep(min(5.0, 0.25 * 2 ** attempt) * random.uniform(0.5, 1.5))
+                try:
+                    vectors = await self._hedged_post(texts)
+                except httpx.HTTPStatusError as e:
+                    if e.response.status_code < 500:
+                        self._breaker.record_success()  # The endpoint is up, just refusing this call
+                        raise
+                    error = e
+                except (httpx.TransportError, asyncio.TimeoutError) as e:
+                    error = e
+                else:
+                    self._breaker.record_success()
+                    return vectors
+                logger.warning(f"Embedding attempt {attempt + 1} failed: {type(error).__name__}: {str(error)}")
+        except asyncio.CancelledError:
+            self._breaker.abandon()
+            raise
+        self._breaker.record_failure()
+        raise EmbeddingUnavailable(f"Embedding failed after {EMBEDDING_RETRIES + 1} attempts") from error
+
+    async def _hedged_post(self, texts: List[str]) -> List[List[float]]:
+        """
+        With EMBEDDING_HEDGE, a request still unanswered after the p95 latency of recent
+        requests gets a duplicate; the first successful answer wins
+        """
+        if not EMBEDDING_HEDGE or len(self._embed_latencies) < 20:
+            return await self._post_embeddings(texts)
+        latencies = sorted(self._embed_latencies)
+        delay = latencies[int(0.95 * (len(latencies) - 1))]
+
+        pending = {asyncio.ensure_future(self._post_embeddings(texts))}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if done:
+                return done.pop().result()
+            logger.debug(f"Hedging embedding request after {delay * 1000:.0f}ms")
+            pending.add(asyncio.ensure_future(self._post_embeddings(texts)))
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                if not pending:
+                    return done.pop().result()  # Both failed: raise the later error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _post_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """One embeddings API request for all `texts`; vectors in input order"""
+        headers = {
+            "Authorization": f"Bearer {OPENAI_API_KEY}",
+            "Content-Type": "application/json"
+        }
+
+        data = {
+            "input": texts,
+            "model": EMBEDDING_MODEL
+        }
+
+        start = time.perf_counter()
+        response = await self._http.post(
+            EMBEDDING_URL,
+            headers=headers,
+            json=data
+        )
+        response.raise_for_status()
+        items = sorted(response.json()["data"], key=lambda item: item.get("index", 0))
+        self._embed_latencies.append(time.perf_counter() - start)
+        return [item["embedding"] for item in items]
+
+    async def _get_embedding(self, text: str) -> List[float]:
+        """Get embedding from OpenAI with caching"""
+        cached = self._embedding_cache.get(text)
+        METRICS.cache_lookup("embedding", cached is not None)
+        if cached is not None:
+            annotate(embedding_cached=True)
+            return cached
+
+        # Coalesced with concurrent requests into one batched API call
+        with span("embed", stage="embedding", model=EMBEDDING_MODEL, chars=len(text)):
+            embedding = (await self._embedder.embed([text]))[0]
+
+        # Cache for session
+        self._embedding_cache[text] = embedding
+        return embedding
+
+    async def _get_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Embeddings for many texts; the uncached ones are sent in as few requests as possible"""
+        missing = {}  # Ordered set: duplicates are embedded once
+        for text in texts:
+            cached = text in self._embedding_cache
+            METRICS.cache_lookup("embedding", cached)
+            if not cached:
+                missing[text] = None
+
+        if missing:
+            missing = list(missing)
+            with span("embed", stage="embedding", model=EMBEDDING_MODEL, inputs=len(missing),
+                      chars=sum(len(text) for text in missing)):
+                embeddings = await self._embedder.embed(missing)
+            for text, embedding in zip(missing, embeddings):
+                self._embedding_cache[text] = embedding
+        return [self._embedding_cache[text] for text in texts]
+
+    def resolve_collection(self, collection_name: str) -> Tuple[str, Optional[str]]:
+        """Qdrant collection and tenant (project, or None) behind a memory collection name"""
+        if PROJECT_TENANCY == "shared" and collection_name.startswith(PROJECT_PREFIX):
+            return PROJECT_COLLECTION, collection_name[len(PROJECT_PREFIX):]
+        return collection_name, None
+
+    @staticmethod
+    def _tenant_filter(project: Optional[str], query_filter: Optional[Any] = None) -> Optional[Any]:
+        """`query_filter` narrowed to one project's points (unchanged without a tenant)"""
+        if project is None:
+            return query_filter
+        condition = models.FieldCondition(key="project", match=models.MatchValue(value=project))
+        return models.Filter(must=[condition] if query_filter is None else [condition, query_filter])
+
+    async def create_collection(self, collection_name: str):
+        """Create a memory collection with its payload indexes"""
+        logger.info(f"Creating collection '{collection_name}'")
+        shared = PROJECT_TENANCY == "shared" and collection_name == PROJECT_COLLECTION
+        if VECTOR_LAYOUT == "named":
+            vectors_config = {
+                "preview": models.VectorParams(size=EMBEDDING_DIMENSION, distance=models.Distance.COSINE),
+                "content": models.VectorParams(
+                    size=EMBEDDING_DIMENSION,
+                    distance=models.Distance.COSINE,
+                    multivector_config=models.MultiVectorConfig(comparator=models.MultiVectorComparator.MAX_SIM)
+                )
+            }
+        else:
+            vectors_config = models.VectorParams(size=EMBEDDING_DIMENSION, distance=models.Distance.COSINE)
+        await self._qdrant_call(
+            self.client.create_collection,
+            collection_name=collection_name,
+            vectors_config=vectors_config,
+            hnsw_config=project_collection_hnsw() if shared else None
+        )
+        self._vector_layouts[collection_name] = "named" if VECTOR_LAYOUT == "named" else "single"
+        if is_embedded(self.client):
+            return  # Embedded Qdrant ignores payload indexes (and warns about them)
+        if shared:
+            await self._qdrant_call(
+                self.client.create_payload_index,
+                collection_name=collection_name,
+                field_name="project",
+                field_schema=tenant_index_schema()
+            )
+        for field_name, field_schema in PAYLOAD_INDEXES.items():
+            await self._qdrant_call(
+                self.client.create_payload_index,
+                collection_name=collection_name,
+                field_name=field_name,
+                field_schema=models.PayloadSchemaType(field_schema)
+            )
+
+    async def ensure_collection(self, collection_name: str) -> bool:
+        """Create the (Qdrant) collection if it is missing; True when it was created"""
+        collection_name, _ = self.resolve_collection(collection_name)
+        try:
+            await self._qdrant(self.client.get_collection, collection_name)
+            return False
+        except Exception:
+            await self.create_collection(collection_name)
+            return True
+
+    async def has_collection(self, collection_name: str) -> bool:
+        """Whether the collection exists (for a shared-collection project: has any points)"""
+        physical, project = self.resolve_collection(collection_name)
+        try:
+            if project is None:
+                await self._qdrant(self.client.get_collection, physical)
+                return True
+            if project in self._known_tenants:
+                return True
+            # One point is enough: an exact count would scan the whole tenant on every search
+            records, _ = await self._qdrant(
+                self.client.scroll,
+                collection_name=physical,
+                scroll_filter=self._tenant_filter(project),
+                limit=1,
+                with_payload=False,
+                with_vectors=False
+            )
+            if records:
+                self._known_tenants.add(project)
+            return bool(records)
+        except Exception:
+            return False
+
+    async def vector_layout(self, collection_name: str) -> str:
+        """"named" (preview + content vectors) or "single", read once from the collection config"""
+        layout = self._vector_layouts.get(collection_name)
+        if layout is None:
+            info = await self._qdrant(self.client.get_collection, collection_name)
+            layout = "named" if isinstance(info.config.params.vectors, dict) else "single"
+            self._vector_layouts[collection_name] = layout
+        return layout
+
+    async def search_points(self, collection_name: str, query: str, limit: int, vector: Optional[str] = None) -> list:
+        """
+        Embed the query and return the top `limit` scored points with payloads.
+        In named-vector collections `vector` picks "preview" or "content"; by default
+        both are searched and each point keeps its better score. While embeddings are
+        unavailable, falls back to keyword_search.
+        """
+        if vector not in (None, "fused", *NAMED_VECTORS):
+            raise ValueError(f"Unknown vector '{vector}' (expected preview, content or fused)")
+        try:
+            query_embedding = await self._get_embedding(query)
+        except EmbeddingUnavailable as e:
+            logger.warning(f"{str(e)}; keyword search in '{collection_name}'")
+            annotate(search_mode="keyword")
+            return await self.keyword_search(collection_name, query, limit)
+        return await self._search_embedding(collection_name, query_embedding, limit, vector)
+
+    async def search_collections(self, collection_names: List[str], query: str, limit: int,
+                                 vector: Optional[str] = None) -> Dict[str, list]:
+        """
+        Top `limit` points of each collection for one query, embedded once. Qdrant
+        cannot batch searches across collections in one request, so the sub-searches
+        run concurrently instead. A collection that cannot be searched (e.g. does not
+        exist yet) yields no points.
+        """
+        if vector not in (None, "fused", *NAMED_VECTORS):
+            raise ValueError(f"Unknown vector '{vector}' (expected preview, content or fused)")
+        try:
+            query_embedding = await self._get_embedding(query)
+        except EmbeddingUnavailable as e:
+            logger.warning(f"{str(e)}; keyword search in {len(collection_names)} collections")
+            annotate(search_mode="keyword")
+            query_embedding = None
+
+        async def search(collection_name: str) -> list:
+            try:
+                if query_embedding is None:
+                    return await self.keyword_search(collection_name, query, limit)
+                return await self._search_embedding(collection_name, query_embedding, limit, vector)
+            except Exception as e:
+                logger.warning(f"Search in '{collection_name}' failed: {str(e)}")
+                return KeywordResults() if query_embedding is None else []
+
+        results = await asyncio.gather(*[search(collection_name) for collection_name in collection_names])
+        return dict(zip(collection_names, results))
+
+    async def recommend_points(self, collection_name: str, positive: List[str], negative: Optional[List[str]] = None,
+                               limit: int = 10, source: Optional[str] = None, vector: Optional[str] = None) -> list:
+        """
+        Points of the collection most like the `positive` example ids and least like the
+        `negative` ones. Examples are looked up by id in `source` (default: the same
+        collection) and their stored vectors are used, so nothing is embedded.
+        """
+        physical, project = self.resolve_collection(collection_name)
+        source_physical, _ = self.resolve_collection(source or collection_name)
+        # Named-vector collections compare previews unless told otherwise; "" is the unnamed vector
+        name = vector if vector in NAMED_VECTORS else "preview"
+        using = name if await self.vector_layout(physical) == "named" else None
+        lookup_from = None
+        if source_physical != physical:
+            lookup_vector = name if await self.vector_layout(source_physical) == "named" else ""
+            lookup_from = models.LookupLocation(collection=source_physical, vector=lookup_vector)
+        response = await self._qdrant(
+            self.client.query_points,
+            collection_name=physical,
+            query=models.RecommendQuery(recommend=models.RecommendInput(positive=positive, negative=negative or None)),
+            using=using,
+            lookup_from=lookup_from,
+            query_filter=self._tenant_filter(project),
+            limit=limit,
+            with_payload=True
+        )
+        return response.points
+
+    async def recommend_collections(self, collection_names: List[str], positive: List[str],
+                                    negative: Optional[List[str]] = None, limit: int = 10,
+                                    source: Optional[str] = None, vector: Optional[str] = None) -> Dict[str, list]:
+        """
+        recommend_points in several collections at once (concurrently), with examples from
+        `source`. Unknown example ids raise ValueError; a collection that cannot be
+        searched yields no points.
+        """
+        source = source or collection_names[0]
+        examples = list(dict.fromkeys([*positive, *(negative or [])]))
+        # Also keeps examples to the source's own tenant in a shared project collection
+        found = {str(point.id) for point in await self.retrieve_points(source, examples)}
+        unknown = [doc_id for doc_id in examples if doc_id not in found]
+        if unknown:
+            raise ValueError(f"Memories not found in '{source}': {', '.join(unknown)}")
+
+        async def recommend(collection_name: str) -> list:
+            try:
+                return await self.recommend_points(collection_name, positive, negative, limit, source, vector)
+            except Exception as e:
+                logger.warning(f"Recommend in '{collection_name}' failed: {str(e)}")
+                return []
+
+        results = await asyncio.gather(*[recommend(collection_name) for collection_name in collection_names])
+        return dict(zip(collection_names, results))
+
+    async def _search_embedding(self, collection_name: str, query_embedding: List[float], limit: int,
+                                vector: Optional[str] = None, with_vectors: bool = False) -> list:
+        """Vector search of an embedded query in one collection (scoped to its tenant)"""
+        physical, project = self.resolve_collection(collection_name)
+        query_filter = self._tenant_filter(project)
+        if await self.vector_layout(physical) == "named":
+            return await self._search_named(physical, query_embedding, limit, vector, query_filter, with_vectors)
+        return await self._qdrant(
+            self.client.search,
+            collection_name=physical,
+            query_vector=query_embedding,
+            query_filter=query_filter,
+            limit=limit,
+            with_payload=True,
+            with_vectors=with_vectors
+        )
+
+    async def search_diverse(self, collection_name: str, query: str, limit: int, diversity: float = 0.5,
+                             vector: Optional[str] = None, candidates: Optional[int] = None) -> list:
+        """
+        search_points reranked by maximal marginal relevance: the `candidates` nearest
+        points (default 4 x limit) are fetched with their vectors, and `limit` of them
+        are picked that are relevant but unlike each other. diversity=0 keeps the plain
+        ranking; higher values trade relevance for variety.
+        """
+        if not 0 <= diversity <= 1:
+            raise ValueError("diversity must be between 0 and 1")
+        try:
+            query_embedding = await self._get_embedding(query)
+        except EmbeddingUnavailable as e:
+            logger.warning(f"{str(e)}; keyword search in '{collection_name}'")
+            annotate(search_mode="keyword")
+            return await self.keyword_search(collection_name, query, limit)
+
+        points = await self._search_embedding(collection_name, query_embedding, candidates or limit * 4,
+                                              vector, with_vectors=True)
+        if len(points) > limit:
+            with span("mmr", candidates=len(points)):
+                selected = mmr_select([_point_vector(point, vector) for point in points],
+                                      [point.score for point in points], limit, diversity)
+            points = [points[index] for index in selected]
+        for point in points:
+            point.vector = None  # Only needed for the rerank
+        return points
+
+    async def search_groups(self, collection_name: str, query: str, group_by: str, limit: int,
+                            group_size: int = 3, vector: Optional[str] = None) -> List[Tuple[Any, list]]:
+        """
+        Qdrant grouped search: the best `group_size` hits for each of the top `limit`
+        values of payload field `group_by`, as (value, points) pairs. Named-vector
+        collections group on one vector ("preview" unless `vector` is "content").
+        """
+        try:
+            query_embedding = await self._get_embedding(query)
+        except EmbeddingUnavailable as e:
+            logger.warning(f"{str(e)}; keyword search in '{collection_name}'")
+            annotate(search_mode="keyword")
+            groups: Dict[Any, list] = {}
+            for point in await self.keyword_search(collection_name, query, limit * group_size * 4):
+                values = split_payload(point.payload)[1].get(group_by)
+                for value in values if isinstance(values, list) else [values]:
+                    if value is None or (value not in groups and len(groups) >= limit):
+                        continue
+                    hits = groups.setdefault(value, KeywordResults())
+                    if len(hits) < group_size:
+                        hits.append(point)
+            return list(groups.items())
+
+        physical, project = self.resolve_collection(collection_name)
+        using = None
+        query_input = query_embedding
+        if await self.vector_layout(physical) == "named":
+            using = "content" if vector == "content" else "preview"
+            query_input = [query_embedding] if using == "content" else query_embedding
+        response = await self._qdrant(
+            self.client.query_points_groups,
+            collection_name=physical,
+            query=query_input,
+            using=using,
+            group_by=group_by,
+            limit=limit,
+            group_size=group_size,
+            query_filter=self._tenant_filter(project),
+            with_payload=True
+        )
+        return [(group.id, group.hits) for group in response.groups]
+
+    async def _search_named(self, collection_name: str, query_embedding: List[float], limit: int,
+                            vector: Optional[str], query_filter: Optional[Any] = None,
+                            with_vectors: bool = False) -> list:
+        """Search one named vector, or both in one batch request fused by best score per point"""
+        names = [vector] if vector in NAMED_VECTORS else list(NAMED_VECTORS)
+        annotate(vectors=",".join(names))
+        responses = await self._qdrant(
+            self.client.query_batch_points,
+            collection_name=collection_name,
+            requests=[
+                models.QueryRequest(
+                    # "content" is a multivector: MAX_SIM of the query against every chunk
+                    query=query_embedding if name == "preview" else [query_embedding],
+                    using=name,
+                    filter=query_filter,
+                    limit=limit,
+                    with_payload=True,
+                    # Both requests return the vector results are compared on (see _point_vector)
+                    with_vector=["content" if vector == "content" else "preview"] if with_vectors else False
+                )
+                for name in names
+            ]
+        )
+        best: Dict[str, Any] = {}
+        for response in responses:
+            for point in response.points:
+                key = str(point.id)
+                if key not in best or point.score > best[key].score:
+                    best[key] = point
+        return sorted(best.values(), key=lambda point: point.score, reverse=True)[:limit]
+
+    async def _keyword_index(self, collection_name: str) -> KeywordIndex:
+        """The collection's keyword index, (re)built from its payloads when missing or stale"""
+        async with self._keyword_lock:
+            index = self._keyword_indexes.get(collection_name)
+            if index is not None and time.monotonic() - index.built_at < KEYWORD_INDEX_TTL:
+                return index
+            with span("keyword_index.build", collection=collection_name):
+                index = KeywordIndex()
+                offset = None
+                while True:
+                    records, offset = await self.scroll_points(
+                        collection_name,
+                        limit=512,
+                        offset=offset,
+                        with_payload=["document", "title", "tags", "metadata"],
+                        with_vectors=False
+                    )
+                    for record in records:
+                        index.add(str(record.id), record.payload)
+                    if offset is None:
+                        break
+                annotate(points=len(index.lengths))
+            self._keyword_indexes[collection_name] = index
+            return index
+
+    async def keyword_search(self, collection_name: str, query: str, limit: int) -> list:
+        """BM25 search over titles, descriptions and tags; scored points like search_points"""
+        index = await self._keyword_index(collection_name)
+        hits = index.search(query, limit)
+        if not hits:
+            return KeywordResults()
+        points = {str(point.id): point for point in await self.retrieve_points(collection_name, [i for i, _ in hits])}
+        return KeywordResults(
+            models.ScoredPoint(id=points[point_id].id, version=0, score=score, payload=points[point_id].payload)
+            for point_id, score in hits
+            if point_id in points
+        )
+
+    def _index_keywords(self, collection_name: str, points: list):
+        """Keep an already-built keyword index current with points this engine writes"""
+        index = self._keyword_indexes.get(collection_name)
+        if index is not None:
+            for point in points:
+                index.add(str(point.id), point.payload)
+
+    async def retrieve_points(self, collection_name: str, doc_ids: List[str]) -> list:
+        """Points (with payloads, without vectors) for the given ids; unknown ids are skipped"""
+        physical, project = self.resolve_collection(collection_name)
+        points = await self._qdrant(
+            self.client.retrieve,
+            collection_name=physical,
+            ids=doc_ids,
+            with_payload=True,
+            with_vectors=False
+        )
+        if project is not None:  # Another project's point is as good as missing
+            points = [point for point in points if (point.payload or {}).get("project") == project]
+        return points
+
+    def point_tokens(self, collection_name: str, point_id: str, form: str, text: str) -> int:
+        """count_tokens of one rendering (`form`) of a point, cached until that text changes"""
+        key = (collection_name, point_id, form)
+        digest = hash(text)
+        cached = self._token_counts.get(key)
+        hit = cached is not None and cached[0] == digest
+        METRICS.cache_lookup("tokens", hit)
+        if hit:
+            return cached[1]
+        tokens = count_tokens(text)
+        self._token_counts[key] = (digest, tokens)
+        return tokens
+
+    async def scroll_points(self, collection_name: str, scroll_filter: Optional[Any] = None, **kwargs) -> tuple:
+        """One scroll page (records, next offset) of the collection, optionally filtered"""
+        physical, project = self.resolve_collection(collection_name)
+        return await self._qdrant(
+            self.client.scroll,
+            collection_name=physical,
+            scroll_filter=self._tenant_filter(project, scroll_filter),
+            **kwargs
+        )
+
+    async def upsert_memory(self, collection_name: str, document: str, metadata: Dict[str, Any],
+                            doc_id: Optional[str] = None) -> str:
+        """Embed and write one memory in this engine's payload layout; returns its id"""
+        physical, project = self.resolve_collection(collection_name)
+        if project is not None:
+            metadata = {**metadata, "project": project}
+        points = await self._build_points(physical, [(doc_id or str(uuid4()), document, metadata)],
+                                          existing=doc_id is not None)
+        doc_id = str(points[0].id)
+        await self._qdrant(self.client.upsert, collection_name=physical, points=points)
+        self._index_keywords(collection_name, points)
+        return doc_id
+
+    async def _build_points(self, collection_name: str, memories: List[Tuple[str, str, Dict[str, Any]]],
+                            existing: bool = True) -> list:
+        """
+        Points for (doc_id, document, metadata) triples in the collection's vector layout,
+        embedding everything in one request. For named vectors, a stored point whose
+        preview (or content) text is unchanged keeps that vector instead of re-embedding it.
+        """
+        if await self.vector_layout(collection_name) != "named":
+            embeddings = await self._get_embeddings([document for _, document, _ in memories])
+            return [
+                models.PointStruct(
+                    id=doc_id,
+                    vector=embedding,
+                    payload=self.payload_schema.build(document, metadata)
+                )
+                for (doc_id, document, metadata), embedding in zip(memories, embeddings)
+            ]
+
+        previews = [memory_preview(document, metadata) for _, document, metadata in memories]
+        chunks = [content_chunks(document) for _, document, _ in memories]
+        digests = {str(doc_id): vector_digests(document, preview)
+                   for (doc_id, document, _), preview in zip(memories, previews)}
+        kept = await self._stored_vectors(collection_name, digests) if existing else {}
+
+        texts = {}  # Ordered set of texts that need embedding
+        for (doc_id, _, _), preview, doc_chunks in zip(memories, previews, chunks):
+            stored = kept.get(str(doc_id), {})
+            if "preview" not in stored:
+                texts[preview] = None
+            if "content" not in stored:
+                texts.update(dict.fromkeys(doc_chunks))
+        embeddings = dict(zip(texts, await self._get_embeddings(list(texts)))) if texts else {}
+
+        points = []
+        for (doc_id, document, metadata), preview, doc_chunks in zip(memories, previews, chunks):
+            stored = kept.get(str(doc_id), {})
+            vectors = {
+                "preview": stored.get("preview") or embeddings[preview],
+                "content": stored.get("content") or [embeddings[chunk] for chunk in doc_chunks]
+            }
+            payload = {**self.payload_schema.build(document, metadata), **digests[str(doc_id)]}
+            points.append(models.PointStruct(id=doc_id, vector=vectors, payload=payload))
+        return points
+
+    async def _stored_vectors(self, collection_name: str,
+                              digests: Dict[str, Dict[str, str]]) -> Dict[str, Dict[str, Any]]:
+        """Stored named vectors whose source text still matches `digests` (point id -> name -> vector)"""
+        stored = await self._qdrant(
+            self.client.retrieve,
+            collection_name=collection_name,
+            ids=list(digests),
+            with_payload=list(VECTOR_DIGEST_FIELDS),
+            with_vectors=False
+        )
+        reusable = {}
+        for point in stored:
+            payload = point.payload or {}
+            expected = digests.get(str(point.id), {})
+            names = [name for name in NAMED_VECTORS
+                     if payload.get(f"{name}_digest") and payload.get(f"{name}_digest") == expected.get(f"{name}_digest")]
+            if names:
+                reusable[str(point.id)] = names
+        if not reusable:
+            return {}
+
+        # Fetch only the vectors that can be kept
+        points = await self._qdrant(
+            self.client.retrieve,
+            collection_name=collection_name,
+            ids=list(reusable),
+            with_payload=False,
+            with_vectors=sorted({name for names in reusable.values() for name in names})
+        )
+        return {
+            str(point.id): {name: point.vector[name] for name in reusable[str(point.id)] if name in (point.vector or {})}
+            for point in points
+        }
+
+    async def count_points(self, collection_name: str) -> int:
+        """Number of points stored in the collection"""
+        physical, project = self.resolve_collection(collection_name)
+        if project is None:
+            return (await self._qdrant(self.client.get_collection, physical)).points_count
+        return (await self._qdrant(
+            self.client.count,
+            collection_name=physical,
+            count_filter=self._tenant_filter(project),
+            exact=True
+        )).count
+
+    async def upsert_memories(self, collection_name: str,
+                              memories: List[Tuple[str, str, Dict[str, Any]]]) -> int:
+        """Embed and write (doc_id, document, metadata) triples with one embedding
+        request and one upsert; returns how many were written"""
+        if not memories:
+            return 0
+        physical, points = await self._memory_points(collection_name, memories)
+        await self._qdrant(self.client.upsert, collection_name=physical, points=points)
+        self._index_keywords(collection_name, points)
+        return len(memories)
+
+    async def _memory_points(self, collection_name: str,
+                             memories: List[Tuple[str, str, Dict[str, Any]]]) -> Tuple[str, list]:
+        """Qdrant collection and embedded points (not yet written) for (doc_id, document, metadata) triples"""
+        physical, project = self.resolve_collection(collection_name)
+        if project is not None:
+            memories = [(doc_id, document, {**metadata, "project": project}) for doc_id, document, metadata in memories]
+        return physical, await self._build_points(physical, memories)
+
+    async def delete_points(self, collection_name: str, doc_ids: List[str]) -> int:
+        """Delete points by id; returns the number of points left in the collection"""
+        physical, project = self.resolve_collection(collection_name)
+        if project is None:
+            points_selector = models.PointIdsList(points=doc_ids)
+        else:  # Only this project's points, even if another project's id is passed
+            points_selector = models.FilterSelector(
+                filter=self._tenant_filter(project, models.HasIdCondition(has_id=doc_ids))
+            )
+        if self._wal is not None:
+            # A queued (or in-flight) write of the point would otherwise bring it back
+            async with self._wal_lock:
+                await asyncio.to_thread(self._wal.discard, collection_name, doc_ids)
+                self._wal_tombstones.update(
+                    (collection_name, str(doc_id)) for doc_id in doc_ids
+                    if (collection_name, str(doc_id)) in self._wal_in_flight
+                )
+        await self._qdrant(self.client.delete, collection_name=physical, points_selector=points_selector)
+        index = self._keyword_indexes.get(collection_name)
+        if index is not None:
+            for doc_id in doc_ids:
+                index.remove(str(doc_id))
+        remaining = await self.count_points(collection_name)
+        if project is not None and not remaining:
+            self._known_tenants.discard(project)
+        return remaining
+
+    async def delete_collection(self, collection_name: str):
+        """Drop a memory collection (for a shared-collection project: all of its points)"""
+        physical, project = self.resolve_collection(collection_name)
+        if project is None:
+            await self._qdrant_call(self.client.delete_collection, physical)
+            self._vector_layouts.pop(physical, None)
+            if PROJECT_TENANCY == "shared" and physical == PROJECT_COLLECTION:
+                self._known_tenants.clear()
+                for name in [name for name in self._keyword_indexes if name.startswith(PROJECT_PREFIX)]:
+                    del self._keyword_indexes[name]
+        else:
+            await self._qdrant_call(
+                self.client.delete,
+                collection_name=physical,
+                points_selector=models.FilterSelector(filter=self._tenant_filter(project))
+            )
+            self._known_tenants.discard(project)
+        self._keyword_indexes.pop(collection_name, None)
+
+    # Write-behind
+
+    @property
+    def write_behind(self) -> bool:
+        return self._wal is not None
+
+    def enable_write_behind(self, path: str):
+        """Queue stores in a durable log at `path`; see enqueue_memory"""
+        self._wal = WriteAheadLog(path)
+        METRICS.gauges["write_queue_depth"] = lambda: self.write_queue_depth
+        if self._wal.depth:
+            logger.info(f"{self._wal.depth} queued memories from a previous run will be written")
+
+    def start_write_behind(self):
+        """Start the background worker (idempotent); needs a running event loop"""
+        if self._wal is not None and (self._wal_worker is None or self._wal_worker.done()):
+            self._wal_worker = asyncio.create_task(self._drain_write_behind())
+
+    async def enqueue_memory(self, collection_name: str, document: str, metadata: Dict[str, Any],
+                             doc_id: Optional[str] = None) -> str:
+        """Durably queue a memory for the background worker; returns its id without embedding"""
+        doc_id = doc_id or str(uuid4())
+        with span("wal.append", collection=collection_name):
+            await asyncio.to_thread(self._wal.append, doc_id, collection_name, document, metadata)
+        self.start_write_behind()
+        self._wal_wakeup.set()
+        return doc_id
+
+    async def update_queued(self, collection_name: str, doc_id: str, document: str,
+                            metadata: Dict[str, Any]) -> bool:
+        """Replace a memory still in the write-behind queue; False if it is not queued (any more)"""
+        if self._wal is None:
+            return False
+        # A write of the old text already in flight keeps its entry queued, so this text follows it
+        return await asyncio.to_thread(self._wal.replace, collection_name, doc_id, document, metadata)
+
+    @property
+    def write_queue_depth(self) -> int:
+        return self._wal.depth if self._wal is not None else 0
+
+    def write_queue_stats(self) -> Optional[Dict[str, Any]]:
+        return self._wal.stats() if self._wal is not None else None
+
+    async def _drain_write_behind(self):
+        """Background worker: embed and upsert queued memories in batches until cancelled"""
+        # Started from inside a tool call: don't attribute this work to it
+        _current_span.set(None)
+        _current_call.set(None)
+        ensured = set()
+        while True:
+            self._wal_wakeup.clear()
+            entries = await asyncio.to_thread(self._wal.due, WRITE_BEHIND_BATCH)
+            by_collection: Dict[str, list] = {}
+            for entry in entries:
+                by_collection.setdefault(entry[2], []).append(entry)
+            for collection_name, batch in by_collection.items():
+                with span("write_behind", trace=True, collection=collection_name, memories=len(batch)):
+                    if collection_name not in ensured:
+                        with contextlib.suppress(Exception):  # The upsert reports a real failure
+                            await self.ensure_collection(collection_name)
+                            ensured.add(collection_name)
+                    await self._write_behind_batch(collection_name, batch)
+
+            if not entries:
+                delay = await asyncio.to_thread(self._wal.next_retry_in)
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._wal_wakeup.wait(), timeout=delay)
+
+    async def _write_behind_batch(self, collection_name: str, batch: list):
+        """
+        Upsert one batch; if it fails, retry entries one by one so a bad one can't hold back the rest.
+        The lock is only held around log reads and writes, never while embedding or upserting:
+        entries deleted or replaced while their vectors were computed are skipped, and
+        points deleted while the upsert was in flight are deleted again after it.
+        """
+        try:
+            physical, points = await self._memory_points(
+                collection_name, [(doc_id, document, metadata) for _, doc_id, _, document, metadata, _, _ in batch]
+            )
+            async with self._wal_lock:
+                live = set(await asyncio.to_thread(self._wal.unchanged, [(entry[0], entry[6]) for entry in batch]))
+                written = [entry for entry in batch if entry[0] in live]
+                keys = {(collection_name, entry[1]) for entry in written}
+                self._wal_in_flight |= keys
+            try:
+                points = [point for point, entry in zip(points, batch) if entry[0] in live]
+                if points:
+                    await self._qdrant(self.client.upsert, collection_name=physical, points=points)
+                    self._index_keywords(collection_name, points)
+            finally:
+                async with self._wal_lock:
+                    self._wal_in_flight -= keys
+                    deleted = [doc_id for _, doc_id in keys & self._wal_tombstones]
+                    self._wal_tombstones -= keys
+            async with self._wal_lock:
+                await asyncio.to_thread(self._wal.remove, [(entry[0], entry[6]) for entry in written])
+            if deleted:
+                await self.delete_points(collection_name, deleted)
+            return
+        except Exception as e:
+            if len(batch) == 1:
+                attempts = batch[0][5] + 1
+                delay = min(WRITE_BEHIND_MAX_BACKOFF, 2 ** attempts)
+                logger.warning(f"Write-behind of '{batch[0][1]}' to '{collection_name}' failed "
+                               f"(attempt {attempts}), retrying in {delay:.0f}s: {str(e)}")
+                await asyncio.to_thread(self._wal.defer, [batch[0][0]], str(e), delay)
+                return
+        for entry in batch:
+            await self._write_behind_batch(collection_name, [entry])
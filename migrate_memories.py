@@ -8,20 +8,24 @@ import json
 from pathlib import Path
 from datetime import datetime
 from typing import List, Dict
-import requests
 from openai import OpenAI
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
 from dotenv import load_dotenv
 
 # Load environment
 load_dotenv()
 
 # Configuration
-QDRANT_URL = "http://localhost:6333"
+QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
+QDRANT_PATH = os.getenv("QDRANT_PATH")  # Embedded storage directory instead of a server
 COLLECTION_NAME = "coder-memory"
+VECTOR_SIZE = 1536
 CODER_MEMORY_PATH = Path.home() / ".claude/skills/coder-memory-store"
 
-# Initialize OpenAI client
+# Initialize OpenAI and Qdrant clients
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+qdrant = QdrantClient(path=os.path.expanduser(QDRANT_PATH)) if QDRANT_PATH else QdrantClient(url=QDRANT_URL)
 
 def parse_memories_from_file(file_path: Path) -> List[Dict]:
     """Parse memories from a markdown file."""
@@ -115,32 +119,24 @@ def insert_to_qdrant(memory: Dict) -> bool:
         point_id = str(uuid.uuid4())
         timestamp = datetime.utcnow().isoformat() + 'Z'
 
+        # Flat layout: metadata next to the document, like the servers write it
         payload = {
             'document': memory['full_text'],
-            'metadata': {
-                'memory_level': 'coder',
-                'memory_type': memory['memory_type'],
-                'file_path': memory['file_path'],
-                'skill_root': 'coder-memory-store',
-                'tags': memory['tags'],
-                'title': memory['title'],
-                'created_at': timestamp,
-                'last_synced': timestamp,
-            }
+            'memory_level': 'coder',
+            'memory_type': memory['memory_type'],
+            'file_path': memory['file_path'],
+            'skill_root': 'coder-memory-store',
+            'tags': memory['tags'],
+            'title': memory['title'],
+            'created_at': timestamp,
+            'last_synced': timestamp,
         }
 
         # Insert to Qdrant
-        url = f"{QDRANT_URL}/collections/{COLLECTION_NAME}/points"
-        data = {
-            'points': [{
-                'id': point_id,
-                'vector': embedding,
-                'payload': payload
-            }]
-        }
-
-        response = requests.put(url, json=data)
-        response.raise_for_status()
+        qdrant.upsert(
+            collection_name=COLLECTION_NAME,
+            points=[models.PointStruct(id=point_id, vector=embedding, payload=payload)]
+        )
 
         print(f"  ✓ Inserted: {point_id}")
         return True
@@ -168,6 +164,13 @@ def main():
 
     print(f"Found {len(memory_files)} files to process\n")
 
+    # Embedded storage starts empty, so the collection may not exist yet
+    if not qdrant.collection_exists(COLLECTION_NAME):
+        qdrant.create_collection(
+            collection_name=COLLECTION_NAME,
+            vectors_config=models.VectorParams(size=VECTOR_SIZE, distance=models.Distance.COSINE)
+        )
+
     # Parse and insert memories
     total_memories = 0
     success_count = 0
@@ -193,11 +196,8 @@ def main():
     print()
 
     # Verify collection
-    response = requests.get(f"{QDRANT_URL}/collections/{COLLECTION_NAME}")
-    if response.ok:
-        data = response.json()
-        points_count = data['result']['points_count']
-        print(f"Qdrant collection '{COLLECTION_NAME}' now has {points_count} points")
+    points_count = qdrant.get_collection(COLLECTION_NAME).points_count
+    print(f"Qdrant collection '{COLLECTION_NAME}' now has {points_count} points")
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Payload schema migration: nested V1 metadata -> flat indexed fields
+Rewrites points written as {"document", "metadata": {...}} in place to the flat
+V2 layout and creates the payload indexes every memory collection is expected to have
+"""
+
+import argparse
+import logging
+from typing import Any, Dict, List
+
+from qdrant_client.http import models
+
+from memory_engine import PAYLOAD_INDEXES, VECTOR_DIGEST_FIELDS, is_embedded, make_client, split_payload
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+class PayloadMigration:
+    def __init__(self, batch_size: int = 256, dry_run: bool = False):
+        self.client = make_client(asynchronous=False)
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.report = {
+            "collections": {},
+            "points_flattened": 0,
+            "indexes_created": 0,
+            "errors": []
+        }
+
+    def memory_collections(self) -> List[str]:
+        """All collections in the store"""
+        return sorted(c.name for c in self.client.get_collections().collections)
+
+    def flatten_collection(self, collection_name: str) -> int:
+        """Overwrite nested payloads with their flat form; returns points rewritten"""
+        flattened = 0
+        scanned = 0
+        offset = None
+
+        while True:
+            records, offset = self.client.scroll(
+                collection_name=collection_name,
+                limit=self.batch_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=False
+            )
+
+            # One overwrite per nested point, all sent in a single batch request
+            operations = []
+            for record in records:
+                if not isinstance((record.payload or {}).get("metadata"), dict):
+                    continue
+                document, metadata = split_payload(record.payload)
+                # Not metadata, but needed to reuse the named vectors when the memory is updated
+                digests = {field: record.payload[field] for field in VECTOR_DIGEST_FIELDS if field in record.payload}
+                operations.append(models.OverwritePayloadOperation(
+                    overwrite_payload=models.SetPayload(
+                        payload={"document": document, **metadata, **digests},
+                        points=[record.id]
+                    )
+                ))
+
+            if operations and not self.dry_run:
+                self.client.batch_update_points(
+                    collection_name=collection_name,
+                    update_operations=operations,
+                    wait=True
+                )
+
+            scanned += len(records)
+            flattened += len(operations)
+            if offset is None:
+                break
+
+        logger.info(f"'{collection_name}': {flattened}/{scanned} points "
+                    f"{'would be ' if self.dry_run else ''}flattened")
+        return flattened
+
+    def create_indexes(self, collection_name: str) -> int:
+        """Create the missing payload indexes; returns how many were (or would be) created"""
+        if is_embedded(self.client):
+            return 0  # Embedded Qdrant ignores payload indexes
+        existing = self.client.get_collection(collection_name).payload_schema or {}
+        missing = {field: schema for field, schema in PAYLOAD_INDEXES.items() if field not in existing}
+
+        for field_name, field_schema in missing.items():
+            if not self.dry_run:
+                self.client.create_payload_index(
+                    collection_name=collection_name,
+                    field_name=field_name,
+                    field_schema=models.PayloadSchemaType(field_schema),
+                    wait=True
+                )
+            logger.info(f"'{collection_name}': index on '{field_name}' ({field_schema})")
+        return len(missing)
+
+    def run(self, collections: List[str], indexes: bool = True) -> Dict[str, Any]:
+        """Flatten (and index) each collection; errors are recorded, not raised"""
+        if self.dry_run:
+            logger.info("DRY RUN MODE - No changes will be made")
+
+        for collection_name in collections or self.memory_collections():
+            try:
+                flattened = self.flatten_collection(collection_name)
+                created = self.create_indexes(collection_name) if indexes else 0
+                self.report["collections"][collection_name] = {
+                    "flattened": flattened,
+                    "indexes_created": created
+                }
+                self.report["points_flattened"] += flattened
+                self.report["indexes_created"] += created
+            except Exception as e:
+                logger.error(f"Failed to migrate '{collection_name}': {e}")
+                self.report["errors"].append(f"{collection_name}: {str(e)}")
+
+        self.print_report()
+        return self.report
+
+    def print_report(self):
+        """Print migration report"""
+        logger.info("=" * 60)
+        logger.info("PAYLOAD MIGRATION REPORT")
+        logger.info("=" * 60)
+        logger.info(f"Collections: {len(self.report['collections'])}")
+        logger.info(f"Points flattened: {self.report['points_flattened']}")
+        logger.info(f"Indexes created: {self.report['indexes_created']}")
+        if self.report["errors"]:
+            logger.error(f"Errors: {len(self.report['errors'])}")
+            for error in self.report["errors"]:
+                logger.error(f"   - {error}")
+        else:
+            logger.info("No errors encountered")
+
+
+def main():
+    """Main migration function"""
+    parser = argparse.ArgumentParser(description="Flatten nested memory payloads and create payload indexes")
+    parser.add_argument("collections", nargs="*", help="Collections to migrate (default: all)")
+    parser.add_argument("--batch-size", type=int, default=256, help="Points per scroll / update batch")
+    parser.add_argument("--no-indexes", action="store_true", help="Only flatten payloads")
+    parser.add_argument("--dry-run", action="store_true", help="Count what would change without writing")
+    args = parser.parse_args()
+
+    report = PayloadMigration(args.batch_size, args.dry_run).run(args.collections, not args.no_indexes)
+    if report["errors"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Project tenancy migration: proj-* collections -> one shared project collection
+Copies every point of each per-project collection (vectors included, nothing is
+re-embedded) into MEMORY_PROJECT_COLLECTION with a tenant-indexed `project` field,
+so the servers can run with MEMORY_PROJECT_TENANCY=shared
+"""
+
+import argparse
+import logging
+from typing import Any, Dict, List
+
+from qdrant_client.http import models
+
+from memory_engine import (
+    PAYLOAD_INDEXES, PROJECT_COLLECTION, PROJECT_PREFIX,
+    is_embedded, make_client, project_collection_hnsw, tenant_index_schema
+)
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+class ProjectCollectionMigration:
+    def __init__(self, target: str = PROJECT_COLLECTION, batch_size: int = 256,
+                 drop_sources: bool = False, dry_run: bool = False):
+        self.client = make_client(asynchronous=False)
+        self.target = target
+        self.batch_size = batch_size
+        self.drop_sources = drop_sources
+        self.dry_run = dry_run
+        self.report = {
+            "collections": {},
+            "points_copied": 0,
+            "collections_dropped": 0,
+            "errors": []
+        }
+
+    def project_collections(self) -> List[str]:
+        """All per-project collections in the store"""
+        return sorted(c.name for c in self.client.get_collections().collections
+                      if c.name.startswith(PROJECT_PREFIX))
+
+    def ensure_target(self, source_name: str):
+        """Create the shared collection like the source one (same vectors) with a tenant index"""
+        source = self.client.get_collection(source_name).config.params.vectors
+        if self.client.collection_exists(self.target):
+            target = self.client.get_collection(self.target).config.params.vectors
+            if target != source:
+                raise ValueError(f"vector config differs from '{self.target}'")
+            return
+        if self.dry_run:
+            return
+
+        logger.info(f"Creating '{self.target}'")
+        self.client.create_collection(
+            collection_name=self.target,
+            vectors_config=source,
+            hnsw_config=project_collection_hnsw()
+        )
+        if is_embedded(self.client):
+            return  # Embedded Qdrant ignores payload indexes
+        self.client.create_payload_index(
+            collection_name=self.target,
+            field_name="project",
+            field_schema=tenant_index_schema(),
+            wait=True
+        )
+        for field_name, field_schema in PAYLOAD_INDEXES.items():
+            self.client.create_payload_index(
+                collection_name=self.target,
+                field_name=field_name,
+                field_schema=models.PayloadSchemaType(field_schema),
+                wait=True
+            )
+
+    def fold_collection(self, collection_name: str) -> int:
+        """Copy one project collection into the target; returns points copied"""
+        project = collection_name[len(PROJECT_PREFIX):]
+        self.ensure_target(collection_name)
+        copied = 0
+        offset = None
+
+        while True:
+            records, offset = self.client.scroll(
+                collection_name=collection_name,
+                limit=self.batch_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=True
+            )
+
+            # Point ids are shared by all tenants: never overwrite another project's point
+            if records and not self.dry_run and self.client.collection_exists(self.target):
+                taken = self.client.retrieve(
+                    collection_name=self.target,
+                    ids=[record.id for record in records],
+                    with_payload=["project"],
+                    with_vectors=False
+                )
+                clashes = [str(point.id) for point in taken if (point.payload or {}).get("project") != project]
+                if clashes:
+                    raise ValueError(f"{len(clashes)} point ids already used by other projects (e.g. {clashes[0]})")
+
+            if records and not self.dry_run:
+                self.client.upsert(
+                    collection_name=self.target,
+                    points=[
+                        models.PointStruct(
+                            id=record.id,
+                            vector=record.vector,
+                            payload={**(record.payload or {}), "project": project}
+                        )
+                        for record in records
+                    ],
+                    wait=True
+                )
+
+            copied += len(records)
+            if offset is None:
+                break
+
+        logger.info(f"'{collection_name}': {copied} points {'would be ' if self.dry_run else ''}"
+                    f"copied to '{self.target}' as project '{project}'")
+        return copied
+
+    def verify(self, collection_name: str) -> bool:
+        """Whether the target holds as many points for the project as the source collection"""
+        project = collection_name[len(PROJECT_PREFIX):]
+        expected = self.client.count(collection_name, exact=True).count
+        actual = self.client.count(
+            self.target,
+            count_filter=models.Filter(must=[
+                models.FieldCondition(key="project", match=models.MatchValue(value=project))
+            ]),
+            exact=True
+        ).count
+        if actual != expected:
+            logger.error(f"'{collection_name}': {expected} points but {actual} in '{self.target}'")
+        return actual == expected
+
+    def run(self, collections: List[str]) -> Dict[str, Any]:
+        """Fold each collection (and drop it once verified); errors are recorded, not raised"""
+        if self.dry_run:
+            logger.info("DRY RUN MODE - No changes will be made")
+
+        for collection_name in collections or self.project_collections():
+            try:
+                copied = self.fold_collection(collection_name)
+                dropped = False
+                if self.drop_sources and not self.dry_run:
+                    if not self.verify(collection_name):
+                        raise ValueError("point counts differ, source kept")
+                    self.client.delete_collection(collection_name)
+                    logger.info(f"Dropped '{collection_name}'")
+                    dropped = True
+                self.report["collections"][collection_name] = {"copied": copied, "dropped": dropped}
+                self.report["points_copied"] += copied
+                self.report["collections_dropped"] += int(dropped)
+            except Exception as e:
+                logger.error(f"Failed to fold '{collection_name}': {e}")
+                self.report["errors"].append(f"{collection_name}: {str(e)}")
+
+        self.print_report()
+        return self.report
+
+    def print_report(self):
+        """Print migration report"""
+        logger.info("=" * 60)
+        logger.info("PROJECT COLLECTION MIGRATION REPORT")
+        logger.info("=" * 60)
+        logger.info(f"Target: {self.target}")
+        logger.info(f"Collections: {len(self.report['collections'])}")
+        logger.info(f"Points copied: {self.report['points_copied']}")
+        logger.info(f"Collections dropped: {self.report['collections_dropped']}")
+        if self.report["errors"]:
+            logger.error(f"Errors: {len(self.report['errors'])}")
+            for error in self.report["errors"]:
+                logger.error(f"   - {error}")
+        else:
+            logger.info("No errors encountered")
+
+
+def main():
+    """Main migration function"""
+    parser = argparse.ArgumentParser(description="Fold proj-* collections into one multitenant project collection")
+    parser.add_argument("collections", nargs="*", help="Project collections to fold (default: all proj-*)")
+    parser.add_argument("--target", default=PROJECT_COLLECTION,
+                        help=f"Shared project collection (default: {PROJECT_COLLECTION})")
+    parser.add_argument("--batch-size", type=int, default=256, help="Points per scroll / upsert batch")
+    parser.add_argument("--drop-sources", action="store_true",
+                        help="Delete each proj-* collection once its points are verified in the target")
+    parser.add_argument("--dry-run", action="store_true", help="Count what would be copied without writing")
+    args = parser.parse_args()
+
+    report = ProjectCollectionMigration(args.target, args.batch_size, args.drop_sources, args.dry_run).run(
+        args.collections
+    )
+    if report["errors"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
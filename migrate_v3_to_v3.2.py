@@ -26,6 +26,7 @@ logger = logging.getLogger(__name__)
 
 # Configuration
 QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
+QDRANT_PATH = os.getenv("QDRANT_PATH")  # Embedded storage directory instead of a server
 
 # Collection mapping from V3 to V3.2
 COLLECTION_MAPPING = {
@@ -50,7 +51,10 @@ NEW_COLLECTIONS = [
 
 class MigrationManager:
     def __init__(self):
-        self.client = QdrantClient(url=QDRANT_URL)
+        if QDRANT_PATH:
+            self.client = QdrantClient(path=os.path.expanduser(QDRANT_PATH))
+        else:
+            self.client = QdrantClient(url=QDRANT_URL)
         self.migration_report = {
             "collections_migrated": [],
             "collections_created": [],
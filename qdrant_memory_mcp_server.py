@@ -3,38 +3,45 @@
 
 Provides memory-specific CRUD + search tools for Claude Code memory skills.
 Auto-routes to correct collection based on memory_level (coder vs project).
+Qdrant, embeddings and metrics come from memory_engine, shared with the V2 server.
+New points are written flat like V2 (MEMORY_PAYLOAD_SCHEMA=nested keeps the old
+{"document", "metadata": {...}} layout); points in either layout are read back.
 """
 
-import os
+import contextlib
+import logging
 import re
-import uuid
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Dict, Any
 from datetime import datetime
 
 from dotenv import load_dotenv
 from mcp.server.fastmcp import FastMCP
-from openai import OpenAI
-from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, PointIdsList, PointStruct, VectorParams
 
 # Load environment - specify absolute path to .env file
 # This ensures it works regardless of which directory Claude Code runs from
+# (before memory_engine reads its configuration)
 script_dir = Path(__file__).parent.resolve()
 env_file = script_dir / ".env"
 load_dotenv(dotenv_path=env_file)
 
-# Configuration
-QDRANT_URL = "http://localhost:6333"
-EMBEDDING_MODEL = "text-embedding-3-small"
-VECTOR_SIZE = 1536
+from memory_engine import KeywordResults, MemoryEngine, encode_response, instrumented, split_payload
+
+logger = logging.getLogger(__name__)
+
+# Qdrant client and embeddings are set up on first use, so the MCP handshake
+# does not wait on them (or on Qdrant being reachable)
+engine = MemoryEngine()
+
+
+@contextlib.asynccontextmanager
+async def lifespan(server: FastMCP):
+    engine.start_write_behind()  # Drain what a previous run left queued
+    yield
 
-# Initialize clients
-qdrant_client = QdrantClient(url=QDRANT_URL)
-openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 # Create MCP server
-mcp = FastMCP("Memory")
+mcp = FastMCP("Memory", lifespan=lifespan)
 
 
 def get_collection_name(memory_level: str) -> str:
@@ -59,7 +66,7 @@ def get_collection_name(memory_level: str) -> str:
         raise ValueError(f"Invalid memory_level: {memory_level}. Must be 'coder' or 'project'")
 
 
-def ensure_collection_exists(collection_name: str) -> bool:
+async def ensure_collection_exists(collection_name: str) -> bool:
     """Ensure collection exists, create if not.
 
     Args:
@@ -69,38 +76,16 @@ def ensure_collection_exists(collection_name: str) -> bool:
         True if collection exists or was created successfully
     """
     try:
-        collections = qdrant_client.get_collections().collections
-        collection_exists = any(col.name == collection_name for col in collections)
-
-        if not collection_exists:
-            qdrant_client.create_collection(
-                collection_name=collection_name,
-                vectors_config=VectorParams(size=VECTOR_SIZE, distance=Distance.COSINE),
-            )
+        await engine.ensure_collection(collection_name)
         return True
     except Exception as e:
-        print(f"Error ensuring collection exists: {e}")
+        logger.error(f"Error ensuring collection exists: {e}")
         return False
 
 
-def generate_embedding(text: str) -> list[float]:
-    """Generate embedding using OpenAI.
-
-    Args:
-        text: Text to embed
-
-    Returns:
-        Embedding vector
-    """
-    response = openai_client.embeddings.create(
-        input=text,
-        model=EMBEDDING_MODEL
-    )
-    return response.data[0].embedding
-
-
 @mcp.tool()
-def search_memory(
+@instrumented
+async def search_memory(
     query: str,
     memory_level: str,
     limit: int = 5
@@ -119,29 +104,22 @@ def search_memory(
         collection_name = get_collection_name(memory_level)
 
         # Check if collection exists
-        if not ensure_collection_exists(collection_name):
-            return f"Error: Could not access collection for memory_level '{memory_level}'"
-
-        # Generate embedding for query
-        query_embedding = generate_embedding(query)
+        if not await ensure_collection_exists(collection_name):
+            return encode_response(f"Error: Could not access collection for memory_level '{memory_level}'", tool="search_memory", error=True)
 
-        # Search
-        search_results = qdrant_client.search(
-            collection_name=collection_name,
-            query_vector=query_embedding,
-            limit=limit,
-            with_payload=True
-        )
+        # Embed the query and search
+        search_results = await engine.search_points(collection_name, query, limit)
 
         if not search_results:
-            return f"No memories found in '{collection_name}' (memory_level: {memory_level})"
+            return encode_response(f"No memories found in '{collection_name}' (memory_level: {memory_level})", tool="search_memory")
 
         # Format results
         results = [f"Found {len(search_results)} similar memories in '{collection_name}':\n"]
+        if isinstance(search_results, KeywordResults):
+            results.insert(0, "Note: embeddings unavailable, results ranked by keyword match (BM25 scores)")
         for idx, result in enumerate(search_results, 1):
-            payload = result.payload
-            metadata = payload.get('metadata', {})
-            document = payload.get('document', 'N/A')
+            document, metadata = split_payload(result.payload)
+            document = document or 'N/A'
 
             similarity = result.score
             doc_id = result.id
@@ -161,14 +139,15 @@ def search_memory(
             results.append(f"   Content: {document[:200]}...")
             results.append("")
 
-        return "\n".join(results)
+        return encode_response("\n".join(results), tool="search_memory")
 
     except Exception as e:
-        return f"Error searching memories: {str(e)}"
+        return encode_response(f"Error searching memories: {str(e)}", tool="search_memory", error=True)
 
 
 @mcp.tool()
-def store_memory(
+@instrumented
+async def store_memory(
     document: str,
     metadata: Dict[str, Any],
     memory_level: str
@@ -186,40 +165,42 @@ def store_memory(
     try:
         collection_name = get_collection_name(memory_level)
 
-        # Ensure collection exists
-        if not ensure_collection_exists(collection_name):
-            return f'{{"error": "Could not access collection for memory_level \'{memory_level}\'"}}'
-
-        # Generate embedding
-        embedding = generate_embedding(document)
-
         # Add memory_level to metadata
         metadata['memory_level'] = memory_level
 
-        # Prepare payload
-        payload = {
-            'document': document,
-            'metadata': metadata
-        }
+        if engine.write_behind:
+            # Durably queued; the collection is created and the memory embedded in the background
+            point_id = await engine.enqueue_memory(collection_name, document, metadata)
+            return encode_response({
+                "id": point_id,
+                "collection": collection_name,
+                "queue_depth": engine.write_queue_depth,
+                "status": "queued"
+            }, tool="store_memory")
 
-        # Insert
-        point_id = str(uuid.uuid4())
-        qdrant_client.upsert(
-            collection_name=collection_name,
-            points=[PointStruct(id=point_id, vector=embedding, payload=payload)]
-        )
+        # Ensure collection exists
+        if not await ensure_collection_exists(collection_name):
+            return encode_response({
+                "error": f"Could not access collection for memory_level '{memory_level}'"
+            }, tool="store_memory")
 
-        # Get collection info
-        collection_info = qdrant_client.get_collection(collection_name=collection_name)
+        # Embed and insert
+        point_id = await engine.upsert_memory(collection_name, document, metadata)
 
-        return f'{{"id": "{point_id}", "collection": "{collection_name}", "total_points": {collection_info.points_count}, "status": "success"}}'
+        return encode_response({
+            "id": point_id,
+            "collection": collection_name,
+            "total_points": await engine.count_points(collection_name),
+            "status": "success"
+        }, tool="store_memory")
 
     except Exception as e:
-        return f'{{"error": "{str(e)}"}}'
+        return encode_response({"error": str(e)}, tool="store_memory")
 
 
 @mcp.tool()
-def update_memory(
+@instrumented
+async def update_memory(
     doc_id: str,
     document: str,
     metadata: Dict[str, Any],
@@ -239,42 +220,32 @@ def update_memory(
     try:
         collection_name = get_collection_name(memory_level)
 
-        # Check if document exists
-        points = qdrant_client.retrieve(
-            collection_name=collection_name,
-            ids=[doc_id]
-        )
-
-        if not points:
-            return f"Error: Document ID '{doc_id}' not found in '{collection_name}'"
-
-        # Generate new embedding
-        embedding = generate_embedding(document)
-
         # Add memory_level to metadata
         metadata['memory_level'] = memory_level
         metadata['last_synced'] = datetime.utcnow().isoformat() + 'Z'
 
-        # Prepare payload
-        payload = {
-            'document': document,
-            'metadata': metadata
-        }
+        # Not written yet: replace the queued write instead (it would overwrite this update)
+        if await engine.update_queued(collection_name, doc_id, document, metadata):
+            return encode_response(f"Successfully updated queued memory ID: {doc_id} for '{collection_name}'", tool="update_memory")
+
+        # Check if document exists
+        points = await engine.retrieve_points(collection_name, [doc_id])
+
+        if not points:
+            return encode_response(f"Error: Document ID '{doc_id}' not found in '{collection_name}'", tool="update_memory", error=True)
 
-        # Update (upsert with same ID)
-        qdrant_client.upsert(
-            collection_name=collection_name,
-            points=[PointStruct(id=doc_id, vector=embedding, payload=payload)]
-        )
+        # Re-embed and update (upsert with same ID)
+        await engine.upsert_memory(collection_name, document, metadata, doc_id=doc_id)
 
-        return f"Successfully updated memory ID: {doc_id} in '{collection_name}'"
+        return encode_response(f"Successfully updated memory ID: {doc_id} in '{collection_name}'", tool="update_memory")
 
     except Exception as e:
-        return f"Error updating memory: {str(e)}"
+        return encode_response(f"Error updating memory: {str(e)}", tool="update_memory", error=True)
 
 
 @mcp.tool()
-def get_memory(doc_id: str, memory_level: str) -> str:
+@instrumented
+async def get_memory(doc_id: str, memory_level: str) -> str:
     """Retrieve a memory by its ID.
 
     Args:
@@ -288,34 +259,32 @@ def get_memory(doc_id: str, memory_level: str) -> str:
         collection_name = get_collection_name(memory_level)
 
         # Retrieve document
-        points = qdrant_client.retrieve(
-            collection_name=collection_name,
-            ids=[doc_id]
-        )
+        points = await engine.retrieve_points(collection_name, [doc_id])
 
         if not points:
-            return f"Error: Document ID '{doc_id}' not found in '{collection_name}'"
-
-        point = points[0]
-        payload = point.payload
-        document = payload.get('document', 'N/A')
-        metadata = payload.get('metadata', {})
-
-        result = f"Memory ID: {doc_id}\n"
-        result += f"Collection: {collection_name}\n"
-        result += f"File: {metadata.get('file_path', 'unknown')}\n"
-        result += f"Type: {metadata.get('memory_type', 'unknown')}\n"
-        result += f"Tags: {' '.join(['#' + t for t in metadata.get('tags', [])])}\n"
-        result += f"\nDocument:\n{document}"
-
-        return result
+            return encode_response(f"Error: Document ID '{doc_id}' not found in '{collection_name}'", tool="get_memory", error=True)
+
+        document, metadata = split_payload(points[0].payload)
+        document = document or 'N/A'
+
+        return encode_response("\n".join([
+            f"Memory ID: {doc_id}",
+            f"Collection: {collection_name}",
+            f"File: {metadata.get('file_path', 'unknown')}",
+            f"Type: {metadata.get('memory_type', 'unknown')}",
+            f"Tags: {' '.join(['#' + t for t in metadata.get('tags', [])])}",
+            "",
+            "Document:",
+            document,
+        ]), tool="get_memory")
 
     except Exception as e:
-        return f"Error retrieving memory: {str(e)}"
+        return encode_response(f"Error retrieving memory: {str(e)}", tool="get_memory", error=True)
 
 
 @mcp.tool()
-def delete_memory(doc_id: str, memory_level: str) -> str:
+@instrumented
+async def delete_memory(doc_id: str, memory_level: str) -> str:
     """Delete a memory by its ID.
 
     Args:
@@ -328,19 +297,13 @@ def delete_memory(doc_id: str, memory_level: str) -> str:
     try:
         collection_name = get_collection_name(memory_level)
 
-        # Delete
-        qdrant_client.delete(
-            collection_name=collection_name,
-            points_selector=PointIdsList(points=[doc_id])
-        )
-
-        # Get updated collection info
-        collection_info = qdrant_client.get_collection(collection_name=collection_name)
+        # Delete and get updated count
+        remaining = await engine.delete_points(collection_name, [doc_id])
 
-        return f"Successfully deleted memory ID: {doc_id} from '{collection_name}'\nTotal points remaining: {collection_info.points_count}"
+        return encode_response(f"Successfully deleted memory ID: {doc_id} from '{collection_name}'\nTotal points remaining: {remaining}", tool="delete_memory")
 
     except Exception as e:
-        return f"Error deleting memory: {str(e)}"
+        return encode_response(f"Error deleting memory: {str(e)}", tool="delete_memory", error=True)
 
 
 if __name__ == "__main__":
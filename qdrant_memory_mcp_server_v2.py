@@ -4,39 +4,56 @@ Qdrant Memory MCP Server V2 - True Two-Stage Retrieval
 Provides semantic memory storage with preview/full content separation
 """
 
+import time
+
+_IMPORT_START = time.perf_counter()  # Startup timing report starts here
+
+import argparse
+import asyncio
+import base64
+import contextlib
 import json
 import logging
 import os
-import sys
+import tempfile
+import weakref
 from datetime import datetime
 from typing import Any, Dict, List, Optional
-from uuid import uuid4
 
-import httpx
-from dotenv import load_dotenv
 from mcp.server import Server, NotificationOptions
 from mcp.server.models import InitializationOptions
-from mcp.shared.exceptions import McpError
 from mcp.types import Tool, TextContent
-from pydantic import AnyUrl
-from qdrant_client import QdrantClient
-from qdrant_client.http import models
 
-# Load environment variables
-load_dotenv()
+from memory_engine import (
+    METRICS, PROJECT_COLLECTION, PROJECT_PREFIX, PROJECT_TENANCY, STARTUP_TIMINGS, KeywordResults,
+    MemoryEngine, RequestIdFilter,
+    annotate, count_tokens, dumps_compact, encode_response, flush_traces, instrumented, models,
+    span, split_payload, to_columnar, tokenizer_name
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
+logger.addFilter(RequestIdFilter())
 
 # Initialize MCP server
 server = Server("qdrant-memory-v2")
 
-# Configuration
-QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-EMBEDDING_MODEL = "text-embedding-3-small"
-EMBEDDING_DIMENSION = 1536
+# Configuration (Qdrant, embedding and tracing settings live in memory_engine)
+LIST_COLLECTIONS_CONCURRENCY = int(os.getenv("LIST_COLLECTIONS_CONCURRENCY", "8"))
+COLLECTIONS_CACHE_TTL = float(os.getenv("COLLECTIONS_CACHE_TTL", "10"))
+# export_collection only writes below this directory (the export_memories.py CLI writes anywhere)
+EXPORT_DIR = os.path.expanduser(os.getenv("MEMORY_EXPORT_DIR", "~/.cache/qdrant-memory/exports"))
+
+# Transport: "stdio" (one process per agent) or "http" (shared by many agent sessions)
+MCP_TRANSPORT = os.getenv("MCP_TRANSPORT", "stdio")
+MCP_HOST = os.getenv("MCP_HOST", "127.0.0.1")
+MCP_PORT = int(os.getenv("MCP_PORT", "8765"))
+MCP_CLIENT_MAX_CONCURRENCY = int(os.getenv("MCP_CLIENT_MAX_CONCURRENCY", "4"))  # Tool calls per session
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # Prometheus /metrics for stdio mode (0 = off)
+
+# Connect and create role collections in the background right after startup
+MEMORY_WARMUP = os.getenv("MEMORY_WARMUP", "true").lower() in ("1", "true", "yes")
 
 # Role-based collections mapping
 ROLE_COLLECTIONS = {
@@ -55,58 +72,32 @@ ROLE_COLLECTIONS = {
     }
 }
 
-class MemoryServer:
+
+
+class MemoryServer(MemoryEngine):
+    """V2 tools: role collections, flat payloads, preview/full two-stage retrieval"""
+
     def __init__(self):
-        self.client = QdrantClient(url=QDRANT_URL)
-        self._embedding_cache = {}
-        self._init_collections()
+        super().__init__()
+        self._collections_cache: Dict[bool, tuple] = {}
 
-    def _init_collections(self):
+    async def _init_collections(self):
         """Initialize all role-based collections if they don't exist"""
         for level, roles in ROLE_COLLECTIONS.items():
             if level == "global":
                 for role, collection_name in roles.items():
                     try:
-                        self.client.get_collection(collection_name)
+                        await self._qdrant_call(self.client.get_collection, collection_name)
                         logger.info(f"Collection '{collection_name}' exists")
                     except Exception:
-                        logger.info(f"Creating collection '{collection_name}'")
-                        self.client.create_collection(
-                            collection_name=collection_name,
-                            vectors_config=models.VectorParams(
-                                size=EMBEDDING_DIMENSION,
-                                distance=models.Distance.COSINE
-                            )
-                        )
-
-    def _get_embedding(self, text: str) -> List[float]:
-        """Get embedding from OpenAI with caching"""
-        if text in self._embedding_cache:
-            return self._embedding_cache[text]
-
-        headers = {
-            "Authorization": f"Bearer {OPENAI_API_KEY}",
-            "Content-Type": "application/json"
-        }
-
-        data = {
-            "input": text,
-            "model": EMBEDDING_MODEL
-        }
-
-        with httpx.Client() as client:
-            response = client.post(
-                "https://api.openai.com/v1/embeddings",
-                headers=headers,
-                json=data,
-                timeout=30.0
-            )
-            response.raise_for_status()
-            embedding = response.json()["data"][0]["embedding"]
+                        await self.create_collection(collection_name)
 
-        # Cache for session
-        self._embedding_cache[text] = embedding
-        return embedding
+    async def ensure_collection(self, collection_name: str) -> bool:
+        """Create the collection if missing, invalidating the list_collections cache"""
+        created = await super().ensure_collection(collection_name)
+        if created:
+            self._collections_cache.clear()
+        return created
 
     def _get_collection_name(self, memory_level: str, role: str = None) -> str:
         """Get the actual collection name based on memory level and role"""
@@ -138,66 +129,247 @@ class MemoryServer:
 
         return {"title": title, "description": description}
 
-    async def search_memory(self, query: str, memory_level: str, limit: int = 10, role: str = None) -> str:
+    @staticmethod
+    def _memory_entry(point: Any, collection_name: str = None) -> Dict[str, Any]:
+        """Full memory (document + metadata) of a point in either payload layout"""
+        document, metadata = split_payload(point.payload)
+        entry = {"doc_id": str(point.id)}
+        if collection_name:
+            entry["collection"] = collection_name
+        entry["document"] = document
+        entry["metadata"] = metadata
+        return entry
+
+    def _preview_entry(self, result: Any) -> Dict[str, Any]:
+        """Preview (title, description, metadata; no content) of a scored point in either payload layout"""
+        document, metadata = split_payload(result.payload)
+        preview = self._extract_preview_from_document(document)
+        return {
+            "doc_id": str(result.id),
+            "title": preview.get("title") or metadata.get("title", "Untitled"),
+            "description": preview.get("description", "No description"),
+            "similarity": round(result.score, 3),
+            "memory_type": metadata.get("memory_type", "unknown"),
+            "tags": metadata.get("tags", []),
+            "role": metadata.get("role", "unknown"),
+            "created_at": metadata.get("created_at", "unknown")
+        }
+
+    @instrumented
+    async def search_memory(self, query: str, memory_level: str, limit: int = 10, role: str = None,
+                            response_format: str = "rows", vector: str = "fused", diversity: float = None,
+                            group_by: str = None, group_size: int = 3) -> str:
         """
         Search memories - returns ONLY previews (title + description + metadata)
         This is the first stage of two-stage retrieval.
+
+        response_format="columnar" returns previews as parallel arrays
+        (doc_id[], title[], similarity[], ...) instead of one object per hit.
+        vector="preview" / "content" searches one named vector of collections
+        that have them; "fused" (default) takes the best of both.
+        diversity (0-1) reranks candidates by maximal marginal relevance so near
+        duplicates give way to variety. group_by (e.g. "memory_type", "role",
+        "tags") returns the best `group_size` hits for each of `limit` values.
         """
         try:
             collection_name = self._get_collection_name(memory_level, role)
+            annotate(collection=collection_name, limit=limit)
 
             # Check if collection exists
-            try:
-                self.client.get_collection(collection_name)
-            except Exception:
-                return json.dumps({
+            if not await self.has_collection(collection_name):
+                return encode_response({
                     "error": f"Collection '{collection_name}' does not exist",
                     "suggestion": "No memories stored yet for this level/role"
-                })
-
-            # Get embedding for query
-            query_embedding = self._get_embedding(query)
-
-            # Search in vector DB
-            search_results = self.client.search(
-                collection_name=collection_name,
-                query_vector=query_embedding,
-                limit=limit,
-                with_payload=True,
-                with_vectors=False
-            )
+                }, tool="search_memory")
+
+            if group_by and diversity:
+                return encode_response({"error": "Use either group_by or diversity, not both"}, tool="search_memory")
+
+            # Embed the query and search in vector DB
+            groups = []
+            if group_by:
+                groups = await self.search_groups(collection_name, query, group_by, limit, group_size, vector)
+                search_results = [point for _, hits in groups for point in hits]
+                keyword_mode = any(isinstance(hits, KeywordResults) for _, hits in groups)
+            else:
+                if diversity:
+                    search_results = await self.search_diverse(collection_name, query, limit, diversity, vector)
+                else:
+                    search_results = await self.search_points(collection_name, query, limit, vector)
+                keyword_mode = isinstance(search_results, KeywordResults)
+            annotate(results=len(search_results))
 
             if not search_results:
-                return json.dumps({"results": [], "message": "No memories found"})
+                return encode_response({"results": [], "message": "No memories found"}, tool="search_memory")
 
             # Build preview results (NO full content)
-            previews = []
-            for result in search_results:
-                # Extract preview from stored document
-                preview = self._extract_preview_from_document(result.payload.get("document", ""))
-
-                preview_data = {
-                    "doc_id": str(result.id),
-                    "title": preview.get("title", "Untitled"),
-                    "description": preview.get("description", "No description"),
-                    "similarity": round(result.score, 3),
-                    "memory_type": result.payload.get("memory_type", "unknown"),
-                    "tags": result.payload.get("tags", []),
-                    "role": result.payload.get("role", "unknown"),
-                    "created_at": result.payload.get("created_at", "unknown")
-                }
-                previews.append(preview_data)
-
-            return json.dumps({
+            previews = [self._preview_entry(result) for result in search_results]
+            if group_by:
+                group_values = [value for value, hits in groups for _ in hits]
+                for preview, value in zip(previews, group_values):
+                    preview["group"] = value
+
+            # Embeddings unavailable: previews ranked by keyword match, similarity is a BM25 score
+            degraded = {"search_mode": "keyword"} if keyword_mode else {}
+
+            if response_format == "columnar":
+                return encode_response({
+                    "columns": to_columnar(previews),
+                    "total": len(previews),
+                    **degraded,
+                    "message": f"Found {len(previews)} memory previews. Use get_memory(doc_id) to retrieve full content."
+                }, tool="search_memory")
+
+            return encode_response({
                 "results": previews,
                 "total": len(previews),
+                **degraded,
                 "message": f"Found {len(previews)} memory previews. Use get_memory(doc_id) to retrieve full content."
-            }, indent=2)
+            }, tool="search_memory")
 
         except Exception as e:
             logger.error(f"Search error: {str(e)}")
-            return json.dumps({"error": str(e)})
+            return encode_response({"error": str(e)}, tool="search_memory")
 
+    @instrumented
+    async def search_memory_multi(self, query: str, project: str = None, roles: List[str] = None,
+                                  limit: int = 10, project_boost: float = 1.0,
+                                  response_format: str = "rows", vector: str = "fused") -> str:
+        """
+        Search a project and several global role collections with one query embedding.
+
+        Sub-searches run concurrently (one per collection). Scores are normalized to
+        the best hit: cosine similarities share one scale, so they are divided by the
+        best overall; keyword fallback (BM25) scores depend on each collection's term
+        statistics, so they are divided by the best in their own collection. Project
+        hits are then multiplied by `project_boost`. Returns one merged preview list
+        of at most `limit`.
+        """
+        try:
+            roles = roles or ["universal"]
+            unknown = [role for role in roles if role not in ROLE_COLLECTIONS["global"]]
+            if unknown:
+                return encode_response({
+                    "error": f"Unknown roles: {', '.join(unknown)}",
+                    "valid_roles": list(ROLE_COLLECTIONS["global"])
+                }, tool="search_memory_multi")
+
+            collection_names = [ROLE_COLLECTIONS["global"][role] for role in dict.fromkeys(roles)]
+            project_collection = self._get_collection_name(project) if project and project != "global" else None
+            if project_collection:
+                collection_names.insert(0, project_collection)
+            annotate(collections=len(collection_names), limit=limit)
+
+            results = await self.search_collections(collection_names, query, limit, vector)
+
+            keyword_mode = any(isinstance(points, KeywordResults) for points in results.values())
+            best = max((point.score for points in results.values() for point in points), default=0)
+            merged = []
+            for collection_name, points in results.items():
+                top = max((point.score for point in points), default=0) if keyword_mode else best
+                weight = project_boost if collection_name == project_collection else 1.0
+                for point in points:
+                    entry = self._preview_entry(point)
+                    entry["collection"] = collection_name
+                    entry["score"] = round((point.score / top if top > 0 else 0.0) * weight, 3)
+                    merged.append(entry)
+            merged.sort(key=lambda entry: (entry["score"], entry["similarity"]), reverse=True)
+            previews = merged[:limit]
+            annotate(results=len(previews))
+
+            # Embeddings unavailable: previews ranked by keyword match, similarity is a BM25 score
+            degraded = {"search_mode": "keyword"} if keyword_mode else {}
+            message = (f"Found {len(previews)} memory previews across {len(collection_names)} collections. "
+                       f"Use batch_get_memories_multi with (doc_id, collection) to retrieve full content.")
+
+            if response_format == "columnar":
+                return encode_response({
+                    "columns": to_columnar(previews),
+                    "total": len(previews),
+                    "collections": collection_names,
+                    **degraded,
+                    "message": message
+                }, tool="search_memory_multi")
+
+            return encode_response({
+                "results": previews,
+                "total": len(previews),
+                "collections": collection_names,
+                **degraded,
+                "message": message
+            }, tool="search_memory_multi")
+
+        except Exception as e:
+            logger.error(f"Multi-collection search error: {str(e)}")
+            return encode_response({"error": str(e)}, tool="search_memory_multi")
+
+    @instrumented
+    async def find_similar(self, doc_id: str, memory_level: str, role: str = None,
+                           positive_ids: List[str] = None, negative_ids: List[str] = None,
+                           roles: List[str] = None, project: str = None, limit: int = 10,
+                           response_format: str = "rows") -> str:
+        """
+        "More like this": memories similar to a stored one, found from its stored
+        vector (no embedding request). `doc_id` and `positive_ids` are examples to
+        match, `negative_ids` examples to steer away from, all in the collection of
+        `memory_level`/`role`. Searches that collection, or the given global `roles`
+        and/or `project` collections (concurrently), and merges previews by similarity.
+        """
+        try:
+            source = self._get_collection_name(memory_level, role)
+            unknown = [r for r in roles or [] if r not in ROLE_COLLECTIONS["global"]]
+            if unknown:
+                return encode_response({
+                    "error": f"Unknown roles: {', '.join(unknown)}",
+                    "valid_roles": list(ROLE_COLLECTIONS["global"])
+                }, tool="find_similar")
+
+            collection_names = [ROLE_COLLECTIONS["global"][r] for r in dict.fromkeys(roles or [])]
+            if project and project != "global":
+                collection_names.insert(0, self._get_collection_name(project))
+            collection_names = collection_names or [source]
+            positive = list(dict.fromkeys([doc_id, *(positive_ids or [])]))
+            annotate(collection=source, collections=len(collection_names), limit=limit)
+
+            results = await self.recommend_collections(
+                collection_names, positive, negative_ids, limit, source=source
+            )
+
+            examples = {*positive, *(negative_ids or [])}
+            merged = []
+            for collection_name, points in results.items():
+                for point in points:
+                    if str(point.id) in examples:
+                        continue
+                    entry = self._preview_entry(point)
+                    entry["collection"] = collection_name
+                    merged.append(entry)
+            merged.sort(key=lambda entry: entry["similarity"], reverse=True)
+            previews = merged[:limit]
+            annotate(results=len(previews))
+            message = (f"Found {len(previews)} memories similar to '{doc_id}'. "
+                       f"Use batch_get_memories_multi with (doc_id, collection) to retrieve full content.")
+
+            if response_format == "columnar":
+                return encode_response({
+                    "columns": to_columnar(previews),
+                    "total": len(previews),
+                    "collections": collection_names,
+                    "message": message
+                }, tool="find_similar")
+
+            return encode_response({
+                "results": previews,
+                "total": len(previews),
+                "collections": collection_names,
+                "message": message
+            }, tool="find_similar")
+
+        except Exception as e:
+            logger.error(f"Find similar error: {str(e)}")
+            return encode_response({"error": str(e)}, tool="find_similar")
+
+    @instrumented
     async def get_memory(self, doc_id: str, memory_level: str, role: str = None) -> str:
         """
         Retrieve full memory content by ID.
@@ -205,32 +377,21 @@ class MemoryServer:
         """
         try:
             collection_name = self._get_collection_name(memory_level, role)
+            annotate(collection=collection_name)
 
             # Retrieve the specific document
-            result = self.client.retrieve(
-                collection_name=collection_name,
-                ids=[doc_id],
-                with_payload=True,
-                with_vectors=False
-            )
+            result = await self.retrieve_points(collection_name, [doc_id])
 
             if not result:
-                return json.dumps({"error": f"Memory with ID '{doc_id}' not found"})
-
-            point = result[0]
-            return json.dumps({
-                "doc_id": str(point.id),
-                "document": point.payload.get("document", ""),
-                "metadata": {
-                    k: v for k, v in point.payload.items()
-                    if k != "document"
-                }
-            }, indent=2)
+                return encode_response({"error": f"Memory with ID '{doc_id}' not found"}, tool="get_memory")
+
+            return encode_response(self._memory_entry(result[0]), tool="get_memory")
 
         except Exception as e:
             logger.error(f"Get memory error: {str(e)}")
-            return json.dumps({"error": str(e)})
+            return encode_response({"error": str(e)}, tool="get_memory")
 
+    @instrumented
     async def batch_get_memories(self, doc_ids: List[str], memory_level: str, role: str = None) -> str:
         """
         Retrieve multiple memories by IDs in a single call.
@@ -238,192 +399,543 @@ class MemoryServer:
         """
         try:
             collection_name = self._get_collection_name(memory_level, role)
+            annotate(collection=collection_name, requested=len(doc_ids))
 
             # Retrieve multiple documents
-            results = self.client.retrieve(
-                collection_name=collection_name,
-                ids=doc_ids,
-                with_payload=True,
-                with_vectors=False
-            )
+            results = await self.retrieve_points(collection_name, doc_ids)
 
-            memories = []
-            for point in results:
-                memories.append({
-                    "doc_id": str(point.id),
-                    "document": point.payload.get("document", ""),
-                    "metadata": {
-                        k: v for k, v in point.payload.items()
-                        if k != "document"
-                    }
-                })
+            annotate(results=len(results))
+            memories = [self._memory_entry(point) for point in results]
 
-            return json.dumps({
+            return encode_response({
                 "memories": memories,
                 "retrieved": len(memories),
                 "requested": len(doc_ids)
-            }, indent=2)
+            }, tool="batch_get_memories")
 
         except Exception as e:
             logger.error(f"Batch get error: {str(e)}")
-            return json.dumps({"error": str(e)})
+            return encode_response({"error": str(e)}, tool="batch_get_memories")
 
-    async def store_memory(self, document: str, metadata: Dict[str, Any], memory_level: str) -> str:
-        """Store a new memory"""
+    @instrumented
+    async def retrieve_within_budget(self, query: str, token_budget: int, memory_level: str, role: str = None,
+                                     candidates: int = 20, vector: str = "fused") -> str:
+        """
+        Search and fetch in one call, sized to a token budget.
+
+        Ranks up to `candidates` memories for the query, then walks them in rank
+        order: each is added in full if it still fits in `token_budget`, else as its
+        preview if that fits, else skipped. Entries are measured with a local
+        tokenizer (cached per point), so a query and budget always give the same
+        context size.
+        """
         try:
-            # Extract role from metadata for collection routing
-            role = metadata.get("role", "universal")
+            if token_budget <= 0:
+                return encode_response({"error": "token_budget must be positive"}, tool="retrieve_within_budget")
+
             collection_name = self._get_collection_name(memory_level, role)
+            annotate(collection=collection_name, limit=candidates, token_budget=token_budget)
 
-            # Ensure collection exists (for project collections)
-            if memory_level != "global":
-                try:
-                    self.client.get_collection(collection_name)
-                except Exception:
-                    logger.info(f"Creating project collection '{collection_name}'")
-                    self.client.create_collection(
-                        collection_name=collection_name,
-                        vectors_config=models.VectorParams(
-                            size=EMBEDDING_DIMENSION,
-                            distance=models.Distance.COSINE
-                        )
+            if not await self.has_collection(collection_name):
+                return encode_response({
+                    "error": f"Collection '{collection_name}' does not exist",
+                    "suggestion": "No memories stored yet for this level/role"
+                }, tool="retrieve_within_budget")
+
+            search_results = await self.search_points(collection_name, query, candidates, vector)
+
+            # Per-point counts exclude the score, which changes with every query
+            score_tokens = count_tokens(dumps_compact({"similarity": 0.123, "form": "preview"}))
+            memories = []
+            skipped = []
+            tokens_used = 0
+            for point in search_results:
+                doc_id = str(point.id)
+                full = self._memory_entry(point)
+                preview = self._preview_entry(point)
+                del preview["similarity"]
+                for form, entry in (("full", full), ("preview", preview)):
+                    tokens = self.point_tokens(collection_name, doc_id, form, dumps_compact(entry)) + score_tokens
+                    if tokens_used + tokens <= token_budget:
+                        memories.append({**entry, "similarity": round(point.score, 3), "form": form})
+                        tokens_used += tokens
+                        break
+                else:
+                    skipped.append(doc_id)
+
+            full_count = sum(1 for memory in memories if memory["form"] == "full")
+            annotate(results=len(memories), tokens_used=tokens_used)
+
+            # Embeddings unavailable: memories ranked by keyword match, similarity is a BM25 score
+            degraded = {"search_mode": "keyword"} if isinstance(search_results, KeywordResults) else {}
+
+            return encode_response({
+                "memories": memories,
+                "total": len(memories),
+                "tokens_used": tokens_used,
+                "token_budget": token_budget,
+                "tokenizer": tokenizer_name(),
+                "skipped": skipped,
+                **degraded,
+                "message": (f"Packed {full_count} full memories and {len(memories) - full_count} previews "
+                            f"into {tokens_used}/{token_budget} tokens. "
+                            f"Use get_memory(doc_id) for the full content of a preview.")
+            }, tool="retrieve_within_budget")
+
+        except Exception as e:
+            logger.error(f"Budgeted retrieval error: {str(e)}")
+            return encode_response({"error": str(e)}, tool="retrieve_within_budget")
+
+    async def _retrieve_points(self, collection_name: str, doc_ids: List[str]) -> list:
+        """Retrieve points from one collection, treating a missing collection as empty"""
+        try:
+            return await self.retrieve_points(collection_name, doc_ids)
+        except Exception as e:
+            logger.warning(f"Retrieve from '{collection_name}' failed: {str(e)}")
+            return []
+
+    @instrumented
+    async def batch_get_memories_multi(self, items: List[Dict[str, str]] = None,
+                                       doc_ids: List[str] = None,
+                                       memory_level: str = None) -> str:
+        """
+        Retrieve memories from several collections in a single call.
+
+        `items` are {doc_id, role | collection | memory_level} pairs; ids given
+        in `doc_ids` (or items without a location) are resolved across all
+        global role collections plus `memory_level` when it names a project.
+        One retrieve per collection is issued concurrently and the merged
+        result keeps the requested order.
+        """
+        try:
+            requested = []  # (doc_id, collection or None)
+            for item in items or []:
+                collection_name = item.get("collection")
+                if not collection_name and (item.get("role") or item.get("memory_level")):
+                    collection_name = self._get_collection_name(
+                        item.get("memory_level", "global"), item.get("role")
                     )
+                requested.append((item["doc_id"], collection_name))
+            requested.extend((doc_id, None) for doc_id in doc_ids or [])
+
+            # Group ids by target collection (dict keeps first-seen order)
+            by_collection: Dict[str, List[str]] = {}
+            unresolved = [doc_id for doc_id, coll in requested if coll is None]
+            for doc_id, collection_name in requested:
+                if collection_name:
+                    by_collection.setdefault(collection_name, []).append(doc_id)
+
+            if unresolved:
+                search_space = list(ROLE_COLLECTIONS["global"].values())
+                if memory_level and memory_level != "global":
+                    search_space.insert(0, self._get_collection_name(memory_level))
+                for collection_name in search_space:
+                    ids = by_collection.setdefault(collection_name, [])
+                    ids.extend(doc_id for doc_id in unresolved if doc_id not in ids)
+
+            collection_names = list(by_collection)
+            annotate(requested=len(requested), collections=len(collection_names))
+            results = await asyncio.gather(*[
+                self._retrieve_points(name, list(dict.fromkeys(by_collection[name])))
+                for name in collection_names
+            ])
+
+            found: Dict[tuple, Any] = {}
+            first_hit: Dict[str, tuple] = {}
+            for collection_name, points in zip(collection_names, results):
+                for point in points:
+                    found[(str(point.id), collection_name)] = point
+                    first_hit.setdefault(str(point.id), (collection_name, point))
 
-            # Generate embedding
-            embedding = self._get_embedding(document)
+            memories = []
+            missing = []
+            for doc_id, collection_name in requested:
+                if collection_name:
+                    point = found.get((doc_id, collection_name))
+                else:
+                    collection_name, point = first_hit.get(doc_id, (None, None))
+                if point is None:
+                    missing.append(doc_id)
+                    continue
+                memories.append(self._memory_entry(point, collection_name))
+
+            annotate(results=len(memories))
+            return encode_response({
+                "memories": memories,
+                "retrieved": len(memories),
+                "requested": len(requested),
+                "missing": missing,
+                "collections_queried": len(collection_names)
+            }, tool="batch_get_memories_multi")
 
-            # Generate ID
-            doc_id = str(uuid4())
+        except Exception as e:
+            logger.error(f"Multi-collection batch get error: {str(e)}")
+            return encode_response({"error": str(e)}, tool="batch_get_memories_multi")
+
+    @instrumented
+    async def store_memory(self, document: str, metadata: Dict[str, Any], memory_level: str) -> str:
+        """Store a new memory"""
+        try:
+            # Extract role from metadata for collection routing
+            role = metadata.get("role", "universal")
+            collection_name = self._get_collection_name(memory_level, role)
+            annotate(collection=collection_name)
 
             # Add timestamps
             now = datetime.now().isoformat()
             metadata["created_at"] = metadata.get("created_at", now)
             metadata["last_synced"] = now
 
-            # Store in Qdrant
-            self.client.upsert(
-                collection_name=collection_name,
-                points=[
-                    models.PointStruct(
-                        id=doc_id,
-                        vector=embedding,
-                        payload={
-                            "document": document,
-                            **metadata
-                        }
-                    )
-                ]
-            )
+            if self.write_behind:
+                # Durably queued; the background worker embeds and upserts it
+                doc_id = await self.enqueue_memory(collection_name, document, metadata)
+                return encode_response({
+                    "doc_id": doc_id,
+                    "status": "queued",
+                    "collection": collection_name,
+                    "queue_depth": self.write_queue_depth,
+                    "message": f"Memory queued for '{collection_name}'; searchable within seconds"
+                }, tool="store_memory")
+
+            # Ensure collection exists (for project collections)
+            if memory_level != "global":
+                await self.ensure_collection(collection_name)
+
+            # Embed and store in Qdrant
+            doc_id = await self.upsert_memory(collection_name, document, metadata)
 
-            return json.dumps({
+            return encode_response({
                 "doc_id": doc_id,
                 "status": "success",
                 "collection": collection_name,
                 "message": f"Memory stored successfully in '{collection_name}'"
-            })
+            }, tool="store_memory")
 
         except Exception as e:
             logger.error(f"Store error: {str(e)}")
-            return json.dumps({"error": str(e)})
+            return encode_response({"error": str(e)}, tool="store_memory")
 
+    @instrumented
     async def update_memory(self, doc_id: str, document: str, metadata: Dict[str, Any], memory_level: str) -> str:
         """Update an existing memory (regenerates embedding)"""
         try:
             role = metadata.get("role", "universal")
             collection_name = self._get_collection_name(memory_level, role)
-
-            # Check if document exists
-            existing = self.client.retrieve(
-                collection_name=collection_name,
-                ids=[doc_id]
-            )
-
-            if not existing:
-                return json.dumps({"error": f"Memory '{doc_id}' not found"})
-
-            # Generate new embedding
-            embedding = self._get_embedding(document)
+            annotate(collection=collection_name)
 
             # Update timestamps
             metadata["last_updated"] = datetime.now().isoformat()
             metadata["last_synced"] = datetime.now().isoformat()
 
-            # Update in Qdrant
-            self.client.upsert(
-                collection_name=collection_name,
-                points=[
-                    models.PointStruct(
-                        id=doc_id,
-                        vector=embedding,
-                        payload={
-                            "document": document,
-                            **metadata
-                        }
-                    )
-                ]
-            )
+            # Not written yet: replace the queued write instead (it would overwrite this update)
+            if await self.update_queued(collection_name, doc_id, document, metadata):
+                return encode_response({
+                    "doc_id": doc_id,
+                    "status": "queued",
+                    "message": "Queued memory updated; searchable within seconds"
+                }, tool="update_memory")
 
-            return json.dumps({
+            # Check if document exists
+            existing = await self.retrieve_points(collection_name, [doc_id])
+
+            if not existing:
+                return encode_response({"error": f"Memory '{doc_id}' not found"}, tool="update_memory")
+
+            # Re-embed and update in Qdrant
+            await self.upsert_memory(collection_name, document, metadata, doc_id=doc_id)
+
+            return encode_response({
                 "doc_id": doc_id,
                 "status": "success",
                 "message": "Memory updated successfully"
-            })
+            }, tool="update_memory")
 
         except Exception as e:
             logger.error(f"Update error: {str(e)}")
-            return json.dumps({"error": str(e)})
+            return encode_response({"error": str(e)}, tool="update_memory")
 
+    @instrumented
     async def delete_memory(self, doc_id: str, memory_level: str, role: str = None) -> str:
         """Delete a memory by ID"""
         try:
             collection_name = self._get_collection_name(memory_level, role)
+            annotate(collection=collection_name)
 
-            # Delete from Qdrant
-            self.client.delete(
-                collection_name=collection_name,
-                points_selector=models.PointIdsList(points=[doc_id])
-            )
+            # Delete from Qdrant and get updated count
+            remaining = await self.delete_points(collection_name, [doc_id])
 
-            # Get updated count
-            collection_info = self.client.get_collection(collection_name)
-
-            return json.dumps({
+            return encode_response({
                 "doc_id": doc_id,
                 "status": "success",
-                "remaining_memories": collection_info.points_count,
+                "remaining_memories": remaining,
                 "message": f"Memory deleted successfully"
-            })
+            }, tool="delete_memory")
 
         except Exception as e:
             logger.error(f"Delete error: {str(e)}")
-            return json.dumps({"error": str(e)})
+            return encode_response({"error": str(e)}, tool="delete_memory")
+
+    @staticmethod
+    def _describe_vectors(params: Any) -> Dict[str, Any]:
+        """Summarize unnamed or named vector params as {name: {size, distance, ...}}"""
+        vectors = params if isinstance(params, dict) else {"": params}
+        described = {}
+        for name, vp in vectors.items():
+            described[name or "default"] = {
+                "size": vp.size,
+                "distance": str(getattr(vp.distance, "value", vp.distance)),
+                "on_disk": vp.on_disk,
+                "multivector": vp.multivector_config is not None,
+                "quantization": type(vp.quantization_config).__name__ if vp.quantization_config else None
+            }
+        return described
+
+    async def _describe_collection(self, name: str, fast_count: bool) -> Dict[str, Any]:
+        """Count or fully describe one collection"""
+        entry = {
+            "name": name,
+            "level": "global" if name in ROLE_COLLECTIONS["global"].values() else "project",
+            "role": next((k for k, v in ROLE_COLLECTIONS["global"].items() if v == name), None)
+        }
+        if fast_count:
+            entry["count"] = (await self._qdrant(self.client.count, collection_name=name, exact=False)).count
+            return entry
+
+        info = await self._qdrant(self.client.get_collection, name)
+        quantization = info.config.quantization_config
+        entry.update({
+            "count": info.points_count,
+            "status": str(getattr(info.status, "value", info.status)),
+            "indexed_vectors": info.indexed_vectors_count,
+            "unindexed_vectors": max(0, (info.points_count or 0) - (info.indexed_vectors_count or 0)),
+            "segments": info.segments_count,
+            "vectors": self._describe_vectors(info.config.params.vectors),
+            "quantization": type(quantization).__name__ if quantization else None
+        })
+        if PROJECT_TENANCY == "shared" and name == PROJECT_COLLECTION:
+            # One collection holds every project: count each tenant (addressed as proj-{name})
+            facet = await self._qdrant(self.client.facet, collection_name=name, key="project", limit=1000, exact=True)
+            entry["projects"] = {f"{PROJECT_PREFIX}{hit.value}": hit.count for hit in facet.hits}
+        return entry
+
+    @instrumented
+    async def list_collections(self, fast_count: bool = False) -> str:
+        """
+        List all collections with counts and capacity details.
 
-    async def list_collections(self) -> str:
-        """List all available collections with their memory counts"""
+        Details are fetched concurrently (at most LIST_COLLECTIONS_CONCURRENCY at
+        a time) and cached for COLLECTIONS_CACHE_TTL seconds. fast_count=True
+        skips the details and uses approximate counts.
+        """
         try:
-            collections = self.client.get_collections().collections
-
-            collection_info = []
-            for coll in collections:
-                info = self.client.get_collection(coll.name)
-                collection_info.append({
-                    "name": coll.name,
-                    "count": info.points_count,
-                    "level": "global" if coll.name in ROLE_COLLECTIONS["global"].values() else "project",
-                    "role": next((k for k, v in ROLE_COLLECTIONS["global"].items() if v == coll.name), None)
-                })
-
-            return json.dumps({
+            cached = self._collections_cache.get(fast_count)
+            fresh = bool(cached) and time.monotonic() - cached[0] < COLLECTIONS_CACHE_TTL
+            METRICS.cache_lookup("collections", fresh)
+            annotate(cached=fresh)
+            if fresh:
+                return encode_response({**cached[1], "cached": True}, tool="list_collections")
+
+            collections = (await self._qdrant(self.client.get_collections)).collections
+            semaphore = asyncio.Semaphore(LIST_COLLECTIONS_CONCURRENCY)
+
+            async def describe(name: str) -> Dict[str, Any]:
+                async with semaphore:
+                    try:
+                        return await self._describe_collection(name, fast_count)
+                    except Exception as e:
+                        return {"name": name, "error": str(e)}
+
+            collection_info = await asyncio.gather(*[describe(coll.name) for coll in collections])
+            annotate(results=len(collection_info))
+
+            response = {
                 "collections": collection_info,
-                "total_collections": len(collection_info)
-            }, indent=2)
+                "total_collections": len(collection_info),
+                "total_memories": sum(c.get("count") or 0 for c in collection_info)
+            }
+            self._collections_cache[fast_count] = (time.monotonic(), response)
+            return encode_response(response, tool="list_collections")
 
         except Exception as e:
             logger.error(f"List collections error: {str(e)}")
-            return json.dumps({"error": str(e)})
+            return encode_response({"error": str(e)}, tool="list_collections")
+
+    @staticmethod
+    def _encode_cursor(offset: Any) -> Optional[str]:
+        """Wrap a Qdrant scroll offset in an opaque, URL-safe cursor"""
+        if offset is None:
+            return None
+        raw = json.dumps({"o": offset if isinstance(offset, (int, str)) else str(offset)})
+        return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+    @staticmethod
+    def _decode_cursor(cursor: Optional[str]) -> Any:
+        """Inverse of _encode_cursor; raises ValueError for malformed cursors"""
+        if not cursor:
+            return None
+        try:
+            return json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))["o"]
+        except Exception:
+            raise ValueError(f"Invalid cursor: {cursor}")
+
+    @staticmethod
+    def _build_filter(filters: Optional[Dict[str, Any]]) -> Optional["models.Filter"]:
+        """Build an AND filter from {field: value} (lists match any of the values)"""
+        if not filters:
+            return None
+        conditions = []
+        for key, value in filters.items():
+            if isinstance(value, list):
+                match = models.MatchAny(any=value)
+            else:
+                match = models.MatchValue(value=value)
+            conditions.append(models.FieldCondition(key=key, match=match))
+        return models.Filter(must=conditions)
+
+    @staticmethod
+    def _payload_selector(include: Optional[List[str]]) -> Any:
+        """Return a payload include-list selector, or True for the full payload"""
+        if include:
+            return models.PayloadSelectorInclude(include=include)
+        return True
+
+    @instrumented
+    async def scroll_memories(self, memory_level: str, role: str = None, cursor: str = None,
+                              limit: int = 50, include: List[str] = None,
+                              filters: Dict[str, Any] = None) -> str:
+        """
+        Page through a collection. Pass the returned next_cursor back in to
+        continue; next_cursor is null on the last page.
+        """
+        try:
+            collection_name = self._get_collection_name(memory_level, role)
+            annotate(collection=collection_name, limit=limit)
+
+            records, next_offset = await self.scroll_points(
+                collection_name,
+                scroll_filter=self._build_filter(filters),
+                limit=limit,
+                offset=self._decode_cursor(cursor),
+                with_payload=self._payload_selector(include),
+                with_vectors=False
+            )
+            annotate(results=len(records))
+
+            return encode_response({
+                "collection": collection_name,
+                "memories": [
+                    {"doc_id": str(record.id), "payload": record.payload}
+                    for record in records
+                ],
+                "count": len(records),
+                "next_cursor": self._encode_cursor(next_offset)
+            }, tool="scroll_memories")
+
+        except Exception as e:
+            logger.error(f"Scroll error: {str(e)}")
+            return encode_response({"error": str(e)}, tool="scroll_memories")
+
+    async def _export_to_jsonl(self, collection_name: str, out, include: List[str] = None,
+                               filters: Dict[str, Any] = None, with_vectors: bool = False,
+                               batch_size: int = 256) -> int:
+        """Stream every matching point to `out` as JSONL, one page in memory at a time"""
+        scroll_filter = self._build_filter(filters)
+        payload_selector = self._payload_selector(include)
+        offset = None
+        exported = 0
+
+        while True:
+            records, offset = await self.scroll_points(
+                collection_name,
+                scroll_filter=scroll_filter,
+                limit=batch_size,
+                offset=offset,
+                with_payload=payload_selector,
+                with_vectors=with_vectors
+            )
 
-# Initialize memory server
+            for record in records:
+                line = {"doc_id": str(record.id), "collection": collection_name, "payload": record.payload}
+                if with_vectors:
+                    line["vector"] = record.vector
+                out.write(dumps_compact(line))
+                out.write("\n")
+            exported += len(records)
+
+            if offset is None:
+                break
+
+        return exported
+
+    @staticmethod
+    def _export_path(path: str) -> str:
+        """Absolute path of an export file, which must resolve to somewhere under EXPORT_DIR"""
+        export_dir = os.path.realpath(EXPORT_DIR)
+        out_path = os.path.realpath(os.path.join(export_dir, path))
+        if os.path.commonpath([export_dir, out_path]) != export_dir or out_path == export_dir:
+            raise ValueError(f"Export path must be a file under {export_dir}")
+        return out_path
+
+    @instrumented
+    async def export_collection(self, memory_level: str, path: str, role: str = None,
+                                include: List[str] = None, filters: Dict[str, Any] = None,
+                                with_vectors: bool = False, overwrite: bool = False) -> str:
+        """
+        Export a collection (or a filtered subset) to a JSONL file under EXPORT_DIR.
+        An existing file is only replaced with overwrite=True.
+        """
+        try:
+            collection_name = self._get_collection_name(memory_level, role)
+            out_path = self._export_path(path)
+            annotate(collection=collection_name)
+
+            if not overwrite and os.path.exists(out_path):
+                raise FileExistsError(out_path)
+
+            # Stream into a temp file next to the target so a failed export leaves nothing behind
+            os.makedirs(os.path.dirname(out_path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(out_path), prefix=".export-", suffix=".tmp")
+            try:
+                with open(fd, "w", encoding="utf-8") as out:
+                    exported = await self._export_to_jsonl(collection_name, out, include, filters, with_vectors)
+                if overwrite:
+                    os.replace(tmp_path, out_path)
+                else:
+                    os.link(tmp_path, out_path)  # Fails if the file appeared meanwhile
+            finally:
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(tmp_path)
+            annotate(results=exported)
+
+            return encode_response({
+                "collection": collection_name,
+                "path": out_path,
+                "exported": exported,
+                "status": "success"
+            }, tool="export_collection")
+
+        except FileExistsError:
+            return encode_response({
+                "error": f"'{path}' already exists",
+                "suggestion": "Pass overwrite=true to replace it"
+            }, tool="export_collection")
+        except Exception as e:
+            logger.error(f"Export error: {str(e)}")
+            return encode_response({"error": str(e)}, tool="export_collection")
+
+    @instrumented
+    async def server_stats(self) -> str:
+        """Per-tool call/error counts, latency percentiles, stage breakdown, cache hit rates and payload sizes"""
+        stats = METRICS.snapshot()
+        stats["caches"].setdefault("embedding", {})["size"] = len(self._embedding_cache)
+        stats["embedding_circuit"] = self._breaker.state
+        if self.write_behind:
+            stats["write_queue"] = self.write_queue_stats()
+        return encode_response(stats, tool="server_stats")
+
+# Initialize memory server (no I/O until first use)
 memory_server = MemoryServer()
+STARTUP_TIMINGS["imports_ms"] = round((time.perf_counter() - _IMPORT_START) * 1000, 1)
 
 @server.list_tools()
 async def handle_list_tools() -> List[Tool]:
@@ -452,11 +964,135 @@ async def handle_list_tools() -> List[Tool]:
                         "type": "string",
                         "description": "Role for global memories: universal, backend, frontend, quant, devops, ml, security, mobile",
                         "default": "universal"
+                    },
+                    "response_format": {
+                        "type": "string",
+                        "enum": ["rows", "columnar"],
+                        "description": "'rows' (one object per preview) or 'columnar' (parallel arrays, smaller for large limits)",
+                        "default": "rows"
+                    },
+                    "vector": {
+                        "type": "string",
+                        "enum": ["fused", "preview", "content"],
+                        "description": "Match on title + description ('preview'), full content ('content'), or the best of both (default); single-vector collections ignore this",
+                        "default": "fused"
+                    },
+                    "diversity": {
+                        "type": "number",
+                        "description": "0-1: rerank by maximal marginal relevance so near-duplicates give way to variety (e.g. 0.3); omit for plain similarity order"
+                    },
+                    "group_by": {
+                        "type": "string",
+                        "description": "Payload field to group hits by (e.g. 'memory_type', 'role', 'tags'); returns up to group_size hits for each of `limit` groups"
+                    },
+                    "group_size": {
+                        "type": "integer",
+                        "description": "Hits per group with group_by (default: 3)",
+                        "default": 3
                     }
                 },
                 "required": ["query", "memory_level"]
             }
         ),
+        Tool(
+            name="search_memory_multi",
+            description="Search a project and global role collections in one call with one embedding. Returns ONLY previews, merged across collections by normalized score (each tagged with its collection).",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "query": {
+                        "type": "string",
+                        "description": "Search query (2-3 sentence description of what you're looking for)"
+                    },
+                    "project": {
+                        "type": "string",
+                        "description": "Project to include (e.g., 'proj-myproject'); omit for global roles only"
+                    },
+                    "roles": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Global roles to search: universal, backend, frontend, quant, devops, ml, security, mobile",
+                        "default": ["universal"]
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": "Maximum merged results to return (default: 10)",
+                        "default": 10
+                    },
+                    "project_boost": {
+                        "type": "number",
+                        "description": "Multiplier for project hits' normalized scores (default: 1.0, e.g. 1.2 to favor local lessons)",
+                        "default": 1.0
+                    },
+                    "response_format": {
+                        "type": "string",
+                        "enum": ["rows", "columnar"],
+                        "description": "'rows' (one object per preview) or 'columnar' (parallel arrays, smaller for large limits)",
+                        "default": "rows"
+                    },
+                    "vector": {
+                        "type": "string",
+                        "enum": ["fused", "preview", "content"],
+                        "description": "Match on title + description ('preview'), full content ('content'), or the best of both (default); single-vector collections ignore this",
+                        "default": "fused"
+                    }
+                },
+                "required": ["query"]
+            }
+        ),
+        Tool(
+            name="find_similar",
+            description="Find memories similar to a stored one (\"more like this\") from its stored vector: no embedding cost. Add positive/negative example ids to steer, and roles/project to search other collections. Returns ONLY previews.",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "doc_id": {
+                        "type": "string",
+                        "description": "Memory to find neighbours of"
+                    },
+                    "memory_level": {
+                        "type": "string",
+                        "description": "Level holding doc_id and the example ids: 'global' or project name (e.g., 'proj-myproject')"
+                    },
+                    "role": {
+                        "type": "string",
+                        "description": "Role of the global collection holding doc_id",
+                        "default": "universal"
+                    },
+                    "positive_ids": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "More memories (same collection as doc_id) results should resemble"
+                    },
+                    "negative_ids": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Memories (same collection as doc_id) results should differ from"
+                    },
+                    "roles": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Global roles to search (default: the collection holding doc_id)"
+                    },
+                    "project": {
+                        "type": "string",
+                        "description": "Project to search as well (e.g., 'proj-myproject')"
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": "Maximum results to return (default: 10)",
+                        "default": 10
+                    },
+                    "response_format": {
+                        "type": "string",
+                        "enum": ["rows", "columnar"],
+                        "description": "'rows' (one object per preview) or 'columnar' (parallel arrays, smaller for large limits)",
+                        "default": "rows"
+                    }
+                },
+                "required": ["doc_id", "memory_level"]
+            }
+        ),
         Tool(
             name="get_memory",
             description="Retrieve full memory content by ID. Use after search_memory to get complete details.",
@@ -502,6 +1138,76 @@ async def handle_list_tools() -> List[Tool]:
                 "required": ["doc_ids", "memory_level"]
             }
         ),
+        Tool(
+            name="retrieve_within_budget",
+            description="Search and fetch in one call: the best matches for a query, packed in rank order as full memories (or previews when a full one does not fit) until a token budget is used. Use instead of search_memory + batch_get_memories when you know how much context to spend.",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "query": {
+                        "type": "string",
+                        "description": "Search query"
+                    },
+                    "token_budget": {
+                        "type": "integer",
+                        "description": "Maximum tokens of memories to return",
+                        "minimum": 1
+                    },
+                    "memory_level": {
+                        "type": "string",
+                        "description": "Memory level: 'global' or project name"
+                    },
+                    "role": {
+                        "type": "string",
+                        "description": "Role for global memories"
+                    },
+                    "candidates": {
+                        "type": "integer",
+                        "description": "Search hits considered for packing",
+                        "default": 20
+                    },
+                    "vector": {
+                        "type": "string",
+                        "enum": ["fused", "preview", "content"],
+                        "description": "Match on title + description ('preview'), full content ('content'), or the best of both (default); single-vector collections ignore this",
+                        "default": "fused"
+                    }
+                },
+                "required": ["query", "token_budget", "memory_level"]
+            }
+        ),
+        Tool(
+            name="batch_get_memories_multi",
+            description="Retrieve memories from several collections in one call. Pass (doc_id, role/collection) pairs from mixed-role search results, or bare doc_ids to resolve them across all role collections. Results keep the requested order.",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "items": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "doc_id": {"type": "string"},
+                                "role": {"type": "string"},
+                                "collection": {"type": "string"},
+                                "memory_level": {"type": "string"}
+                            },
+                            "required": ["doc_id"]
+                        },
+                        "description": "Document IDs with their role or collection"
+                    },
+                    "doc_ids": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Document IDs to resolve across all role collections"
+                    },
+                    "memory_level": {
+                        "type": "string",
+                        "description": "Optional project to include when resolving bare doc_ids"
+                    }
+                }
+            }
+        ),
         Tool(
             name="store_memory",
             description="Store a new memory in the vector database",
@@ -573,25 +1279,170 @@ async def handle_list_tools() -> List[Tool]:
             }
         ),
         Tool(
-            name="list_collections",
-            description="List all available memory collections with counts",
+            name="scroll_memories",
+            description="Page through the memories in a collection. Returns next_cursor; pass it back to get the next page (null when done).",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "memory_level": {
+                        "type": "string",
+                        "description": "Memory level: 'global' or project name"
+                    },
+                    "role": {
+                        "type": "string",
+                        "description": "Role for global memories"
+                    },
+                    "cursor": {
+                        "type": "string",
+                        "description": "Opaque cursor from a previous page"
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": "Page size (default: 50)",
+                        "default": 50
+                    },
+                    "include": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Payload fields to return (default: all)"
+                    },
+                    "filters": {
+                        "type": "object",
+                        "description": "Exact-match payload filters, e.g. {\"memory_type\": \"episodic\"}; list values match any"
+                    }
+                },
+                "required": ["memory_level"]
+            }
+        ),
+        Tool(
+            name="export_collection",
+            description="Stream a collection (optionally filtered) to a JSONL file in the server's export directory (MEMORY_EXPORT_DIR)",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "memory_level": {
+                        "type": "string",
+                        "description": "Memory level: 'global' or project name"
+                    },
+                    "path": {
+                        "type": "string",
+                        "description": "Output .jsonl file, relative to the export directory"
+                    },
+                    "role": {
+                        "type": "string",
+                        "description": "Role for global memories"
+                    },
+                    "include": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Payload fields to export (default: all)"
+                    },
+                    "filters": {
+                        "type": "object",
+                        "description": "Exact-match payload filters"
+                    },
+                    "with_vectors": {
+                        "type": "boolean",
+                        "description": "Include embedding vectors (default: false)",
+                        "default": False
+                    },
+                    "overwrite": {
+                        "type": "boolean",
+                        "description": "Replace the file if it already exists (default: false)",
+                        "default": False
+                    }
+                },
+                "required": ["memory_level", "path"]
+            }
+        ),
+        Tool(
+            name="server_stats",
+            description="Server performance metrics: per-tool calls, errors, latency percentiles, embedding/Qdrant/serialization time, cache hit rates and response sizes",
             inputSchema={
                 "type": "object",
                 "properties": {}
             }
+        ),
+        Tool(
+            name="list_collections",
+            description="List all available memory collections with counts, vector config, quantization, segment count and indexing status",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "fast_count": {
+                        "type": "boolean",
+                        "description": "Only return approximate counts (cheaper, skips details)",
+                        "default": False
+                    }
+                }
+            }
         )
     ]
 
+# Per-session tool call slots, so one busy agent can't starve the others
+_session_slots: "weakref.WeakKeyDictionary[Any, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+
+def _slots_for_current_session() -> Optional[asyncio.Semaphore]:
+    """Semaphore for the MCP session making the current request (None outside a request)"""
+    try:
+        session = server.request_context.session
+    except LookupError:
+        return None
+    slots = _session_slots.get(session)
+    if slots is None:
+        slots = _session_slots[session] = asyncio.Semaphore(MCP_CLIENT_MAX_CONCURRENCY)
+    return slots
+
+
 @server.call_tool()
 async def handle_call_tool(name: str, arguments: Any) -> List[TextContent]:
-    """Handle tool calls"""
+    """Handle tool calls, at most MCP_CLIENT_MAX_CONCURRENCY at a time per session"""
+    try:
+        request_id = str(server.request_context.request_id)
+    except LookupError:
+        request_id = None
+    with span("handle_call_tool", request_id=request_id, trace=True, tool=name):
+        async with _slots_for_current_session() or contextlib.nullcontext():
+            return await dispatch_tool(name, arguments)
+
+
+async def dispatch_tool(name: str, arguments: Any) -> List[TextContent]:
+    """Route a tool call to the memory server"""
     try:
         if name == "search_memory":
             result = await memory_server.search_memory(
                 query=arguments["query"],
                 memory_level=arguments["memory_level"],
                 limit=arguments.get("limit", 10),
-                role=arguments.get("role", "universal")
+                role=arguments.get("role", "universal"),
+                response_format=arguments.get("response_format", "rows"),
+                vector=arguments.get("vector", "fused"),
+                diversity=arguments.get("diversity"),
+                group_by=arguments.get("group_by"),
+                group_size=arguments.get("group_size", 3)
+            )
+        elif name == "search_memory_multi":
+            result = await memory_server.search_memory_multi(
+                query=arguments["query"],
+                project=arguments.get("project"),
+                roles=arguments.get("roles"),
+                limit=arguments.get("limit", 10),
+                project_boost=arguments.get("project_boost", 1.0),
+                response_format=arguments.get("response_format", "rows"),
+                vector=arguments.get("vector", "fused")
+            )
+        elif name == "find_similar":
+            result = await memory_server.find_similar(
+                doc_id=arguments["doc_id"],
+                memory_level=arguments["memory_level"],
+                role=arguments.get("role"),
+                positive_ids=arguments.get("positive_ids"),
+                negative_ids=arguments.get("negative_ids"),
+                roles=arguments.get("roles"),
+                project=arguments.get("project"),
+                limit=arguments.get("limit", 10),
+                response_format=arguments.get("response_format", "rows")
             )
         elif name == "get_memory":
             result = await memory_server.get_memory(
@@ -605,6 +1456,21 @@ async def handle_call_tool(name: str, arguments: Any) -> List[TextContent]:
                 memory_level=arguments["memory_level"],
                 role=arguments.get("role")
             )
+        elif name == "retrieve_within_budget":
+            result = await memory_server.retrieve_within_budget(
+                query=arguments["query"],
+                token_budget=arguments["token_budget"],
+                memory_level=arguments["memory_level"],
+                role=arguments.get("role"),
+                candidates=arguments.get("candidates", 20),
+                vector=arguments.get("vector", "fused")
+            )
+        elif name == "batch_get_memories_multi":
+            result = await memory_server.batch_get_memories_multi(
+                items=arguments.get("items"),
+                doc_ids=arguments.get("doc_ids"),
+                memory_level=arguments.get("memory_level")
+            )
         elif name == "store_memory":
             result = await memory_server.store_memory(
                 document=arguments["document"],
@@ -624,35 +1490,150 @@ async def handle_call_tool(name: str, arguments: Any) -> List[TextContent]:
                 memory_level=arguments["memory_level"],
                 role=arguments.get("role")
             )
+        elif name == "scroll_memories":
+            result = await memory_server.scroll_memories(
+                memory_level=arguments["memory_level"],
+                role=arguments.get("role"),
+                cursor=arguments.get("cursor"),
+                limit=arguments.get("limit", 50),
+                include=arguments.get("include"),
+                filters=arguments.get("filters")
+            )
+        elif name == "export_collection":
+            result = await memory_server.export_collection(
+                memory_level=arguments["memory_level"],
+                path=arguments["path"],
+                role=arguments.get("role"),
+                include=arguments.get("include"),
+                filters=arguments.get("filters"),
+                with_vectors=arguments.get("with_vectors", False),
+                overwrite=arguments.get("overwrite", False)
+            )
+        elif name == "server_stats":
+            result = await memory_server.server_stats()
         elif name == "list_collections":
-            result = await memory_server.list_collections()
+            result = await memory_server.list_collections(
+                fast_count=arguments.get("fast_count", False)
+            )
         else:
-            result = json.dumps({"error": f"Unknown tool: {name}"})
+            result = encode_response({"error": f"Unknown tool: {name}"}, tool=name)
 
         return [TextContent(type="text", text=result)]
     except Exception as e:
         logger.error(f"Tool execution error: {str(e)}")
-        return [TextContent(type="text", text=json.dumps({"error": str(e)}))]
+        return [TextContent(type="text", text=encode_response({"error": str(e)}, tool=name))]
+
+def _init_options() -> InitializationOptions:
+    return InitializationOptions(
+        server_name="qdrant-memory-v2",
+        server_version="2.0.0",
+        capabilities=server.get_capabilities(
+            notification_options=NotificationOptions(),
+            experimental_capabilities={}
+        )
+    )
+
+
+def build_http_app():
+    """
+    Starlette app sharing this process (caches, pools, warm state) between
+    agent sessions: streamable HTTP at /mcp, legacy SSE at /sse.
+    """
+    from mcp.server.sse import SseServerTransport
+    from mcp.server.streamable_http_manager import StreamableHTTPSessionManager
+    from starlette.applications import Starlette
+    from starlette.responses import PlainTextResponse, Response
+    from starlette.routing import Mount, Route
+
+    session_manager = StreamableHTTPSessionManager(app=server)
+    sse = SseServerTransport("/messages/")
+
+    async def handle_sse(request):
+        async with sse.connect_sse(request.scope, request.receive, request._send) as (read_stream, write_stream):
+            await server.run(read_stream, write_stream, _init_options())
+        return Response()
+
+    async def handle_metrics(request):
+        return PlainTextResponse(METRICS.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        async with session_manager.run():
+            yield
+
+    return Starlette(
+        routes=[
+            Mount("/mcp", app=session_manager.handle_request),
+            Route("/sse", endpoint=handle_sse, methods=["GET"]),
+            Mount("/messages/", app=sse.handle_post_message),
+            Route("/metrics", endpoint=handle_metrics, methods=["GET"]),
+        ],
+        lifespan=lifespan
+    )
+
+
+async def serve_metrics(host: str, port: int):
+    """Minimal HTTP listener answering every request with the Prometheus metrics text"""
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            await reader.readuntil(b"\r\n\r\n")
+            body = METRICS.render_prometheus().encode("utf-8")
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                b"Content-Length: " + str(len(body)).encode() + b"\r\nConnection: close\r\n\r\n" + body
+            )
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    listener = await asyncio.start_server(handle, host, port)
+    logger.info(f"Prometheus metrics on http://{host}:{port}/metrics")
+    return listener
+
 
-async def main():
+async def main(transport: str = MCP_TRANSPORT, host: str = MCP_HOST, port: int = MCP_PORT):
     """Run the MCP server"""
-    logger.info("Starting Qdrant Memory MCP Server V2...")
+    logger.info(f"Starting Qdrant Memory MCP Server V2 ({transport})...")
+    warmup = asyncio.create_task(memory_server.warm_up()) if MEMORY_WARMUP else None
+    memory_server.start_write_behind()  # Drain what a previous run left queued, warm-up or not
+
+    STARTUP_TIMINGS["serving_ms"] = round((time.perf_counter() - _IMPORT_START) * 1000, 1)
+    logger.info(
+        f"Startup: imports {STARTUP_TIMINGS['imports_ms']}ms, "
+        f"serving after {STARTUP_TIMINGS['serving_ms']}ms "
+        f"(Qdrant setup {'in background' if warmup else 'deferred to first call'})"
+    )
 
     # Run server
-    async with httpx.AsyncClient() as client:
-        await server.run(
-            transport=sys.stdin.buffer,
-            write_transport=sys.stdout.buffer,
-            init_options=InitializationOptions(
-                server_name="qdrant-memory-v2",
-                server_version="2.0.0",
-                capabilities=server.get_capabilities(
-                    notification_options=NotificationOptions(),
-                    experimental_capabilities={}
-                )
-            )
-        )
+    try:
+        if transport == "stdio":
+            from mcp.server.stdio import stdio_server
+
+            if METRICS_PORT:
+                await serve_metrics(host, METRICS_PORT)
+            async with stdio_server() as (read_stream, write_stream):
+                await server.run(read_stream, write_stream, _init_options())
+        elif transport == "http":
+            import uvicorn
+
+            logger.info(f"Serving MCP on http://{host}:{port}/mcp (SSE: /sse)")
+            config = uvicorn.Config(build_http_app(), host=host, port=port, log_level="warning")
+            await uvicorn.Server(config).serve()
+        else:
+            raise ValueError(f"Unknown transport: {transport}")
+    finally:
+        if warmup:
+            warmup.cancel()
+        await memory_server.close()
+        flush_traces()
 
 if __name__ == "__main__":
-    import asyncio
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Qdrant Memory MCP Server V2")
+    parser.add_argument("--transport", choices=["stdio", "http"], default=MCP_TRANSPORT,
+                        help="stdio (default) or http to share one server between agent sessions")
+    parser.add_argument("--host", default=MCP_HOST, help="HTTP bind address")
+    parser.add_argument("--port", type=int, default=MCP_PORT, help="HTTP port")
+    args = parser.parse_args()
+    asyncio.run(main(args.transport, args.host, args.port))
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Keep Qdrant in sync with file-based memories
+Watches the skill roots (inotify/FSEvents via watchdog, or polling) and pushes only
+the memories of changed files through batched embed/upsert/delete
+"""
+
+import argparse
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set
+
+from ingest_memories import CODER_COLLECTION, MEMORY_TYPES, memory_files, parse_file, parse_files, resolve_roots
+from memory_engine import MemoryEngine, models, split_payload
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # Optional: falls back to polling file mtimes
+    Observer = None
+
+logger = logging.getLogger(__name__)
+
+
+def _digest(document: str) -> str:
+    return hashlib.sha1(document.encode("utf-8")).hexdigest()
+
+
+def _is_memory_file(path: str) -> bool:
+    return path.endswith(".md") and "README" not in os.path.basename(path)
+
+
+class MemorySync:
+    """
+    File -> point bookkeeping for a set of skill roots. Startup reconciles each
+    collection with the files; after that only changed files are reparsed, and only
+    memories whose text changed are re-embedded.
+    """
+
+    def __init__(self, engine: MemoryEngine, roots: List[Dict[str, str]], batch_size: int = 64):
+        self.engine = engine
+        self.roots = roots
+        self.batch_size = batch_size
+        self.file_ids: Dict[str, Set[str]] = {}  # Memory file -> ids of the points parsed from it
+        self.digests: Dict[str, str] = {}        # Point id -> digest of its stored document
+        self.pending: Set[str] = set()           # Changed paths not yet synced
+        self.changed = asyncio.Event()
+
+    def root_of(self, path: str) -> Optional[Dict[str, str]]:
+        """Skill root a memory file belongs to (None if it is outside every memory type directory)"""
+        for root in self.roots:
+            rel_path = os.path.relpath(path, root["root"])
+            if not rel_path.startswith("..") and rel_path.split(os.sep, 1)[0] in MEMORY_TYPES:
+                return root
+        return None
+
+    def mark(self, path: str):
+        """Queue a changed path for the next sync (runs on the event loop)"""
+        if _is_memory_file(path) and self.root_of(path) is not None:
+            self.pending.add(path)
+            self.changed.set()
+
+    async def _stored_points(self, root: Dict[str, str]) -> Dict[str, str]:
+        """
+        Id -> document digest of the points in the root's collection that came from its files.
+        Includes points written by the old migrate_memories.py (metadata nested, random ids):
+        no file maps to their ids, so the first reconcile replaces them.
+        """
+        stored = {}
+        offset = None
+        while True:
+            records, offset = await self.engine.scroll_points(
+                root["collection"],
+                scroll_filter=models.Filter(should=[
+                    models.FieldCondition(key=key, match=models.MatchValue(value=root["skill_root"]))
+                    for key in ("skill_root", "metadata.skill_root")
+                ]),
+                limit=512,
+                offset=offset,
+                with_payload=["document", "file_path", "metadata"],
+                with_vectors=False
+            )
+            for record in records:
+                document, metadata = split_payload(record.payload)
+                if metadata.get("file_path"):
+                    stored[str(record.id)] = _digest(document)
+            if offset is None:
+                return stored
+
+    async def reconcile(self, workers: Optional[int] = None) -> Dict[str, int]:
+        """Full pass: parse every file (in a process pool), write what differs, drop stale points"""
+        synced_at = datetime.now().isoformat()
+        loop = asyncio.get_running_loop()
+        totals = {"upserted": 0, "deleted": 0}
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for root in self.roots:
+                await self.engine.ensure_collection(root["collection"])
+                stored = await self._stored_points(root)
+
+                files = memory_files(root)
+                parsed = await asyncio.gather(*[
+                    loop.run_in_executor(pool, parse_files, files[offset:offset + 32], root, synced_at)
+                    for offset in range(0, len(files), 32)
+                ])
+
+                changed = []
+                for memories in parsed:
+                    for memory in memories:
+                        path = os.path.join(root["root"], memory["metadata"]["file_path"])
+                        self.file_ids.setdefault(path, set()).add(memory["doc_id"])
+                        digest = _digest(memory["document"])
+                        self.digests[memory["doc_id"]] = digest
+                        if stored.get(memory["doc_id"]) != digest:
+                            changed.append(memory)
+
+                live = {doc_id for ids in self.file_ids.values() for doc_id in ids}
+                stale = [doc_id for doc_id in stored if doc_id not in live]
+                totals["upserted"] += await self._write(root["collection"], changed)
+                totals["deleted"] += await self._delete(root["collection"], stale)
+        logger.info(f"Reconciled {len(self.roots)} roots: {totals['upserted']} upserted, {totals['deleted']} deleted")
+        return totals
+
+    async def sync_paths(self, paths: Set[str]) -> Dict[str, int]:
+        """Reparse changed (or removed) files and write only the memories that differ"""
+        synced_at = datetime.now().isoformat()
+        upserts: Dict[str, List[Dict[str, Any]]] = {}
+        deletes: Dict[str, List[str]] = {}
+        file_ids: Dict[str, Set[str]] = {}
+        for path in sorted(paths):
+            root = self.root_of(path)
+            try:
+                memories = parse_file(path, root, synced_at) if os.path.isfile(path) else []
+            except (OSError, UnicodeDecodeError) as e:
+                logger.warning(f"Skipping '{path}': {str(e)}")
+                continue
+
+            file_ids[path] = {memory["doc_id"] for memory in memories}
+            for memory in memories:
+                if self.digests.get(memory["doc_id"]) != _digest(memory["document"]):
+                    upserts.setdefault(root["collection"], []).append(memory)
+            for doc_id in self.file_ids.get(path, set()) - file_ids[path]:
+                deletes.setdefault(root["collection"], []).append(doc_id)
+
+        totals = {"upserted": 0, "deleted": 0}
+        for collection_name, memories in upserts.items():
+            totals["upserted"] += await self._write(collection_name, memories)
+        for collection_name, doc_ids in deletes.items():
+            totals["deleted"] += await self._delete(collection_name, doc_ids)
+
+        # Bookkeeping only once Qdrant has the changes, so a failed sync is retried in full
+        for path, ids in file_ids.items():
+            if ids:
+                self.file_ids[path] = ids
+            else:
+                self.file_ids.pop(path, None)
+        for memories in upserts.values():
+            for memory in memories:
+                self.digests[memory["doc_id"]] = _digest(memory["document"])
+        for doc_ids in deletes.values():
+            for doc_id in doc_ids:
+                self.digests.pop(doc_id, None)
+        logger.info(f"Synced {len(paths)} files: {totals['upserted']} upserted, {totals['deleted']} deleted")
+        return totals
+
+    async def _write(self, collection_name: str, memories: List[Dict[str, Any]]) -> int:
+        """Upsert in batches of `batch_size` (one embedding request each)"""
+        written = 0
+        for offset in range(0, len(memories), self.batch_size):
+            batch = memories[offset:offset + self.batch_size]
+            written += await self.engine.upsert_memories(
+                collection_name, [(m["doc_id"], m["document"], m["metadata"]) for m in batch]
+            )
+        return written
+
+    async def _delete(self, collection_name: str, doc_ids: List[str]) -> int:
+        if doc_ids:
+            await self.engine.delete_points(collection_name, doc_ids)
+        return len(doc_ids)
+
+    async def run(self, debounce: float = 1.0):
+        """Sync pending paths once no new change has arrived for `debounce` seconds"""
+        while True:
+            await self.changed.wait()
+            while True:
+                self.changed.clear()
+                try:
+                    await asyncio.wait_for(self.changed.wait(), timeout=debounce)
+                except asyncio.TimeoutError:
+                    break
+            paths, self.pending = self.pending, set()
+            try:
+                await self.sync_paths(paths)
+            except Exception as e:
+                # Retry these files with the next batch of changes
+                logger.error(f"Sync failed, will retry: {str(e)}")
+                self.pending |= paths
+                await asyncio.sleep(debounce)
+                self.changed.set()
+
+    def snapshot(self) -> Dict[str, tuple]:
+        """(mtime, size) of every memory file, for the polling watcher"""
+        state = {}
+        for root in self.roots:
+            for path in memory_files(root):
+                try:
+                    stat = os.stat(path)
+                    state[path] = (stat.st_mtime_ns, stat.st_size)
+                except OSError:
+                    pass
+        return state
+
+    async def poll(self, interval: float):
+        """Polling watcher: diff file snapshots every `interval` seconds"""
+        previous = await asyncio.to_thread(self.snapshot)
+        while True:
+            await asyncio.sleep(interval)
+            current = await asyncio.to_thread(self.snapshot)
+            for path in current.keys() | previous.keys():
+                if current.get(path) != previous.get(path):
+                    self.mark(path)
+            previous = current
+
+
+def start_observer(memory_sync: MemorySync, loop: asyncio.AbstractEventLoop):
+    """watchdog observer (inotify on Linux, FSEvents on macOS) feeding MemorySync.mark"""
+
+    class Handler(FileSystemEventHandler):
+        def on_any_event(self, event):
+            if event.is_directory:
+                return
+            for path in (event.src_path, getattr(event, "dest_path", "")):
+                if path:
+                    loop.call_soon_threadsafe(memory_sync.mark, os.fsdecode(path))
+
+    observer = Observer()
+    for root in memory_sync.roots:
+        if os.path.isdir(root["root"]):
+            observer.schedule(Handler(), root["root"], recursive=True)
+    observer.start()
+    return observer
+
+
+async def run(args: argparse.Namespace):
+    roots = resolve_roots(args)
+    engine = MemoryEngine()
+    memory_sync = MemorySync(engine, roots, args.batch_size)
+    observer = None
+    try:
+        start = time.perf_counter()
+        await memory_sync.reconcile(args.workers)
+        logger.info(f"Initial sync took {time.perf_counter() - start:.1f}s")
+        if args.once:
+            return
+
+        if Observer is not None and not args.poll:
+            observer = start_observer(memory_sync, asyncio.get_running_loop())
+            logger.info(f"Watching {len(roots)} skill roots for changes")
+            await memory_sync.run(args.debounce)
+        else:
+            logger.info(f"Polling {len(roots)} skill roots every {args.poll_interval}s")
+            await asyncio.gather(memory_sync.poll(args.poll_interval), memory_sync.run(args.debounce))
+    finally:
+        if observer is not None:
+            observer.stop()
+            observer.join()
+        await engine.close()
+
+
+def main():
+    """Main CLI entry point"""
+    parser = argparse.ArgumentParser(description="Sync file-based memories into Qdrant as they change")
+    parser.add_argument("roots", nargs="*",
+                        help="Skill roots to watch (default: coder-memory-store and ./.claude project skills)")
+    parser.add_argument("--projects", action="append", default=[], metavar="DIR",
+                        help="Also watch the project skills of every project under DIR (repeatable)")
+    parser.add_argument("--coder-collection", default=CODER_COLLECTION,
+                        help=f"Collection for the default coder root (default: {CODER_COLLECTION})")
+    parser.add_argument("--once", action="store_true", help="Reconcile once and exit (cron mode)")
+    parser.add_argument("--debounce", type=float, default=1.0, help="Quiet seconds before a burst is synced")
+    parser.add_argument("--poll", action="store_true", help="Poll file mtimes even if watchdog is installed")
+    parser.add_argument("--poll-interval", type=float, default=5.0, help="Seconds between polls")
+    parser.add_argument("--workers", type=int, help="Parser processes for the initial sync")
+    parser.add_argument("--batch-size", type=int, default=64, help="Memories per embedding request / upsert")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
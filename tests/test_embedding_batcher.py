@@ -0,0 +1,38 @@
+"""Embedding scheduler: single-flight and batching against the stub embeddings endpoint"""
+
+import asyncio
+
+
+def test_concurrent_identical_texts_share_one_request(make_engine, stub_embedder):
+    async def scenario():
+        engine = make_engine()
+        try:
+            vectors = await asyncio.gather(*[engine._get_embedding("same text") for _ in range(50)])
+            return vectors
+        finally:
+            await engine.close()
+
+    vectors = asyncio.run(scenario())
+
+    assert stub_embedder.requests == [["same text"]]
+    assert all(vector == vectors[0] for vector in vectors)
+
+
+def test_texts_within_the_window_are_batched(make_engine, stub_embedder):
+    async def scenario():
+        engine = make_engine()
+        try:
+            return await asyncio.gather(
+                engine._get_embeddings(["alpha", "beta"]),
+                engine._get_embedding("alpha"),
+                engine._get_embedding("gamma")
+            )
+        finally:
+            await engine.close()
+
+    pair, alpha, gamma = asyncio.run(scenario())
+
+    assert len(stub_embedder.requests) == 1
+    assert sorted(stub_embedder.requests[0]) == ["alpha", "beta", "gamma"]
+    assert pair[0] == alpha
+    assert gamma != alpha
@@ -0,0 +1,75 @@
+"""Embedding circuit breaker and keyword fallback against the stub embeddings endpoint"""
+
+import asyncio
+
+import pytest
+
+import memory_engine
+from memory_engine import CircuitBreaker, EmbeddingUnavailable
+
+
+@pytest.fixture(autouse=True)
+def no_retries(monkeypatch):
+    # Each failed call is one request: no backoff sleeps in the tests
+    monkeypatch.setattr(memory_engine, "EMBEDDING_RETRIES", 0)
+
+
+def test_breaker_opens_then_lets_one_trial_through(make_engine, stub_embedder):
+    async def scenario():
+        engine = make_engine()
+        engine._breaker = CircuitBreaker(failures=2, cooldown=0.2)
+        try:
+            stub_embedder.status = 503
+            for text in ("first", "second"):
+                with pytest.raises(EmbeddingUnavailable):
+                    await engine._get_embedding(text)
+            assert engine._breaker.state == "open"
+            assert engine.embeddings_degraded
+
+            # Open: fails fast without a request
+            with pytest.raises(EmbeddingUnavailable):
+                await engine._get_embedding("third")
+            assert len(stub_embedder.requests) == 2
+
+            await asyncio.sleep(0.25)
+            assert engine._breaker.state == "half_open"
+
+            # The trial call fails: open again for another cooldown
+            with pytest.raises(EmbeddingUnavailable):
+                await engine._get_embedding("fourth")
+            assert len(stub_embedder.requests) == 3
+            assert engine._breaker.state == "open"
+
+            await asyncio.sleep(0.25)
+            stub_embedder.status = 200
+            vector = await engine._get_embedding("fifth")
+            assert engine._breaker.state == "closed"
+            return vector
+        finally:
+            await engine.close()
+
+    assert len(asyncio.run(scenario())) == memory_engine.EMBEDDING_DIMENSION
+    assert len(stub_embedder.requests) == 4
+
+
+def test_search_falls_back_to_keywords_while_open(make_engine, stub_embedder):
+    import qdrant_client
+
+    async def scenario():
+        engine = make_engine()
+        engine._client = qdrant_client.AsyncQdrantClient(location=":memory:")
+        try:
+            await engine.ensure_collection("coder-memory")
+            await engine.upsert_memories("coder-memory", [
+                ("00000000-0000-0000-0000-000000000001", "**Title:** Retry budgets\n**Description:** backoff", {}),
+                ("00000000-0000-0000-0000-000000000002", "**Title:** CSS grids\n**Description:** layout", {})
+            ])
+            stub_embedder.status = 503
+            return await engine.search_points("coder-memory", "retry backoff", limit=5)
+        finally:
+            await engine.close()
+
+    results = asyncio.run(scenario())
+
+    assert isinstance(results, memory_engine.KeywordResults)
+    assert [str(point.id)[-1] for point in results] == ["1"]
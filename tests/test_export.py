@@ -0,0 +1,80 @@
+"""export_collection: confined to the export directory, no clobbering, no partial files"""
+
+import asyncio
+import json
+import os
+
+import pytest
+import qdrant_client
+from qdrant_client.http import models
+
+import qdrant_memory_mcp_server_v2 as server_v2
+from memory_engine import EMBEDDING_DIMENSION
+
+COLLECTION = "proj-export"
+DOC_IDS = ["00000000-0000-0000-0000-000000000001", "00000000-0000-0000-0000-000000000002"]
+
+
+@pytest.fixture
+def export_dir(tmp_path, monkeypatch):
+    export_dir = tmp_path / "exports"
+    monkeypatch.setattr(server_v2, "EXPORT_DIR", str(export_dir))
+    return export_dir
+
+
+def run_exports(*calls, patch=None):
+    """Run export_collection once per kwargs dict against a two-point collection"""
+
+    async def scenario():
+        memory_server = server_v2.MemoryServer()
+        memory_server._client = qdrant_client.AsyncQdrantClient(location=":memory:")
+        await memory_server.client.create_collection(
+            COLLECTION, vectors_config=models.VectorParams(size=EMBEDDING_DIMENSION, distance=models.Distance.COSINE)
+        )
+        await memory_server.client.upsert(COLLECTION, [
+            models.PointStruct(id=doc_id, vector=[1.0] * EMBEDDING_DIMENSION, payload={"document": doc_id})
+            for doc_id in DOC_IDS
+        ])
+        if patch is not None:
+            patch(memory_server)
+        try:
+            return [json.loads(await memory_server.export_collection(COLLECTION, **kwargs)) for kwargs in calls]
+        finally:
+            await memory_server.close()
+
+    return asyncio.run(scenario())
+
+
+def test_paths_outside_the_export_dir_are_rejected(export_dir, tmp_path):
+    results = run_exports({"path": "../escaped.jsonl"}, {"path": str(tmp_path / "absolute.jsonl")}, {"path": "."})
+
+    assert all("error" in result for result in results)
+    assert os.listdir(tmp_path) == []
+
+
+def test_existing_file_is_only_replaced_with_overwrite(export_dir):
+    export_dir.mkdir()
+    existing = export_dir / "memories.jsonl"
+    existing.write_text("keep me\n")
+
+    refused, replaced = run_exports({"path": "memories.jsonl"}, {"path": "memories.jsonl", "overwrite": True})
+
+    assert "already exists" in refused["error"]
+    assert replaced["exported"] == 2
+    assert [json.loads(line)["doc_id"] for line in existing.read_text().splitlines()] == DOC_IDS
+    assert os.listdir(export_dir) == ["memories.jsonl"]
+
+
+def test_failed_export_leaves_no_file_behind(export_dir):
+    def fail_after_first_line(memory_server):
+        async def export_to_jsonl(collection_name, out, *args):
+            out.write('{"doc_id": "partial"}\n')
+            raise RuntimeError("connection reset")
+        memory_server._export_to_jsonl = export_to_jsonl
+
+    [failed] = run_exports({"path": "nested/memories.jsonl"}, patch=fail_after_first_line)
+    assert failed["error"] == "connection reset"
+    assert os.listdir(export_dir / "nested") == []
+
+    [retried] = run_exports({"path": "nested/memories.jsonl"})
+    assert retried["exported"] == 2
@@ -0,0 +1,23 @@
+"""Latency quantiles: histogram estimates never exceed the slowest call seen"""
+
+from memory_engine import ToolMetrics
+
+
+def test_quantiles_are_capped_at_the_observed_max():
+    metrics = ToolMetrics()
+    for latency_ms in (1.2, 1.4, 1.64):
+        metrics.observe(latency_ms, {}, error=False)
+
+    # All three calls fall in the (1, 5] ms bucket, whose bound is above every one of them
+    assert [metrics.quantile(q) for q in (0.5, 0.95, 0.99)] == [1.64, 1.64, 1.64]
+
+
+def test_quantiles_use_the_bucket_bound_below_the_max():
+    metrics = ToolMetrics()
+    for latency_ms in (3.0, 4.0, 7.0, 40.0):
+        metrics.observe(latency_ms, {}, error=False)
+
+    assert metrics.quantile(0.5) == 5
+    assert metrics.quantile(0.75) == 10
+    assert metrics.quantile(0.99) == 40.0
+    assert ToolMetrics().quantile(0.5) is None
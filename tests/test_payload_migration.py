@@ -0,0 +1,63 @@
+"""Payload migration: nested points are flattened without losing their vector digests"""
+
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+from migrate_payload_schema import PayloadMigration
+
+COLLECTION = "coder-memory"
+NESTED_ID = "00000000-0000-0000-0000-000000000001"
+FLAT_ID = "00000000-0000-0000-0000-000000000002"
+
+
+def make_migration(dry_run: bool = False) -> PayloadMigration:
+    migration = PayloadMigration(batch_size=1, dry_run=dry_run)
+    migration.client = QdrantClient(location=":memory:")
+    migration.client.create_collection(
+        COLLECTION, vectors_config=models.VectorParams(size=2, distance=models.Distance.COSINE)
+    )
+    migration.client.upsert(COLLECTION, [
+        models.PointStruct(id=NESTED_ID, vector=[1.0, 0.0], payload={
+            "document": "**Title:** Nested",
+            "metadata": {"title": "Nested", "tags": ["a"]},
+            "preview_digest": "p1",
+            "content_digest": "c1"
+        }),
+        models.PointStruct(id=FLAT_ID, vector=[0.0, 1.0], payload={
+            "document": "**Title:** Flat", "title": "Flat", "content_digest": "c2"
+        })
+    ])
+    return migration
+
+
+def payloads(migration: PayloadMigration):
+    points = migration.client.retrieve(COLLECTION, [NESTED_ID, FLAT_ID], with_payload=True)
+    return {str(point.id): point.payload for point in points}
+
+
+def test_flattening_keeps_vector_digests():
+    migration = make_migration()
+
+    report = migration.run([COLLECTION], indexes=False)
+
+    assert report["points_flattened"] == 1 and not report["errors"]
+    assert payloads(migration) == {
+        NESTED_ID: {
+            "document": "**Title:** Nested",
+            "title": "Nested",
+            "tags": ["a"],
+            "preview_digest": "p1",
+            "content_digest": "c1"
+        },
+        FLAT_ID: {"document": "**Title:** Flat", "title": "Flat", "content_digest": "c2"}
+    }
+
+
+def test_dry_run_changes_nothing():
+    migration = make_migration(dry_run=True)
+    before = payloads(migration)
+
+    report = migration.run([COLLECTION], indexes=False)
+
+    assert report["collections"][COLLECTION]["flattened"] == 1
+    assert payloads(migration) == before
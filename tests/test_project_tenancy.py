@@ -0,0 +1,55 @@
+"""Shared project collection: every call stays inside the project it addresses"""
+
+import asyncio
+
+import pytest
+import qdrant_client
+
+import memory_engine
+
+A_ID = "00000000-0000-0000-0000-00000000000a"
+B_ID = "00000000-0000-0000-0000-00000000000b"
+
+
+@pytest.fixture(autouse=True)
+def shared_tenancy(monkeypatch):
+    monkeypatch.setattr(memory_engine, "PROJECT_TENANCY", "shared")
+
+
+def run(make_engine, scenario):
+    async def main():
+        engine = make_engine()
+        engine._client = qdrant_client.AsyncQdrantClient(location=":memory:")
+        try:
+            await engine.ensure_collection("proj-alpha")
+            await engine.upsert_memories("proj-alpha", [(A_ID, "**Title:** Alpha", {"title": "Alpha"})])
+            await engine.upsert_memories("proj-beta", [(B_ID, "**Title:** Beta", {"title": "Beta"})])
+            return await scenario(engine)
+        finally:
+            await engine.close()
+
+    return asyncio.run(main())
+
+
+def test_get_and_delete_cannot_reach_another_project(make_engine):
+    async def scenario(engine):
+        assert await engine.retrieve_points("proj-alpha", [B_ID]) == []
+        assert await engine.delete_points("proj-alpha", [B_ID]) == 1  # Alpha's own point is left
+        return await engine.retrieve_points("proj-beta", [B_ID])
+
+    [point] = run(make_engine, scenario)
+    assert point.payload["project"] == "beta"
+
+
+def test_project_without_points_is_not_a_collection(make_engine):
+    async def scenario(engine):
+        assert await engine.has_collection("proj-alpha")
+        assert not await engine.has_collection("proj-gamma")
+
+        # The cached tenant is dropped with its last point, and with the project itself
+        assert await engine.delete_points("proj-alpha", [A_ID]) == 0
+        assert await engine.has_collection("proj-beta")
+        await engine.delete_collection("proj-beta")
+        return [await engine.has_collection(name) for name in ("proj-alpha", "proj-beta")]
+
+    assert run(make_engine, scenario) == [False, False]
@@ -0,0 +1,61 @@
+"""File sync: points written by the old migrate_memories.py are replaced, not duplicated"""
+
+import asyncio
+import uuid
+
+import qdrant_client
+from qdrant_client.http import models
+
+from ingest_memories import describe_root
+from memory_engine import EMBEDDING_DIMENSION
+from sync_memories import MemorySync
+
+MEMORY = """# Episodic memories
+
+---
+
+**Title:** Retry flaky uploads
+**Description:** Uploads to the bucket failed under load
+
+**Content:** Retry with jitter fixed it.
+
+**Tags:** #upload #retry
+"""
+
+
+def test_reconcile_replaces_legacy_nested_points(make_engine, tmp_path):
+    skill_root = tmp_path / "coder-memory-store"
+    (skill_root / "episodic").mkdir(parents=True)
+    (skill_root / "episodic" / "uploads.md").write_text(MEMORY)
+    root = describe_root(skill_root)
+    legacy_id = str(uuid.uuid4())
+
+    async def scenario():
+        engine = make_engine()
+        engine._client = qdrant_client.AsyncQdrantClient(location=":memory:")
+        try:
+            await engine.ensure_collection(root["collection"])
+            # The layout the old cron job wrote: metadata nested, a random id per run
+            await engine.client.upsert(root["collection"], [models.PointStruct(
+                id=legacy_id,
+                vector=[1.0] * EMBEDDING_DIMENSION,
+                payload={"document": "**Title:** Retry flaky uploads", "metadata": {
+                    "file_path": "episodic/uploads.md", "skill_root": "coder-memory-store"
+                }}
+            )])
+
+            memory_sync = MemorySync(engine, [root])
+            first = await memory_sync.reconcile(workers=1)
+            second = await memory_sync.reconcile(workers=1)
+            records, _ = await engine.scroll_points(root["collection"], limit=10, with_payload=True)
+            return first, second, records
+        finally:
+            await engine.close()
+
+    first, second, records = asyncio.run(scenario())
+
+    assert first == {"upserted": 1, "deleted": 1}
+    assert second == {"upserted": 0, "deleted": 0}
+    [record] = records
+    assert str(record.id) != legacy_id
+    assert record.payload["skill_root"] == "coder-memory-store" and "metadata" not in record.payload
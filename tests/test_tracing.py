@@ -0,0 +1,109 @@
+"""Request tracing: span trees of tool calls, slow/failed call logs and OpenTelemetry replay"""
+
+import asyncio
+import logging
+
+import pytest
+
+import memory_engine
+from memory_engine import METRICS, annotate, encode_response, instrumented, span
+
+
+@instrumented
+async def trace_probe(fail: bool = False):
+    annotate(collection="coder-memory")
+    with span("embed", stage="embedding"):
+        await asyncio.sleep(0.01)
+    with span("search", stage="qdrant_search", limit=5):
+        with span("qdrant.query_points", stage="qdrant_search"):
+            pass
+    if fail:
+        return encode_response("Error: Document ID 'x' not found", tool="trace_probe", error=True)
+    return encode_response({"results": []}, tool="trace_probe")
+
+
+@pytest.fixture
+def traces(monkeypatch):
+    """Root spans handed to the exporter, in order"""
+    roots = []
+    monkeypatch.setitem(memory_engine._otel_state, "tracer", object())
+    monkeypatch.setattr(memory_engine, "_export_otel", lambda tracer, root: roots.append(root))
+    return roots
+
+
+def test_tool_call_builds_a_span_tree(traces, monkeypatch):
+    monkeypatch.setattr(memory_engine, "SLOW_CALL_MS", float("inf"))
+    before = METRICS.tool("trace_probe").calls
+
+    asyncio.run(trace_probe())
+
+    [root] = traces
+    assert root.name == "trace_probe"
+    assert root.attrs == {"collection": "coder-memory"}
+    assert [child.name for child in root.children] == ["embed", "search", "format"]
+    search = root.children[1]
+    assert search.attrs == {"limit": 5}
+    assert [child.name for child in search.children] == ["qdrant.query_points"]
+    assert {s.request_id for s in (root, search, search.children[0])} == {root.request_id}
+    assert root.children[2].attrs["bytes"] == len('{"results":[]}')
+    assert not root.failed and root.error is None
+
+    metrics = METRICS.tool("trace_probe")
+    assert metrics.calls == before + 1
+    assert metrics.stage_ms["embedding"] >= 10
+
+
+def test_failed_call_is_flagged_and_logged(traces, monkeypatch, caplog):
+    monkeypatch.setattr(memory_engine, "SLOW_CALL_MS", float("inf"))
+    errors = METRICS.tool("trace_probe").errors
+
+    with caplog.at_level(logging.WARNING, logger=memory_engine.logger.name):
+        asyncio.run(trace_probe(fail=True))
+
+    [root] = traces
+    assert root.failed
+    assert root.error == "Error: Document ID 'x' not found"
+    assert METRICS.tool("trace_probe").errors == errors + 1
+    [record] = [r for r in caplog.records if "Failed call" in r.getMessage()]
+    tree = record.getMessage().splitlines()
+    assert tree[0] == f"Failed call [{root.request_id}]:"
+    assert tree[1].lstrip().startswith("trace_probe ") and "error=" in tree[1]
+    assert tree[2].startswith("    embed ")
+
+
+def test_slow_call_is_logged(traces, monkeypatch, caplog):
+    monkeypatch.setattr(memory_engine, "SLOW_CALL_MS", 0.0)
+
+    with caplog.at_level(logging.WARNING, logger=memory_engine.logger.name):
+        asyncio.run(trace_probe())
+
+    assert any("Slow call" in r.getMessage() for r in caplog.records)
+
+
+def test_trace_is_replayed_into_opentelemetry(monkeypatch):
+    pytest.importorskip("opentelemetry.sdk")
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+    from opentelemetry.trace import StatusCode
+
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    monkeypatch.setitem(memory_engine._otel_state, "tracer", provider.get_tracer("test"))
+    monkeypatch.setattr(memory_engine, "SLOW_CALL_MS", float("inf"))
+
+    asyncio.run(trace_probe(fail=True))
+
+    spans = {s.name: s for s in exporter.get_finished_spans()}
+    assert set(spans) == {"trace_probe", "embed", "search", "qdrant.query_points", "format"}
+    root = spans["trace_probe"]
+    assert root.parent is None
+    assert spans["embed"].parent.span_id == root.context.span_id
+    assert spans["qdrant.query_points"].parent.span_id == spans["search"].context.span_id
+    assert {s.context.trace_id for s in spans.values()} == {root.context.trace_id}
+    assert root.attributes["collection"] == "coder-memory"
+    assert spans["search"].attributes["limit"] == 5
+    assert root.status.status_code == StatusCode.ERROR
+    assert spans["embed"].start_time >= root.start_time
+    assert spans["embed"].end_time - spans["embed"].start_time >= 10_000_000
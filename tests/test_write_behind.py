@@ -0,0 +1,152 @@
+"""Write-behind log: entries survive a restart and are drained without a new store"""
+
+import asyncio
+
+import qdrant_client
+from qdrant_client.http import models
+
+from memory_engine import EMBEDDING_DIMENSION
+
+DOC_ID = "00000000-0000-0000-0000-000000000042"
+DOCUMENT = "**Title:** Queued memory\n**Description:** written after a restart"
+
+
+async def wait_for_drain(engine, timeout: float = 5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while engine.write_queue_depth:
+        assert asyncio.get_running_loop().time() < deadline, "write-behind queue not drained"
+        await asyncio.sleep(0.05)
+
+
+def test_queued_memory_survives_restart_and_drains(make_engine, stub_embedder, tmp_path):
+    wal_path = str(tmp_path / "write-behind.db")
+    qdrant_path = str(tmp_path / "qdrant")
+
+    async def first_run():
+        # The embeddings endpoint never answers: the process stops with the memory in flight
+        stub_embedder.hold = asyncio.Event()
+        engine = make_engine()
+        engine._client = qdrant_client.AsyncQdrantClient(path=qdrant_path)
+        engine.enable_write_behind(wal_path)
+        await engine.enqueue_memory("coder-memory", DOCUMENT, {"title": "Queued memory"}, doc_id=DOC_ID)
+        while not stub_embedder.requests:
+            await asyncio.sleep(0.01)
+        await engine.close()
+
+    async def second_run():
+        stub_embedder.hold = None
+        engine = make_engine()
+        engine._client = qdrant_client.AsyncQdrantClient(path=qdrant_path)
+        engine.enable_write_behind(wal_path)
+        try:
+            assert engine.write_queue_depth == 1
+            # Any call that connects starts the worker: no store_memory or warm-up needed
+            await engine.has_collection("coder-memory")
+            await wait_for_drain(engine)
+            return await engine.retrieve_points("coder-memory", [DOC_ID])
+        finally:
+            await engine.close()
+
+    asyncio.run(first_run())
+    points = asyncio.run(second_run())
+
+    assert [point.payload["document"] for point in points] == [DOCUMENT]
+
+
+def test_delete_and_update_of_queued_memories(make_engine, stub_embedder, tmp_path):
+    deleted_id = "00000000-0000-0000-0000-000000000043"
+
+    async def scenario():
+        engine = make_engine()
+        engine._client = qdrant_client.AsyncQdrantClient(location=":memory:")
+        engine.enable_write_behind(str(tmp_path / "write-behind.db"))
+        try:
+            # Straight to the client and the log: nothing has started the worker yet
+            await engine.client.create_collection(
+                "coder-memory",
+                vectors_config=models.VectorParams(size=EMBEDDING_DIMENSION, distance=models.Distance.COSINE)
+            )
+            engine._wal.append(DOC_ID, "coder-memory", DOCUMENT, {})
+            engine._wal.append(deleted_id, "coder-memory", "**Title:** Doomed", {})
+
+            assert await engine.update_queued("coder-memory", DOC_ID, "**Title:** Updated", {})
+            await engine.delete_points("coder-memory", [deleted_id])  # Connecting starts the worker
+            await wait_for_drain(engine)
+            return await engine.retrieve_points("coder-memory", [DOC_ID, deleted_id])
+        finally:
+            await engine.close()
+
+    points = asyncio.run(scenario())
+
+    assert [(str(point.id), point.payload["document"]) for point in points] == [(DOC_ID, "**Title:** Updated")]
+    assert stub_embedder.requests == [["**Title:** Updated"]]
+
+
+def test_deletes_and_updates_do_not_wait_for_a_hung_embedder(make_engine, stub_embedder, tmp_path):
+    other_id = "00000000-0000-0000-0000-000000000044"
+
+    async def scenario():
+        stub_embedder.hold = asyncio.Event()
+        engine = make_engine()
+        engine._client = qdrant_client.AsyncQdrantClient(location=":memory:")
+        engine.enable_write_behind(str(tmp_path / "write-behind.db"))
+        try:
+            await engine.client.create_collection(
+                "coder-memory",
+                vectors_config=models.VectorParams(size=EMBEDDING_DIMENSION, distance=models.Distance.COSINE)
+            )
+            await engine.client.upsert("coder-memory", [
+                models.PointStruct(id=other_id, vector=[1.0] * EMBEDDING_DIMENSION, payload={"document": "x"})
+            ])
+            await engine.enqueue_memory("coder-memory", DOCUMENT, {}, doc_id=DOC_ID)
+            while not stub_embedder.requests:
+                await asyncio.sleep(0.01)
+
+            # The worker is stuck embedding: neither call may queue up behind it
+            await asyncio.wait_for(engine.delete_points("coder-memory", [other_id]), timeout=1)
+            assert await asyncio.wait_for(
+                engine.update_queued("coder-memory", DOC_ID, "**Title:** Updated", {}), timeout=1
+            )
+
+            stub_embedder.hold.set()
+            await wait_for_drain(engine)
+            return await engine.retrieve_points("coder-memory", [DOC_ID, other_id])
+        finally:
+            await engine.close()
+
+    points = asyncio.run(scenario())
+
+    # The write of the old text finished after the update, so the updated text was written after it
+    assert [(str(point.id), point.payload["document"]) for point in points] == [(DOC_ID, "**Title:** Updated")]
+
+
+def test_delete_during_the_upsert_is_not_undone(make_engine, stub_embedder, tmp_path):
+    async def scenario():
+        engine = make_engine()
+        engine._client = qdrant_client.AsyncQdrantClient(location=":memory:")
+        engine.enable_write_behind(str(tmp_path / "write-behind.db"))
+        await engine._ensure_ready()
+        await engine.ensure_collection("coder-memory")
+
+        # Hold the worker's upsert until the delete has run
+        upsert_started, release = asyncio.Event(), asyncio.Event()
+        original_upsert = engine.client.upsert
+
+        async def upsert(*args, **kwargs):
+            upsert_started.set()
+            await release.wait()
+            return await original_upsert(*args, **kwargs)
+
+        engine.client.upsert = upsert
+        try:
+            await engine.enqueue_memory("coder-memory", DOCUMENT, {}, doc_id=DOC_ID)
+            await upsert_started.wait()
+            await engine.delete_points("coder-memory", [DOC_ID])
+            release.set()
+            await wait_for_drain(engine)
+            await asyncio.sleep(0.2)  # The worker deletes the point again right after draining
+            return await engine.retrieve_points("coder-memory", [DOC_ID])
+        finally:
+            await engine.close()
+
+    assert asyncio.run(scenario()) == []